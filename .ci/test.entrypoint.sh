@@ -4,5 +4,21 @@
 && python3 -m unittest \
     tests.test_ssh_executor \
     tests.test_telnet_executor \
-    tests.test_local_executor
+    tests.test_local_executor \
+    tests.test_pool \
+    tests.test_fanout \
+    tests.test_telnet_protocol \
+    tests.test_aio \
+    tests.test_capture \
+    tests.test_benchmarks \
+    tests.test_instrumentation \
+    tests.test_agent \
+    tests.test_registry \
+    tests.test_cache \
+    tests.test_playbook \
+    tests.test_deadline \
+    tests.test_shard \
+    tests.test_staging \
+    tests.test_aggregate \
+    tests.test_formats
 
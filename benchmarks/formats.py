@@ -0,0 +1,123 @@
+"""Measures writers of the CLI result formats
+
+    $ python3 -m benchmarks.formats --output-size 100 --output-size 10000000
+
+Every format writes the same results, as executors return them, to
+/dev/null. Reports results/sec, output bytes/sec and CPU time per result
+for every format and output size. Formats, which need missing packages, are
+skipped.
+"""
+import os
+import time
+
+import click
+import simplejson
+
+from executors.base import CommandResult
+from executors.formats import FORMATS, new_writer
+
+# Typical line of the fleet sweep output
+LINE = b'Linux web-042 5.15.0-91-generic #101-Ubuntu SMP x86_64 GNU/Linux\n'
+
+
+def make_result(output_size):
+    """:return: CommandResult with stdout of `output_size` bytes"""
+    stdout = (LINE * (output_size // len(LINE) + 1))[:output_size]
+    return CommandResult(0, stdout, b'', 'utf-8')
+
+
+def measure(name, output_size, count, stream):
+    """Writes `count` results of the format
+
+    Results are created before the measurement, but not decoded, as
+    executors return them.
+
+    :return: dict with the measurements, None if the format is unavailable
+    """
+    try:
+        writer = new_writer(name, stream)
+    except ValueError:
+        return None
+
+    results = [make_result(output_size) for _ in range(count)]
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    for result in results:
+        writer.write_result(result, host='web-042', user='admin')
+    total_time = time.perf_counter() - started
+    cpu_time = time.process_time() - cpu_started
+
+    return {
+        'format': name,
+        'output_size': output_size,
+        'results_per_sec': count / total_time,
+        'bytes_per_sec': count * output_size / total_time,
+        'cpu_per_result': cpu_time / count,
+    }
+
+
+def run(output_sizes, total_bytes, max_count):
+    """Measures every format for every output size
+
+    Each measurement writes about `total_bytes` of outputs, at most
+    `max_count` results.
+
+    :return: list of dicts, see measure
+    """
+    measurements = []
+    with open(os.devnull, 'wb') as stream:
+        for output_size in output_sizes:
+            count = max(1, min(max_count, total_bytes // max(output_size, 1)))
+            for name in FORMATS:
+                result = measure(name, output_size, count, stream)
+                if result is not None:
+                    measurements.append(result)
+    return measurements
+
+
+def format_table(measurements):
+    """:return: text table of the measurements"""
+    columns = ('format', 'output_size', 'results_per_sec', 'bytes_per_sec',
+               'cpu_per_result')
+    rows = [list(columns)]
+    for measurement in measurements:
+        rows.append([
+            measurement['format'],
+            str(measurement['output_size']),
+            f'{measurement["results_per_sec"]:.0f}',
+            f'{measurement["bytes_per_sec"]:.0f}',
+            f'{measurement["cpu_per_result"] * 1000:.3f}ms',
+        ])
+
+    widths = [max(len(row[index]) for row in rows)
+              for index in range(len(columns))]
+    return '\n'.join(
+        '  '.join(cell.rjust(width) for cell, width in zip(row, widths))
+        for row in rows
+    )
+
+
+@click.command()
+@click.option('--output-size', 'output_sizes', type=click.INT, multiple=True,
+              help='Output size in bytes, may be repeated  '
+                   '[default: 100, 1000000]')
+@click.option('--total-bytes', type=click.INT, default=200 * 2 ** 20,
+              show_default=True,
+              help='Bytes of outputs written per format and output size')
+@click.option('--max-count', type=click.INT, default=100000,
+              show_default=True,
+              help='Max results written per format and output size')
+@click.option('--json', 'as_json', is_flag=True,
+              help='Print results as JSON, to compare runs')
+def main(output_sizes, total_bytes, max_count, as_json):
+    """ Benchmarks result formats of the CLI """
+    measurements = run(output_sizes or (100, 1000000), total_bytes,
+                       max_count)
+    if as_json:
+        click.echo(simplejson.dumps(measurements, indent=2))
+    else:
+        click.echo(format_table(measurements))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""Measures executors against local stand-in servers
+
+    $ python3 -m benchmarks.run --latency 0.002 --output-size 100 --output-size 1000000
+
+Reports connect latency, command latency percentiles, commands/sec and
+bytes/sec for every executor and output size.
+"""
+import time
+
+import click
+import simplejson
+
+from benchmarks.servers import SSHStandInServer, TelnetStandInServer
+from executors.local import LocalExecutor
+from executors.ssh import SSHExecutor
+from executors.telnet import TelnetExecutor
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """:return: value below which `percent` of sorted `values` fall"""
+    if not values:
+        return None
+    index = round(percent / 100 * (len(values) - 1))
+    return values[index]
+
+
+def summarize(latencies, total_time, total_bytes):
+    """Aggregates measured command latencies
+
+    :latencies:   list of seconds taken by each command
+    :total_time:  seconds taken by all commands together
+    :total_bytes: size of all outputs received
+    :return: dict of statistics
+    """
+    latencies = sorted(latencies)
+    summary = {
+        f'p{percent}': percentile(latencies, percent)
+        for percent in PERCENTILES
+    }
+    summary['max'] = latencies[-1] if latencies else None
+    summary['commands_per_sec'] = len(latencies) / total_time
+    summary['bytes_per_sec'] = total_bytes / total_time
+    return summary
+
+
+def measure_connect(connect, disconnect, repeat):
+    """:return: list of seconds taken by each of `repeat` connects"""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        session = connect()
+        latencies.append(time.perf_counter() - started)
+        disconnect(session)
+    return latencies
+
+
+def measure_commands(execute, command, repeat):
+    """Executes command `repeat` times one after another
+
+    :return: see summarize
+    """
+    latencies = []
+    total_bytes = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        command_started = time.perf_counter()
+        _, stdout, stderr = execute(command)
+        latencies.append(time.perf_counter() - command_started)
+        total_bytes += len(stdout) + len(stderr)
+
+    return summarize(latencies, time.perf_counter() - started, total_bytes)
+
+
+def ssh_session(server):
+    executor = SSHExecutor('127.0.0.1', port=server.port, user=server.user,
+                           password=server.password)
+    executor.connect()
+    return executor
+
+
+def telnet_session(server):
+    return TelnetExecutor('127.0.0.1', server.user, server.password,
+                          port=server.port,
+                          prompt=lambda: server.prompt.replace('$', '\\$'))
+
+
+def run(latency, output_sizes, repeat, connects):
+    """Runs all benchmarks
+
+    :return: list of dicts, one per executor and output size
+    """
+    results = []
+
+    def record(executor, output_size, execute, connect=None):
+        command = f'head -c {output_size} /dev/zero'
+        result = {'executor': executor, 'output_size': output_size}
+        if connect is not None:
+            connect_latencies = sorted(measure_connect(*connect, connects))
+            result['connect_p50'] = percentile(connect_latencies, 50)
+            result['connect_max'] = connect_latencies[-1]
+        result.update(measure_commands(execute, command, repeat))
+        results.append(result)
+
+    local = LocalExecutor()
+    for size in output_sizes:
+        record('local', size,
+               lambda command: local.execute('sh', ('-c', command)))
+
+    with SSHStandInServer(latency) as server:
+        executor = ssh_session(server)
+        try:
+            for size in output_sizes:
+                record('ssh', size, executor.execute,
+                       (lambda: ssh_session(server),
+                        lambda session: session.disconnect()))
+        finally:
+            executor.disconnect()
+
+    with TelnetStandInServer(latency) as server:
+        executor = telnet_session(server)
+        try:
+            for size in output_sizes:
+                record('telnet', size, executor.execute,
+                       (lambda: telnet_session(server),
+                        lambda session: session.close()))
+        finally:
+            executor.close()
+
+    return results
+
+
+def format_table(results):
+    """:return: human readable table of results, times in milliseconds"""
+    columns = ['executor', 'output_size', 'connect_p50',
+               *(f'p{percent}' for percent in PERCENTILES), 'max',
+               'commands_per_sec', 'bytes_per_sec']
+    rows = [columns]
+    for result in results:
+        row = []
+        for column in columns:
+            value = result.get(column)
+            if value is None:
+                row.append('-')
+            elif column in ('executor', 'output_size'):
+                row.append(str(value))
+            elif column.endswith('_sec'):
+                row.append(f'{value:.0f}')
+            else:
+                row.append(f'{value * 1000:.2f}ms')
+        rows.append(row)
+
+    widths = [max(len(row[index]) for row in rows)
+              for index in range(len(columns))]
+    return '\n'.join(
+        '  '.join(cell.rjust(width) for cell, width in zip(row, widths))
+        for row in rows
+    )
+
+
+@click.command()
+@click.option('--latency', type=click.FLOAT, default=0, show_default=True,
+              help='Seconds servers sleep before each write')
+@click.option('--output-size', 'output_sizes', type=click.INT, multiple=True,
+              help='Output size in bytes, may be repeated  [default: 100]')
+@click.option('--repeat', type=click.INT, default=100, show_default=True,
+              help='Commands executed per executor and output size')
+@click.option('--connects', type=click.INT, default=10, show_default=True,
+              help='Connections opened to measure connect latency')
+@click.option('--json', 'as_json', is_flag=True,
+              help='Print results as JSON, to compare runs')
+def main(latency, output_sizes, repeat, connects, as_json):
+    """ Benchmarks executors against local stand-in servers """
+    results = run(latency, output_sizes or (100,), repeat, connects)
+    if as_json:
+        click.echo(simplejson.dumps(results, indent=2))
+    else:
+        click.echo(format_table(results))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
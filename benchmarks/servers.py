@@ -0,0 +1,213 @@
+import socket
+import subprocess
+import threading
+import time
+
+import paramiko
+
+
+class StandInServer:
+    """Base of the servers, which stand in for sshd and telnetd in benchmarks
+
+    Listens on the loopback in a background thread and serves every client in
+    its own thread. Commands are run by the local `sh`, so benchmarks need no
+    docker image. `latency` seconds are slept before each write to the
+    client, which emulates the network round trip.
+
+        with SSHStandInServer(latency=0.005) as server:
+            executor = SSHExecutor('127.0.0.1', port=server.port, ...)
+    """
+    USER = 'bench'
+    PASSWORD = 'bench'
+
+    def __init__(self, latency=0, user=USER, password=PASSWORD):
+        self.latency = latency
+        self.user = user
+        self.password = password
+
+        self.port = None
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        self._sock = socket.socket()
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(128)
+        self.port = self._sock.getsockname()[1]
+
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._sock is None:
+            return
+        self._sock.close()
+        self._sock = None
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                # Listening socket is closed by `stop`
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._handle, args=(client,),
+                             daemon=True).start()
+
+    def _handle(self, client):
+        raise NotImplementedError
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+
+class SSHStandInServer(StandInServer):
+    """paramiko based ssh server with password auth and `exec` channels"""
+    # Max size of the single chunk of output sent to the channel
+    CHUNK_SIZE = 32768
+
+    _host_key = None
+
+    def _handle(self, client):
+        cls = type(self)
+        if cls._host_key is None:
+            # Key generation is slow, one is enough for all servers
+            cls._host_key = paramiko.RSAKey.generate(2048)
+
+        transport = paramiko.Transport(_DelayedSocket(client, self._delay))
+        transport.add_server_key(cls._host_key)
+        try:
+            transport.start_server(server=_SSHInterface(self))
+        except (paramiko.SSHException, EOFError):
+            transport.close()
+
+    def _run(self, channel, command):
+        """Runs command, sends its outputs and exit status to the channel"""
+        process = subprocess.Popen(command, shell=True,
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+
+        def pump(pipe, send):
+            for chunk in iter(lambda: pipe.read1(self.CHUNK_SIZE), b''):
+                send(chunk)
+
+        try:
+            stderr = threading.Thread(
+                target=pump, args=(process.stderr, channel.sendall_stderr))
+            stderr.start()
+            pump(process.stdout, channel.sendall)
+            stderr.join()
+            channel.send_exit_status(process.wait())
+            channel.close()
+        except (OSError, EOFError, paramiko.SSHException):
+            # Client has gone, e.g. closed the channel on the byte limit
+            process.kill()
+            process.wait()
+
+
+class _SSHInterface(paramiko.ServerInterface):
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self.server.user, self.server.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server._run,
+                         args=(channel, command.decode()),
+                         daemon=True).start()
+        return True
+
+
+class _DelayedSocket:
+    """Socket, which calls `delay` before each send"""
+
+    def __init__(self, sock, delay):
+        self._sock = sock
+        self._delay = delay
+
+    def send(self, data):
+        self._delay()
+        return self._sock.send(data)
+
+    def sendall(self, data):
+        self._delay()
+        return self._sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class TelnetStandInServer(StandInServer):
+    """Emulates login(1) and a shell over plain telnet
+
+    Each received line is run by its own `sh -c`, so shell state is not kept
+    between commands, which is enough for the sentinel framing. Outputs are
+    sent as is, like the terminal after `stty -echo -onlcr`, and nothing is
+    echoed back.
+    """
+
+    @property
+    def prompt(self):
+        return f'{self.user}@bench:~$ '
+
+    def _handle(self, client):
+        reader = client.makefile('rb')
+        try:
+            self._send(client, b'login: ')
+            user = self._read_line(reader)
+            self._send(client, b'Password: ')
+            password = self._read_line(reader)
+            if (user, password) != (self.user, self.password):
+                self._send(client, b'\r\nLogin incorrect\r\n')
+                return
+
+            self._send(client, b'\r\n' + self.prompt.encode())
+            while True:
+                command = self._read_line(reader)
+                if command is None:
+                    return
+
+                result = subprocess.run(command, shell=True,
+                                        stdin=subprocess.DEVNULL,
+                                        capture_output=True)
+                self._send(client, result.stdout + result.stderr
+                           + self.prompt.encode())
+        except OSError:
+            pass
+        finally:
+            reader.close()
+            client.close()
+
+    def _read_line(self, reader):
+        """:return: next line without line break, None on EOF"""
+        line = reader.readline()
+        if not line:
+            return None
+        return line.rstrip(b'\r\n').decode()
+
+    def _send(self, client, data):
+        self._delay()
+        # Data byte 255 is doubled not to be taken for IAC
+        client.sendall(data.replace(b'\xff', b'\xff\xff'))
\ No newline at end of file
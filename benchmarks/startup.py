@@ -0,0 +1,113 @@
+"""Measures CLI startup time and what is imported by each subcommand
+
+    $ python3 -m benchmarks.startup --max-ms 150
+
+Every scenario is run with `python -X importtime`, wall time is measured
+outside. Exits with non-zero status, if any scenario is slower than
+`--max-ms` or imports a module it must not, so it can guard CI against
+regressions.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    'main.py')
+
+# CLI arguments -> top level modules, which must not be imported by them
+SCENARIOS = {
+    ('--help',): ('paramiko', 'cryptography', 'executors.ssh',
+                  'executors.telnet', 'executors.agent'),
+    ('local', 'true'): ('paramiko', 'cryptography', 'executors.ssh',
+                        'executors.telnet'),
+}
+
+
+def parse_importtime(output):
+    """Parses `-X importtime` report
+
+    :output: stderr of the process
+    :return: dict, module name -> (cumulative import time in microseconds,
+             nesting level, 0 for modules imported by the script itself)
+    """
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            # Header of the report
+            continue
+        # Name is prefixed with one space and two more per nesting level
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = int(cumulative), level
+    return times
+
+
+def measure(arguments, repeat):
+    """Runs CLI with given arguments `repeat` times
+
+    :return: dict with median wall time in seconds and import times of the
+             last run, see parse_importtime
+    """
+    wall_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', MAIN, *arguments],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        wall_times.append(time.perf_counter() - started)
+
+    imports = parse_importtime(process.stderr)
+    return {'wall_time': statistics.median(wall_times), 'imports': imports}
+
+
+def check(arguments, result, forbidden, max_ms=None):
+    """:return: list of problems found in the measured scenario"""
+    problems = [
+        f'{" ".join(arguments)}: imports {module}'
+        for module in forbidden if module in result['imports']
+    ]
+    wall_ms = result['wall_time'] * 1000
+    if max_ms is not None and wall_ms > max_ms:
+        problems.append(f'{" ".join(arguments)}: takes {wall_ms:.0f}ms, '
+                        f'limit is {max_ms:.0f}ms')
+    return problems
+
+
+@click.command()
+@click.option('--repeat', type=click.INT, default=5, show_default=True,
+              help='Runs per scenario, median wall time is reported')
+@click.option('--top', type=click.INT, default=5, show_default=True,
+              help='Number of the slowest top level imports to print')
+@click.option('--max-ms', type=click.FLOAT,
+              help='Fail, if any scenario takes longer')
+def main(repeat, top, max_ms):
+    """ Benchmarks CLI startup """
+    problems = []
+    for arguments, forbidden in SCENARIOS.items():
+        result = measure(arguments, repeat)
+        slowest = sorted(
+            ((cumulative, name) for name, (cumulative, level)
+             in result['imports'].items() if level == 0),
+            reverse=True,
+        )[:top]
+
+        click.echo(f'main.py {" ".join(arguments)}: '
+                   f'{result["wall_time"] * 1000:.0f}ms')
+        for cumulative, name in slowest:
+            click.echo(f'  {cumulative / 1000:8.1f}ms  {name}')
+        problems += check(arguments, result, forbidden, max_ms)
+
+    for problem in problems:
+        click.echo(f'FAIL {problem}', err=True)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""Long-lived agent, which keeps connections warm between processes
+
+Similar in spirit to OpenSSH ControlMaster: the agent holds authenticated ssh
+connections and logged in telnet sessions in its pools and executes commands
+sent by clients over the Unix domain socket, so short-lived processes, e.g.
+CLI calls from cron, skip the connection and login.
+
+Requests and responses are JSON objects, one per line:
+
+    {"op": "execute", "transport": "ssh", "host": "10.0.0.1", "user": "admin",
+     "password": "...", "command": "uptime", "parameters": []}
+    {"code": 0, "stdout": "<base64>", "stderr": "", "encoding": "utf-8"}
+
+Outputs are sent as received, base64 encoded, with their encoding, so the
+agent doesn't decode them, binary ones included, clients get CommandResult.
+Failed request gets `{"error": "<exception type>: <message>"}`. Hosts,
+which failed several times in a row, are not tried for a while, requests
+to them fail right away with CircuitOpenError.
+
+Requests carry credentials, so both the agent and its clients refuse the
+socket directory, unless it is a real directory of the current user with
+0700 mode, and clients check that the agent runs as the same user, before
+sending anything.
+"""
+import base64
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import threading
+
+from executors.base import CommandResult, raw_result
+from executors.deadline import CircuitBreaker
+from executors.pool import SSHConnectionPool, TelnetSessionPool
+
+SOCKET_ENV = 'MCDUCK_AGENT_SOCKET'
+
+OP_EXECUTE = 'execute'
+OP_PING = 'ping'
+OP_STATS = 'stats'
+OP_STOP = 'stop'
+
+
+def default_socket_path():
+    """:return: socket path from the environment or in the private dir,
+    in the user's runtime directory, if there is one"""
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'mcduck', 'agent.sock')
+    return os.path.join(tempfile.gettempdir(), f'mcduck-{os.getuid()}',
+                        'agent.sock')
+
+
+def check_socket_directory(directory):
+    """Raises ValueError, unless the directory is safe to keep the socket
+
+    Directory in the shared place, e.g. /tmp, may be created by other user
+    first, to receive the credentials sent to the agent.
+    """
+    info = os.lstat(directory)
+    if stat.S_ISLNK(info.st_mode) or not stat.S_ISDIR(info.st_mode):
+        raise ValueError(f'Agent directory {directory} is not a directory')
+    if info.st_uid != os.getuid():
+        raise ValueError(f'Agent directory {directory} is owned by other '
+                         f'user')
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        raise ValueError(f'Agent directory {directory} must have 0700 mode, '
+                         f'not {stat.S_IMODE(info.st_mode):04o}')
+
+
+class AgentServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    """Serves clients, each connection in its own thread
+
+    Socket is created in the directory accessible by the owner only, as
+    requests carry credentials.
+
+        server = AgentServer()
+        server.serve_forever()
+    """
+    daemon_threads = True
+    # Seconds between checks for idle connections
+    EVICT_INTERVAL = 30
+
+    def __init__(self, socket_path=None, ssh_pool=None, telnet_pool=None,
+                 breaker=None):
+        """
+        :socket_path: - path of the Unix socket, see default_socket_path
+        :ssh_pool:    - SSHConnectionPool, new one if not set
+        :telnet_pool: - TelnetSessionPool, new one if not set
+        :breaker:     - CircuitBreaker, keyed by transport, host and port,
+                        new one if not set
+        """
+        self.socket_path = socket_path or default_socket_path()
+        self.ssh_pool = ssh_pool or SSHConnectionPool()
+        self.telnet_pool = telnet_pool or TelnetSessionPool()
+        self.breaker = breaker or CircuitBreaker()
+        self._stopped = threading.Event()
+
+        directory = os.path.dirname(self.socket_path) or '.'
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        check_socket_directory(directory)
+        if _is_listening(self.socket_path):
+            raise ValueError(f'Agent is already running at {self.socket_path}')
+        if os.path.exists(self.socket_path):
+            # Left by the agent, which was killed
+            os.unlink(self.socket_path)
+
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(self.socket_path, _AgentHandler)
+        finally:
+            os.umask(old_umask)
+
+    def serve_forever(self, poll_interval=0.5):
+        threading.Thread(target=self._evict_idle, daemon=True).start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self._stopped.set()
+
+    def server_close(self):
+        super().server_close()
+        self.ssh_pool.close()
+        self.telnet_pool.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def handle_request_data(self, request):
+        """Processes single request
+
+        :request: dict, see module docstring
+        :return: dict, response
+        """
+        op = request.get('op', OP_EXECUTE)
+        if op == OP_PING:
+            return {'pid': os.getpid()}
+        if op == OP_STATS:
+            return {'ssh': self.ssh_pool.stats(),
+                    'telnet': self.telnet_pool.stats(),
+                    'breaker': self.breaker.stats()}
+        if op == OP_STOP:
+            # shutdown waits for serve_forever, which waits for this thread
+            threading.Thread(target=self.shutdown).start()
+            return {}
+        if op != OP_EXECUTE:
+            raise ValueError(f'Unknown operation: {op}')
+
+        key = (request.get('transport'), request.get('host'),
+               request.get('port'))
+        code, stdout, stderr, encoding = raw_result(self.breaker.call(
+            key, lambda: self._execute(request)))
+        return {'code': code,
+                'stdout': base64.b64encode(stdout).decode('ascii'),
+                'stderr': base64.b64encode(stderr).decode('ascii'),
+                'encoding': encoding}
+
+    def _execute(self, request):
+        transport = request.get('transport')
+        command = request['command']
+        parameters = request.get('parameters') or None
+
+        if transport == 'ssh':
+            # paramiko is imported only by the agent, which serves ssh
+            from executors.ssh import SSHExecutor
+
+            options = {
+                name: request[name]
+                for name in ('user', 'key_path', 'password', 'passphrase',
+                             'port', 'timeout')
+                if request.get(name) is not None
+            }
+            with SSHExecutor(request['host'], pool=self.ssh_pool,
+                             **options) as executor:
+                return executor.execute(command, parameters)
+
+        if transport == 'telnet':
+            from executors.telnet import TelnetExecutor
+
+            with TelnetExecutor(request['host'], request.get('user'),
+                                request.get('password'),
+                                port=request.get('port'),
+                                timeout=request.get('timeout'),
+                                pool=self.telnet_pool,
+                                transfer=request.get(
+                                    'transfer',
+                                    TelnetExecutor.DEFAULT_TRANSFER,
+                                )) as executor:
+                return executor.execute(command, parameters)
+
+        raise ValueError(f'Unknown transport: {transport}')
+
+    def _evict_idle(self):
+        while not self._stopped.wait(self.EVICT_INTERVAL):
+            self.ssh_pool.evict_idle()
+            self.telnet_pool.evict_idle()
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.handle_request_data(json.loads(line))
+            except Exception as err:
+                response = {'error': f'{type(err).__name__}: {err}'}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class AgentClient:
+    """Sends requests to the running agent
+
+        client = AgentClient.connect()
+        if client is not None:
+            code, stdout, stderr = client.execute(
+                'ssh', '10.0.0.1', 'uptime', user='admin', password='...')
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._file = sock.makefile('rwb')
+
+    @classmethod
+    def connect(cls, socket_path=None):
+        """Connects to the agent, see module docstring for the checks
+
+        :return: AgentClient, or None if agent is not running, raises
+                 ValueError if the socket or the agent can't be trusted
+        """
+        socket_path = socket_path or default_socket_path()
+        try:
+            check_socket_directory(os.path.dirname(socket_path) or '.')
+        except FileNotFoundError:
+            return None
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            return None
+        uid = _peer_uid(sock)
+        if uid is not None and uid != os.getuid():
+            sock.close()
+            raise ValueError(f'Agent at {socket_path} runs as other user')
+        return cls(sock)
+
+    def request(self, request):
+        """Sends request, waits for the response
+
+        :return: dict, raises ValueError if agent reported an error
+        """
+        self._file.write(json.dumps(request).encode() + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ValueError('Agent closed connection')
+
+        response = json.loads(line)
+        if 'error' in response:
+            raise ValueError(f"Agent failed: {response['error']}")
+        return response
+
+    def execute(self, transport, host, command, parameters=None, **options):
+        """Executes command by the agent
+
+        :transport: `ssh` or `telnet`
+        :host: host to execute command on
+        :command: string, command to execute
+        :parameters: tuple, params for command
+        :options: executor's options: user, password, port, key_path,
+                  passphrase, timeout, transfer (telnet only)
+        :return: CommandResult, outputs are decoded on access, as
+                 executors' ones are
+        """
+        response = self.request({
+            'op': OP_EXECUTE,
+            'transport': transport,
+            'host': host,
+            'command': command,
+            'parameters': list(parameters or ()),
+            **options,
+        })
+        return CommandResult(response['code'],
+                             base64.b64decode(response['stdout']),
+                             base64.b64decode(response['stderr']),
+                             response['encoding'])
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+def _is_listening(socket_path):
+    client = AgentClient.connect(socket_path)
+    if client is None:
+        return False
+    client.close()
+    return True
+
+
+def _peer_uid(sock):
+    """:return: uid of the process on the other end of the Unix socket,
+    None where SO_PEERCRED is not supported, the directory check protects
+    the socket there"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = struct.Struct('3i')
+    data = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                           credentials.size)
+    _, uid, _ = credentials.unpack(data)
+    return uid
\ No newline at end of file
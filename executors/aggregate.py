@@ -0,0 +1,210 @@
+"""Groups results of the same command on many hosts by their outputs
+
+Fleet sweeps get the same outputs from most of the hosts, e.g. versions of
+the packages or kernels. FleetAggregator keeps each distinct output once and
+maps hosts to groups of equal results, so memory taken by the results and
+size of the report grow with the number of distinct ones, not of hosts:
+
+    aggregator = FleetAggregator()
+    for target, result, error in fan_out(hosts, run_on, 64):
+        aggregator.add(target, result, error)
+    print(aggregator.summary())
+
+    1,812 hosts: code 0, "5.15.0-91-generic"
+    43 hosts: code 0, "5.4.0-169-generic"
+    3 hosts: TimeoutError: Execution took more than 60 seconds
+
+Results, which come as memoryviews of larger buffers, e.g. from
+sharded_fan_out, are copied once for a new output, so the buffers are freed.
+"""
+import hashlib
+
+from executors.base import CommandResult, ExecutionResult, raw_result
+
+# Outputs, kept in files, are hashed by chunks of this size
+READ_CHUNK_SIZE = 65536
+# Max length of the output preview in the summary
+DEFAULT_PREVIEW = 60
+
+
+class PayloadStore:
+    """Keeps each distinct payload once, identified by small integer
+
+    Counts `received` bytes of all added payloads and `kept` ones.
+    """
+
+    def __init__(self):
+        # digest -> id of the payload
+        self._ids = {}
+        # id -> bytes
+        self._payloads = []
+        self.received = 0
+        self.kept = 0
+
+    def add(self, data):
+        """Keeps payload, unless equal one is kept already
+
+        :data: bytes-like or binary file object, which is hashed chunk by
+               chunk and read whole only if its payload is new
+        :return: id of the payload
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        if hasattr(data, 'read'):
+            size = 0
+            for chunk in iter(lambda: data.read(READ_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        else:
+            digest.update(data)
+            size = len(data)
+        digest = digest.digest()
+        self.received += size
+
+        payload_id = self._ids.get(digest)
+        if payload_id is not None:
+            return payload_id
+
+        if hasattr(data, 'read'):
+            data.seek(0)
+            data = data.read()
+        self._ids[digest] = payload_id = len(self._payloads)
+        self._payloads.append(bytes(data))
+        self.kept += size
+        return payload_id
+
+    def get(self, payload_id):
+        """:return: bytes of the payload"""
+        return self._payloads[payload_id]
+
+    def __len__(self):
+        return len(self._payloads)
+
+
+class ResultGroup:
+    """Hosts, which got equal results, or failed with the same error"""
+    __slots__ = ('id', 'code', 'stdout_id', 'stderr_id', 'encoding', 'error',
+                 'hosts', 'count', '_store')
+
+    def __init__(self, group_id, store, code=None, stdout_id=None,
+                 stderr_id=None, encoding=None, error=None):
+        """
+        :group_id:  - number of the group, in order of the first appearance
+        :store:     - PayloadStore, keeping outputs
+        :code:      - result code of the group
+        :stdout_id: - id of stdout in the store
+        :stderr_id: - id of stderr in the store
+        :encoding:  - encoding of the outputs
+        :error:     - `type: message` of the exception, instead of result
+        """
+        self.id = group_id
+        self.code = code
+        self.stdout_id = stdout_id
+        self.stderr_id = stderr_id
+        self.encoding = encoding
+        self.error = error
+        self.hosts = []
+        self.count = 0
+        self._store = store
+
+    def result(self):
+        """:return: CommandResult of the group, None for error group"""
+        if self.error is not None:
+            return None
+        return CommandResult(self.code, self._store.get(self.stdout_id),
+                             self._store.get(self.stderr_id), self.encoding)
+
+    def describe(self, preview=DEFAULT_PREVIEW):
+        """:return: short text, e.g. `code 0, "first line of stdout"`"""
+        if self.error is not None:
+            return self.error
+        stdout = str(self._store.get(self.stdout_id), self.encoding,
+                     'replace')
+        first, _, rest = stdout.strip().partition('\n')
+        if len(first) > preview:
+            first = first[:preview] + '...'
+        elif rest:
+            first += ' ...'
+        return f'code {self.code}, "{first}"' if first else f'code {self.code}'
+
+
+class FleetAggregator:
+    """Groups results of the hosts, see module docstring
+
+    Results are added from the thread, which collects them, e.g. iterates
+    over fan_out. They must be (code, stdout, stderr), CommandResult
+    outputs are hashed as received, without decoding.
+    """
+
+    def __init__(self, keep_hosts=True):
+        """
+        :keep_hosts: - if not set, groups count hosts without listing them
+        """
+        self.keep_hosts = keep_hosts
+        self.payloads = PayloadStore()
+        # key of the result -> ResultGroup
+        self._groups = {}
+        self.hosts = 0
+
+    def add(self, host, result=None, error=None):
+        """Adds result of the host
+
+        :host:   - anything identifying the host, e.g. connection string
+        :result: - (code, stdout, stderr) of the command
+        :error:  - exception, raised for the host instead of the result
+        :return: ResultGroup of the host
+        """
+        if error is not None:
+            error = f'{type(error).__name__}: {error}'
+            key = (error,)
+            fields = {'error': error}
+        else:
+            code, stdout, stderr, encoding = self._outputs(result)
+            stdout_id = self.payloads.add(stdout)
+            stderr_id = self.payloads.add(stderr)
+            key = (code, stdout_id, stderr_id, encoding)
+            fields = {'code': code, 'stdout_id': stdout_id,
+                      'stderr_id': stderr_id, 'encoding': encoding}
+
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = ResultGroup(
+                len(self._groups) + 1, self.payloads, **fields)
+        group.count += 1
+        if self.keep_hosts:
+            group.hosts.append(host)
+        self.hosts += 1
+        return group
+
+    def groups(self):
+        """:return: list of ResultGroup, ones with most hosts first"""
+        return sorted(self._groups.values(),
+                      key=lambda group: (-group.count, group.id))
+
+    def summary(self, preview=DEFAULT_PREVIEW):
+        """:return: text, line per group, e.g. `1,812 hosts: code 0, "..."`
+        """
+        return '\n'.join(
+            f'{group.count:,} {"host" if group.count == 1 else "hosts"}: '
+            f'{group.describe(preview)}'
+            for group in self.groups()
+        )
+
+    def stats(self):
+        return {
+            'hosts': self.hosts,
+            'groups': len(self._groups),
+            'payloads': len(self.payloads),
+            'received_bytes': self.payloads.received,
+            'kept_bytes': self.payloads.kept,
+        }
+
+    @staticmethod
+    def _outputs(result):
+        """:return: (code, stdout, stderr, encoding), outputs, kept in the
+        files, come as file objects"""
+        if (isinstance(result, ExecutionResult) and not result.stdout_dropped
+                and not result.stderr_dropped):
+            # Spooled outputs are hashed without loading them into memory
+            return (result.code, result.stdout_sink.open(),
+                    result.stderr_sink.open(), result.encoding)
+        return raw_result(result)
\ No newline at end of file
@@ -0,0 +1,508 @@
+import asyncio
+import functools
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+from socket import gaierror
+
+from executors.base import (
+    BaseExecutor,
+    CommandResult,
+    ExecutionResult,
+    input_chunks,
+)
+from executors.capture import MemorySink
+from executors.deadline import DeadlineExceeded, ExecutionCancelled
+from executors.local import LocalExecutor
+from executors.telnet_protocol import (
+    LOGIN_INCORRECT,
+    PASSWORD_PROMPT,
+    SENTINEL_TERMINAL_SETUP,
+    FrameCapture,
+    ReceiveBuffer,
+    StdinEncoder,
+    TelnetCodec,
+    check_frame_end,
+    frame_command,
+    frame_header,
+    new_marker,
+    split_frame,
+)
+
+
+class AsyncLocalExecutor(BaseExecutor):
+    """Asyncio counterpart of the LocalExecutor
+
+    `stdin` may also be an async iterable of bytes chunks, each chunk is
+    written once the pipe has drained the previous one.
+    """
+    DEFAULT_ENCODING = LocalExecutor.DEFAULT_ENCODING
+    CHUNK_SIZE = LocalExecutor.CHUNK_SIZE
+
+    def __init__(self, encoding=DEFAULT_ENCODING, capture=None):
+        self.encoding = encoding
+        self.capture = capture
+
+    async def execute(self, command, parameters=None, deadline=None, *,
+                      stdin=None):
+        """Initiates command execution
+
+        :command: string, command to execute
+        :parameters: tuple, params for command
+        :deadline: Deadline, the command is killed, when it passes or is
+                   cancelled
+        :stdin: bytes, binary file object or iterable or async iterable of
+                bytes chunks
+        :return: result code, stdout, stderr
+        """
+        return await _bounded(
+            lambda: self._execute(command, parameters, stdin), deadline)
+
+    async def _execute(self, command, parameters=None, stdin=None):
+        with self._phase('execute.spawn'):
+            process = await asyncio.create_subprocess_exec(
+                command, *(parameters or ()),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                stdin=None if stdin is None else asyncio.subprocess.PIPE,
+            )
+        if self.capture is not None:
+            stdout_sink = self.capture.new_sink()
+            stderr_sink = self.capture.new_sink()
+            code = await self._run_piped(process, stdout_sink, stderr_sink,
+                                         stdin)
+            return ExecutionResult(code, stdout_sink, stderr_sink,
+                                   self.encoding, self.capture.name)
+        if stdin is not None:
+            stdout_sink, stderr_sink = MemorySink(), MemorySink()
+            code = await self._run_piped(process, stdout_sink, stderr_sink,
+                                         stdin)
+            return CommandResult(code, stdout_sink.getvalue(),
+                                 stderr_sink.getvalue(), self.encoding)
+
+        with self._phase('execute.run') as phase:
+            try:
+                stdout, stderr = await process.communicate()
+            except BaseException:
+                # Cancelled, e.g. by the deadline
+                process.kill()
+                await process.wait()
+                raise
+            phase.add_bytes(len(stdout) + len(stderr))
+        return CommandResult(process.returncode, stdout, stderr, self.encoding)
+
+    async def _run_piped(self, process, stdout_sink, stderr_sink, stdin=None):
+        """Feeds stdin and passes outputs of the process through sinks
+
+        :return: result code
+        """
+        async def drain(pipe, sink):
+            while True:
+                chunk = await pipe.read(self.CHUNK_SIZE)
+                if not chunk:
+                    return
+                if not sink.write(chunk):
+                    process.kill()
+                    return
+
+        async def feed():
+            try:
+                async for chunk in _input_chunks(stdin):
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # Command exited or closed its stdin, the rest is not needed
+                pass
+            finally:
+                process.stdin.close()
+
+        tasks = [drain(process.stdout, stdout_sink),
+                 drain(process.stderr, stderr_sink)]
+        if stdin is not None:
+            tasks.append(feed())
+        with self._phase('execute.run') as phase:
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # E.g. stdin raised, don't leave the command behind
+                process.kill()
+                await process.wait()
+                raise
+            code = await process.wait()
+            phase.add_bytes(stdout_sink.received + stderr_sink.received)
+        return code
+
+
+class AsyncSSHExecutor(BaseExecutor):
+    """Asyncio counterpart of the SSHExecutor
+
+    paramiko is blocking, so the wrapped SSHExecutor is driven by the
+    pool of I/O threads, while the event loop stays free. By default the
+    pool is shared by all instances and has IO_THREADS threads, so at most
+    that many ssh calls run at once, the rest wait for a free thread with
+    their deadlines running. Pass own `io_pool` for more or to keep hosts
+    apart. All SSHExecutor options are accepted, e.g. `pool` to share
+    connections. Listeners are attached to the wrapped executor and are
+    called from the I/O threads.
+
+        async with AsyncSSHExecutor('127.0.0.1', user='admin') as executor:
+            return_code, stdout, stderr = await executor.execute('uptime')
+    """
+    # Max number of ssh calls blocking I/O threads at once
+    IO_THREADS = 256
+
+    _io_threads = None
+
+    def __init__(self, host, io_pool=None, **kwargs):
+        """
+        :host:    - host to connect to
+        :io_pool: - concurrent.futures.Executor to run ssh calls in, the
+                    shared pool of IO_THREADS threads if not set
+        :kwargs:  - options of the SSHExecutor
+        """
+        # paramiko is imported only by those, who need ssh
+        from executors.ssh import SSHExecutor
+
+        self.executor = SSHExecutor(host, **kwargs)
+        self.io_pool = io_pool
+
+    def add_listener(self, listener):
+        self.executor.add_listener(listener)
+
+    def remove_listener(self, listener):
+        self.executor.remove_listener(listener)
+
+    async def connect(self):
+        await self._run(self.executor.connect)
+
+    async def disconnect(self):
+        await self._run(self.executor.disconnect)
+
+    async def execute(self, command, parameters=None, deadline=None, *,
+                      stdin=None):
+        """Initiates command execution
+
+        :command: string, command to execute
+        :parameters: tuple, params for command
+        :deadline: Deadline, passed to the SSHExecutor, which stops the
+                   command, when it passes or is cancelled, the call, which
+                   still waits for the I/O thread, is dropped then
+        :stdin: bytes, binary file object or iterable of bytes chunks, read
+                by the I/O thread
+        :return: result code, stdout, stderr
+        """
+        return await _bounded(lambda: self._run(functools.partial(
+            self.executor.execute, command, parameters, deadline,
+            stdin=stdin,
+        )), deadline)
+
+    async def _run(self, function, *args):
+        io_pool = self.io_pool
+        if io_pool is None:
+            cls = type(self)
+            if cls._io_threads is None:
+                cls._io_threads = ThreadPoolExecutor(
+                    max_workers=cls.IO_THREADS,
+                    thread_name_prefix='ssh-io',
+                )
+            io_pool = cls._io_threads
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(io_pool, function, *args)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        await self.disconnect()
+
+
+class AsyncTelnetExecutor(BaseExecutor):
+    """Asyncio counterpart of the TelnetExecutor
+
+    Runs on asyncio streams, so thousands of sessions can be served by one
+    event loop. Commands are sent with the sentinel framing (see
+    telnet_protocol.frame_command), one at a time per session.
+
+        async with AsyncTelnetExecutor('127.0.0.1', 'admin', 'pass') as executor:
+            return_code, stdout, stderr = await executor.execute('pwd')
+    """
+    DEFAULT_ENCODING = 'ascii'
+    TELNET_PORT = 23
+    TRANSFER_PLAIN = 'plain'
+    TRANSFER_COMPRESSED = 'compressed'
+    DEFAULT_TRANSFER = TRANSFER_PLAIN
+    # Max size of the single chunk read from the connection
+    CHUNK_SIZE = 65536
+
+    def __init__(self, host, user, password, port=None, prompt=None,
+                 encoding=DEFAULT_ENCODING, timeout=None, capture=None,
+                 transfer=DEFAULT_TRANSFER):
+        """
+        :host:      - either domain name or IP addres of the server,
+                      without port
+        :user:      - remote account to be logged into
+        :password:  - password for remote account to be logged into
+        :port:      - port to connect to, if not set defaults to TELNET_PORT
+        :prompt:    - function, which must return a string, to be used as
+                      regex to define borders of the call
+        :encoding:  - encoding to be used to encode and decode messages
+                      to/from the remote shell
+        :timeout:   - seconds to wait for connection and login
+        :capture:   - CapturePolicy for the outputs, see TelnetExecutor
+        :transfer:  - either `plain` or `compressed`, see TelnetExecutor
+        """
+        if not user or not password:
+            raise ValueError('Userless/passwordless logins are prohibited')
+        if transfer not in (self.TRANSFER_PLAIN, self.TRANSFER_COMPRESSED):
+            raise ValueError(f'Unknown transfer: {transfer}')
+
+        self.host = host
+        self.port = port or self.TELNET_PORT
+        self.user = user
+        self.password = password
+        self.prompt = prompt or self._default_get_prompt
+        self.encoding = encoding
+        self.timeout = timeout
+        self.capture = capture
+        self.transfer = transfer
+
+        self._reader = None
+        self._writer = None
+        self._codec = TelnetCodec()
+        self._buffer = ReceiveBuffer()
+        # Session runs one command at a time
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        """Opens connection and logs into the remote shell"""
+        try:
+            await asyncio.wait_for(self._login(), self.timeout)
+        except BaseException:
+            await self.disconnect()
+            raise
+
+    async def _login(self):
+        try:
+            # Host is resolved by asyncio, so it is timed as a part of TCP
+            # connect
+            with self._phase('connect.tcp'):
+                self._reader, self._writer = await asyncio.open_connection(
+                    self.host, self.port)
+        except gaierror as err:
+            # get address info error, usually means we cannot resolve
+            raise ValueError(f"Failed to connect to {self.host}:\n{err}")
+
+        prompt = re.compile(self.prompt().encode(self.encoding))
+
+        with self._phase('login.user'):
+            await self._write(self.user + '\n')
+            await self._expect([PASSWORD_PROMPT])
+        with self._phase('login.password'):
+            await self._write(self.password + '\n')
+            matched_index, _, _ = await self._expect([prompt, LOGIN_INCORRECT])
+        if matched_index != 0:
+            raise ValueError('Login with given credentials failed')
+
+        with self._phase('login.setup'):
+            await self._write(SENTINEL_TERMINAL_SETUP)
+            await self._expect([prompt])
+
+    async def disconnect(self):
+        if self._writer is None:
+            return
+
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+        self._reader = self._writer = None
+
+    async def execute(self, command, parameters=None, deadline=None, *,
+                      stdin=None):
+        """Initiates command execution
+
+        :command: string, command to execute
+        :parameters: tuple, params for command
+        :deadline: Deadline, the connection is closed, when it passes or is
+                   cancelled
+        :stdin: bytes, binary file object or iterable or async iterable of
+                bytes chunks, see TelnetExecutor
+        :return: result code, stdout, stderr
+        """
+        if deadline is not None:
+            # Passed before anything was sent, session is still usable
+            deadline.check()
+        try:
+            return await _bounded(
+                lambda: self._execute(command, parameters, stdin), deadline)
+        except (DeadlineExceeded, ExecutionCancelled):
+            # Session is left in the middle of the frame
+            await self.disconnect()
+            raise
+
+    async def _execute(self, command, parameters=None, stdin=None):
+        if self._writer is None:
+            raise ValueError('Connection must be opened to execute commands')
+
+        if parameters:
+            command = command + ' ' + ' '.join(parameters)
+
+        async with self._lock:
+            marker = new_marker()
+            limit = None if self.capture is None else self.capture.max_bytes
+            compress = self.transfer == self.TRANSFER_COMPRESSED
+            with self._phase('execute.send') as phase:
+                await self._write(frame_command(command, marker, limit,
+                                                compress, stdin is not None))
+                if stdin is not None:
+                    await self._upload(stdin, marker, phase)
+
+            marker = marker.encode(self.encoding)
+            with self._phase('execute.wait'):
+                _, header, _ = await self._expect([frame_header(marker)])
+            if self.capture is not None:
+                return await self._capture_frame(header.groups(), marker)
+
+            with self._phase('execute.transfer') as phase:
+                _, _, payload = await self._expect([marker])
+                phase.add_bytes(len(payload) - len(marker))
+                # Frame is followed by the prompt, just skip it
+                await self._expect([re.compile(
+                    self.prompt().encode(self.encoding))])
+
+        with self._phase('execute.decode'):
+            return split_frame(header.groups(), payload[:-len(marker)],
+                               self.encoding)
+
+    async def _capture_frame(self, header, marker):
+        """Passes outputs of the frame through capture sinks as they arrive
+
+        :return: ExecutionResult, see telnet_protocol.FrameCapture
+        """
+        frame = FrameCapture(self.capture, header)
+        started = self._now()
+        if frame.compressed:
+            _, _, payload = await self._expect([marker])
+            payload = payload[:-len(marker)]
+            transferred = len(payload)
+            frame.write_compressed(payload)
+        else:
+            transferred = left = frame.size
+            while left:
+                if not self._buffer:
+                    await self._fill()
+                chunk = self._buffer.consume(min(left, len(self._buffer)))
+                left -= len(chunk)
+                frame.write(chunk)
+            _, _, rest = await self._expect([marker])
+            check_frame_end(rest, marker)
+        self._emit('execute.transfer', started, nbytes=transferred)
+
+        # Frame is followed by the prompt, just skip it
+        await self._expect([re.compile(self.prompt().encode(self.encoding))])
+
+        return frame.result(self.encoding)
+
+    async def _upload(self, stdin, marker, phase):
+        """Sends stdin of the command, see TelnetExecutor._upload"""
+        encoder = StdinEncoder()
+        try:
+            async for chunk in _input_chunks(stdin):
+                lines = encoder.encode(chunk)
+                self._writer.write(lines)
+                phase.add_bytes(len(lines))
+                # Waits while the remote side does not read
+                await self._writer.drain()
+            self._writer.write(encoder.finish(marker))
+            await self._writer.drain()
+        except BaseException:
+            # Remote side waits for the rest of stdin, session is unusable
+            await self.disconnect()
+            raise
+
+    async def _write(self, text):
+        self._writer.write(TelnetCodec.encode(text.encode(self.encoding)))
+        await self._writer.drain()
+
+    async def _fill(self):
+        """Reads next chunk from the connection into the buffer"""
+        chunk = await self._reader.read(self.CHUNK_SIZE)
+        if not chunk:
+            raise EOFError(f'Connection to {self.host} closed')
+
+        data, reply = self._codec.feed(chunk)
+        if reply:
+            self._writer.write(reply)
+        self._buffer.feed(data)
+
+    async def _expect(self, patterns):
+        """Reads until one of patterns is found, drops everything read
+
+        :patterns: list of compiled regexes or bytes, searched literally
+        :return: see ReceiveBuffer.search
+        """
+        scanned = 0
+        while True:
+            found = self._buffer.search(patterns, scanned)
+            if found[0] != -1:
+                return found
+            scanned = len(self._buffer)
+            await self._fill()
+
+    def _default_get_prompt(self):
+        """Used as default prompt regex, see TelnetExecutor"""
+        return f"\\s*{self.user}.*?\\$"
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        await self.disconnect()
+
+
+
+async def _bounded(coroutine, deadline=None):
+    """Awaits the coroutine, cancels it, when the deadline passes or is
+    cancelled, e.g. from another thread
+
+    :coroutine: function without arguments, which returns the coroutine,
+                called only if the deadline has not passed yet
+    :return: result of the coroutine, raises DeadlineExceeded or
+             ExecutionCancelled
+    """
+    if deadline is None:
+        return await coroutine()
+
+    timeout = deadline.remaining()
+    task = asyncio.ensure_future(coroutine())
+    loop = asyncio.get_running_loop()
+    unregister = deadline.on_cancel(
+        lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        return await asyncio.wait_for(task, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded('Deadline exceeded')
+    except asyncio.CancelledError:
+        if not deadline.cancelled:
+            raise
+        raise ExecutionCancelled('Operation was cancelled')
+    finally:
+        unregister()
+
+
+async def _input_chunks(stdin):
+    """Async counterpart of executors.base.input_chunks, which also takes
+    async iterables of bytes chunks"""
+    if not hasattr(stdin, '__aiter__'):
+        for chunk in input_chunks(stdin):
+            yield chunk
+        return
+
+    async for chunk in stdin:
+        if isinstance(chunk, str):
+            raise ValueError('stdin must be bytes, not text')
+        if chunk:
+            yield chunk
\ No newline at end of file
@@ -1,13 +1,290 @@
+import codecs
+import socket
+import time
+
 from abc import ABCMeta
 
+from executors.instrumentation import NO_PHASE, Phase, PhaseEvent
+
+# Stream names used by executors which yield output chunks as they arrive
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+# Max size of the single chunk of stdin, sent to the command at once
+STDIN_CHUNK_SIZE = 65536
+
+
 class BaseExecutor(metaclass=ABCMeta):
-    """ Abstract executor interface """
-    def execute(self, command, parameters=None):
+    """ Abstract executor interface
+
+    Executors report timings of the phases of `connect`, login and `execute`
+    to listeners, callables taking PhaseEvent (see executors.instrumentation).
+    Listeners are called synchronously, in the thread which went through the
+    phase, so they must be fast. Nothing is measured while there are none.
+    """
+    # Callables, which get PhaseEvent of every finished phase
+    listeners = ()
+
+    def execute(self, command, parameters=None, deadline=None, *,
+                stdin=None):
         """
         Initiates command execution
 
         :command: string, command to execute
         :parameters: tuple, params for command
+        :deadline: executors.deadline.Deadline, bounding the execution
+        :stdin: bytes, binary file object or iterable of bytes chunks, fed
+                to the command as it reads them, see input_chunks
         :return: result code, stdout, stderr
         """
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def add_listener(self, listener):
+        self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener):
+        self.listeners = tuple(
+            known for known in self.listeners if known != listener)
+
+    def _open_socket(self, host, port, timeout=None):
+        """Resolves host and opens TCP connection to it
+
+        Done by executors themselves, rather than by client libraries, to
+        time both steps separately.
+        """
+        with self._phase('connect.dns'):
+            addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+
+        with self._phase('connect.tcp'):
+            error = None
+            for family, kind, proto, _, address in addresses:
+                sock = socket.socket(family, kind, proto)
+                sock.settimeout(timeout)
+                try:
+                    sock.connect(address)
+                    return sock
+                except OSError as err:
+                    sock.close()
+                    error = err
+            raise error
+
+    def _phase(self, name):
+        """:return: context manager, timing the phase with given name"""
+        if not self.listeners:
+            return NO_PHASE
+        return Phase(self, name)
+
+    def _now(self):
+        """:return: monotonic time if anybody listens, None otherwise"""
+        if not self.listeners:
+            return None
+        return time.monotonic()
+
+    def _emit(self, phase, started, finished=None, nbytes=None, failed=False):
+        """Sends PhaseEvent to listeners, does nothing if `started` is None"""
+        if started is None:
+            return
+        if finished is None:
+            finished = time.monotonic()
+
+        event = PhaseEvent(self, phase, started, finished, nbytes, failed)
+        for listener in self.listeners:
+            listener(event)
+
+
+class CommandResult:
+    """Result of the command, keeping outputs as received
+
+    Unpacks, indexes and compares as `(code, stdout, stderr)` tuple, but
+    outputs are decoded only on the first access to `stdout` or `stderr`.
+    Callers, which check the result code only, or hash or forward outputs
+    as `stdout_bytes` and `stderr_bytes`, skip decoding and its copy.
+
+        code, stdout, stderr = executor.execute('uname', ('-a',))
+    """
+    __slots__ = ('code', 'encoding', '_stdout_bytes', '_stderr_bytes',
+                 '_stdout', '_stderr')
+    # Names of the fields, as they go in the tuple
+    _FIELDS = ('code', 'stdout', 'stderr')
+
+    def __init__(self, code, stdout_bytes, stderr_bytes, encoding):
+        """
+        :code:         - result code of the command
+        :stdout_bytes: - bytes or memoryview with stdout
+        :stderr_bytes: - bytes or memoryview with stderr
+        :encoding:     - encoding of the outputs
+        """
+        self.code = code
+        self.encoding = encoding
+        self._stdout_bytes = stdout_bytes
+        self._stderr_bytes = stderr_bytes
+        self._stdout = None
+        self._stderr = None
+
+    @property
+    def stdout_bytes(self):
+        return self._stdout_bytes
+
+    @property
+    def stderr_bytes(self):
+        return self._stderr_bytes
+
+    @property
+    def stdout(self):
+        if self._stdout is None:
+            self._stdout = self._decode(self.stdout_bytes, self.stdout_dropped)
+        return self._stdout
+
+    @property
+    def stderr(self):
+        if self._stderr is None:
+            self._stderr = self._decode(self.stderr_bytes, self.stderr_dropped)
+        return self._stderr
+
+    @property
+    def stdout_dropped(self):
+        """Number of stdout bytes, which were not kept"""
+        return 0
+
+    @property
+    def stderr_dropped(self):
+        """Number of stderr bytes, which were not kept"""
+        return 0
+
+    @property
+    def limit_exceeded(self):
+        """Whether command was stopped for exceeding the byte limit"""
+        return False
+
+    def _decode(self, data, dropped):
+        # Cut may split multibyte character in two
+        errors = 'replace' if dropped else 'strict'
+        # str() decodes memoryview without copying it into bytes first
+        return str(data, self.encoding, errors)
+
+    def __iter__(self):
+        return iter((self.code, self.stdout, self.stderr))
+
+    def __len__(self):
+        return 3
+
+    def __getitem__(self, index):
+        # Only the asked fields are decoded, e.g. result[0] never decodes
+        if isinstance(index, slice):
+            return tuple(getattr(self, name) for name in self._FIELDS[index])
+        return getattr(self, self._FIELDS[index])
+
+    def __eq__(self, other):
+        if isinstance(other, CommandResult) and _comparable_raw(self, other):
+            return (self.code == other.code
+                    and self.stdout_bytes == other.stdout_bytes
+                    and self.stderr_bytes == other.stderr_bytes)
+        if isinstance(other, (tuple, CommandResult)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (f'CommandResult(code={self.code!r}, '
+                f'stdout_bytes={len(self.stdout_bytes)}, '
+                f'stderr_bytes={len(self.stderr_bytes)})')
+
+
+class ExecutionResult(CommandResult):
+    """Result of the command, which outputs were captured by CapturePolicy
+
+    Outputs are kept by the sinks, spooled ones may be read without loading
+    them into memory with `stdout_sink.open()`.
+    """
+    __slots__ = ('stdout_sink', 'stderr_sink', 'policy')
+
+    def __init__(self, code, stdout_sink, stderr_sink, encoding, policy):
+        """
+        :code:        - result code of the command
+        :stdout_sink: - executors.capture.OutputSink with stdout
+        :stderr_sink: - executors.capture.OutputSink with stderr
+        :encoding:    - encoding of the outputs
+        :policy:      - name of the applied capture policy
+        """
+        super().__init__(code, None, None, encoding)
+        self.stdout_sink = stdout_sink
+        self.stderr_sink = stderr_sink
+        self.policy = policy
+
+    @property
+    def stdout_bytes(self):
+        """Kept stdout, read from the sink on each access"""
+        return self.stdout_sink.getvalue()
+
+    @property
+    def stderr_bytes(self):
+        """Kept stderr, read from the sink on each access"""
+        return self.stderr_sink.getvalue()
+
+    @property
+    def stdout_dropped(self):
+        return self.stdout_sink.dropped
+
+    @property
+    def stderr_dropped(self):
+        return self.stderr_sink.dropped
+
+    @property
+    def limit_exceeded(self):
+        return self.stdout_sink.exceeded or self.stderr_sink.exceeded
+
+    def __repr__(self):
+        return (f'ExecutionResult(code={self.code!r}, policy={self.policy!r}, '
+                f'stdout_dropped={self.stdout_dropped}, '
+                f'stderr_dropped={self.stderr_dropped})')
+
+
+def raw_result(result):
+    """Takes outputs of the result without decoding them, where possible
+
+    :result: CommandResult or (code, stdout, stderr) of text outputs
+    :return: (code, stdout, stderr, encoding), outputs, which were cut, come
+             decoded and encoded back as utf-8, not to keep multibyte
+             characters split by the cut
+    """
+    if isinstance(result, CommandResult):
+        if not result.stdout_dropped and not result.stderr_dropped:
+            return (result.code, result.stdout_bytes, result.stderr_bytes,
+                    result.encoding)
+
+    code, stdout, stderr = result
+    return code, stdout.encode('utf-8'), stderr.encode('utf-8'), 'utf-8'
+
+
+def _comparable_raw(first, second):
+    """:return: True, if results are equal when their raw outputs are"""
+    return (codecs.lookup(first.encoding) == codecs.lookup(second.encoding)
+            and not first.stdout_dropped and not first.stderr_dropped
+            and not second.stdout_dropped and not second.stderr_dropped)
+
+
+def input_chunks(stdin, chunk_size=STDIN_CHUNK_SIZE):
+    """Reads stdin for the command chunk by chunk
+
+    Chunks are read only when the previous one was sent, so large files are
+    streamed without being loaded into memory.
+
+    :stdin: bytes, binary file object or iterable of bytes chunks
+    :chunk_size: max size of chunks, read from bytes or file object
+    :return: generator of non empty bytes or memoryviews
+    """
+    if isinstance(stdin, (bytes, bytearray, memoryview)):
+        data = memoryview(stdin).cast('B')
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+        return
+
+    if hasattr(stdin, 'read'):
+        read = stdin.read
+        stdin = iter(lambda: read(chunk_size), b'')
+    for chunk in stdin:
+        if isinstance(chunk, str):
+            raise ValueError('stdin must be bytes, not text')
+        if chunk:
+            yield chunk
\ No newline at end of file
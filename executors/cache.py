@@ -0,0 +1,267 @@
+import threading
+import time
+
+from collections import Counter, OrderedDict
+
+from executors.base import BaseExecutor, CommandResult
+from executors.deadline import DeadlineExceeded
+
+
+class ResultCache:
+    """Keeps results of commands for `ttl` seconds
+
+    At most `max_size` results are kept, least recently used ones are evicted
+    first. Identical requests, which come while the command is running, wait
+    for its result instead of running it again (single flight). Only
+    successful results, with zero result code, are kept, so transient
+    failures are retried by the next request. Exceptions are passed to all
+    waiting requests and not kept either.
+
+    Cache counts its `hits`, `misses`, `coalesced` (request waited for the
+    running one) and `evictions`.
+    """
+    DEFAULT_MAX_SIZE = 1024
+    DEFAULT_TTL = 60
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        """
+        :max_size:  - max number of results kept
+        :ttl:       - seconds each result is kept for, unless set per request
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._counters = Counter()
+        self._lock = threading.Lock()
+        # key -> (monotonic expiration time, result), from least to most
+        # recently used
+        self._results = OrderedDict()
+        # key -> _Flight of the running command
+        self._flights = {}
+
+    def get(self, key, execute, ttl=None, deadline=None):
+        """Returns kept result or executes command to get it
+
+        :key:      - hashable, identifies the command and where it runs
+        :execute:  - function without arguments, which executes the command
+        :ttl:      - seconds to keep this result, defaults to cache's `ttl`
+        :deadline: - Deadline, bounding the wait for the running command
+        :return: result of `execute`
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                expires, result = entry
+                if expires > time.monotonic():
+                    self._results.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return result
+                del self._results[key]
+
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+                self._counters['misses'] += 1
+            else:
+                leader = False
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            return flight.wait(deadline)
+
+        try:
+            result = execute()
+        except BaseException as err:
+            with self._lock:
+                del self._flights[key]
+            flight.fail(err)
+            raise
+
+        with self._lock:
+            del self._flights[key]
+            if _code(result) == 0:
+                self._store(key, result, self.ttl if ttl is None else ttl)
+        flight.finish(result)
+        return result
+
+    def invalidate(self, match=None):
+        """Drops kept results
+
+        :match: - function, which takes key and returns True for results to
+                  be dropped, all results are dropped if not set
+        :return: number of dropped results
+        """
+        with self._lock:
+            if match is None:
+                dropped = len(self._results)
+                self._results.clear()
+                return dropped
+
+            keys = [key for key in self._results if match(key)]
+            for key in keys:
+                del self._results[key]
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._results),
+                'hits': self._counters['hits'],
+                'misses': self._counters['misses'],
+                'coalesced': self._counters['coalesced'],
+                'evictions': self._counters['evictions'],
+            }
+
+    def _store(self, key, result, ttl):
+        """Keeps result, must be called under the lock"""
+        self._results[key] = time.monotonic() + ttl, result
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+            self._counters['evictions'] += 1
+
+
+class _Flight:
+    """Result of the command, which is running, shared by waiting requests"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def finish(self, result):
+        self.result = result
+        self.done.set()
+
+    def fail(self, error):
+        self.error = error
+        self.done.set()
+
+    def wait(self, deadline=None):
+        timeout = None if deadline is None else deadline.remaining()
+        if not self.done.wait(timeout):
+            raise DeadlineExceeded('Deadline exceeded')
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _code(result):
+    """:return: result code, without decoding outputs of CommandResult"""
+    if isinstance(result, CommandResult):
+        return result.code
+    return result[0]
+
+
+class CachingExecutor(BaseExecutor):
+    """Wraps any executor, returns kept results of the repeated commands
+
+    Meant for idempotent, read only commands, like `uname -a` or `nproc`.
+    Results are keyed by executor type, host, port, user, command,
+    parameters and telnet `transfer`, so executors for the same host share
+    results through the same cache. Executors with `capture` policy are not
+    cached, as their results hold sinks, e.g. spooled files, which can't be
+    shared. Listeners are added to the wrapped executor, result, which was
+    kept or waited for while the same command ran, is reported to them as
+    `execute.cache_hit` phase. Other attributes, e.g. `connect` or `close`,
+    are passed to the wrapped executor.
+
+        executor = CachingExecutor(SSHExecutor('127.0.0.1', user='admin'),
+                                   cache=shared_cache, ttl=30)
+        with executor:
+            return_code, stdout, stderr = executor.execute('uname', ('-a',))
+    """
+
+    def __init__(self, executor, cache=None, ttl=None):
+        """
+        :executor: - executor to wrap, must have blocking `execute`
+        :cache:    - ResultCache, shared by executors, new one if not set
+        :ttl:      - seconds to keep results, defaults to cache's `ttl`
+        """
+        self.executor = executor
+        self.cache = cache or ResultCache()
+        self.ttl = ttl
+
+    def execute(self, command, parameters=None, deadline=None, *,
+                stdin=None, ttl=None):
+        """Returns kept result or initiates command execution
+
+        Commands with `stdin` or of the executor with `capture` policy are
+        always executed, their results are not kept.
+
+        :command: string, command to execute
+        :parameters: tuple, params for command
+        :deadline: Deadline, bounding the execution or the wait for the same
+                   running command
+        :stdin: bytes, binary file object or iterable of bytes chunks
+        :ttl: seconds to keep this result, defaults to executor's `ttl`
+        :return: result code, stdout, stderr
+        """
+        if (stdin is not None
+                or getattr(self.executor, 'capture', None) is not None):
+            return self.executor.execute(command, parameters,
+                                         deadline=deadline, stdin=stdin)
+
+        started = self._now()
+        executed = []
+
+        def execute():
+            executed.append(True)
+            return self.executor.execute(command, parameters,
+                                         deadline=deadline)
+
+        result = self.cache.get(self.cache_key(command, parameters), execute,
+                                self.ttl if ttl is None else ttl, deadline)
+        if not executed:
+            self._emit('execute.cache_hit', started)
+        return result
+
+    def cache_key(self, command, parameters=None):
+        """:return: (executor type, host, port, user, command, parameters,
+                     transfer)"""
+        return (type(self.executor).__name__,
+                getattr(self.executor, 'host', None),
+                getattr(self.executor, 'port', None),
+                getattr(self.executor, 'user', None),
+                command,
+                tuple(parameters or ()),
+                getattr(self.executor, 'transfer', None))
+
+    @property
+    def listeners(self):
+        return getattr(self.executor, 'listeners', ())
+
+    def add_listener(self, listener):
+        self.executor.add_listener(listener)
+
+    def remove_listener(self, listener):
+        self.executor.remove_listener(listener)
+
+    def invalidate(self, command=None, parameters=None):
+        """Drops kept results of this executor's host and user
+
+        :command: - drop only results of this command, all if not set
+        :parameters: - params of the command to drop result of
+        :return: number of dropped results
+        """
+        if command is not None:
+            key = self.cache_key(command, parameters)
+            return self.cache.invalidate(lambda known: known == key)
+
+        prefix = self.cache_key(None)[:4]
+        return self.cache.invalidate(lambda known: known[:4] == prefix)
+
+    def __getattr__(self, name):
+        if name == 'executor':
+            # Not set yet, don't recurse
+            raise AttributeError(name)
+        return getattr(self.executor, name)
+
+    def __enter__(self):
+        self.executor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return self.executor.__exit__(exc_type, exc_value, exc_traceback)
\ No newline at end of file
@@ -0,0 +1,202 @@
+import io
+import tempfile
+
+from collections import deque
+
+
+class CapturePolicy:
+    """Defines how much of the command output is kept and where
+
+    - `memory`:     whole output is kept in memory
+    - `spool`:      output is kept in memory until it grows over
+                    `spool_threshold` bytes, then it is moved to the
+                    temporary file
+    - `head_tail`:  only first `head` and last `tail` bytes are kept, the
+                    middle is dropped
+
+    Any policy may have `max_bytes` hard limit, command is killed as soon as
+    any of its outputs exceeds it.
+    """
+    MEMORY = 'memory'
+    SPOOL = 'spool'
+    HEAD_TAIL = 'head_tail'
+
+    DEFAULT_SPOOL_THRESHOLD = 1024 * 1024
+    DEFAULT_HEAD = 64 * 1024
+    DEFAULT_TAIL = 64 * 1024
+
+    def __init__(self, name=MEMORY, max_bytes=None,
+                 spool_threshold=DEFAULT_SPOOL_THRESHOLD,
+                 head=DEFAULT_HEAD, tail=DEFAULT_TAIL):
+        if name not in (self.MEMORY, self.SPOOL, self.HEAD_TAIL):
+            raise ValueError(f'Unknown capture policy: {name}')
+
+        self.name = name
+        self.max_bytes = max_bytes
+        self.spool_threshold = spool_threshold
+        self.head = head
+        self.tail = tail
+
+    @classmethod
+    def memory(cls, max_bytes=None):
+        return cls(cls.MEMORY, max_bytes=max_bytes)
+
+    @classmethod
+    def spool(cls, threshold=DEFAULT_SPOOL_THRESHOLD, max_bytes=None):
+        return cls(cls.SPOOL, max_bytes=max_bytes, spool_threshold=threshold)
+
+    @classmethod
+    def head_tail(cls, head=DEFAULT_HEAD, tail=DEFAULT_TAIL, max_bytes=None):
+        return cls(cls.HEAD_TAIL, max_bytes=max_bytes, head=head, tail=tail)
+
+    def new_sink(self):
+        """:return: OutputSink for one output of the command"""
+        if self.name == self.SPOOL:
+            return SpoolSink(self.max_bytes, self.spool_threshold)
+        if self.name == self.HEAD_TAIL:
+            return HeadTailSink(self.max_bytes, self.head, self.tail)
+        return MemorySink(self.max_bytes)
+
+
+class OutputSink:
+    """Receives one output of the command, chunk by chunk
+
+    Counts `received` bytes and keeps some of them, see subclasses. Once
+    more than `max_bytes` are received, `exceeded` is set and the rest is
+    dropped.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.kept = 0
+        self.exceeded = False
+
+    @property
+    def dropped(self):
+        """Number of received bytes, which were not kept"""
+        return self.received - self.kept
+
+    def write(self, chunk):
+        """Takes next chunk of the output
+
+        :return: False if the output exceeded `max_bytes`, so the command
+                 should be stopped
+        """
+        self.received += len(chunk)
+        if self.max_bytes is not None:
+            allowed = self.max_bytes - (self.received - len(chunk))
+            if allowed < len(chunk):
+                self.exceeded = True
+                chunk = chunk[:max(0, allowed)]
+
+        if chunk:
+            self._keep(chunk)
+        return not self.exceeded
+
+    def skip(self, size):
+        """Counts bytes, which were dropped before reaching the sink
+
+        Used by executors, which cut outputs over `max_bytes` on the remote
+        side.
+        """
+        self.received += size
+        if self.max_bytes is not None and self.received > self.max_bytes:
+            self.exceeded = True
+
+    def getvalue(self):
+        """:return: kept bytes"""
+        raise NotImplementedError
+
+    def open(self):
+        """:return: binary file object, reading kept bytes"""
+        return io.BytesIO(self.getvalue())
+
+    def _keep(self, chunk):
+        raise NotImplementedError
+
+
+class MemorySink(OutputSink):
+    """Keeps whole output in memory"""
+
+    def __init__(self, max_bytes=None):
+        super().__init__(max_bytes)
+        self._chunks = []
+
+    def getvalue(self):
+        if len(self._chunks) > 1:
+            self._chunks = [b''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else b''
+
+    def _keep(self, chunk):
+        self._chunks.append(bytes(chunk))
+        self.kept += len(chunk)
+
+
+class SpoolSink(OutputSink):
+    """Keeps output in memory until threshold, then in the temporary file"""
+
+    def __init__(self, max_bytes=None, threshold=None):
+        super().__init__(max_bytes)
+        self.threshold = threshold
+        self._file = tempfile.SpooledTemporaryFile(max_size=threshold or 0)
+
+    @property
+    def spooled(self):
+        """Whether output was moved to the file
+
+        SpooledTemporaryFile moves its content once it grows over the
+        threshold, without threshold it never does. Kept bytes are appended
+        only, so their count is the size of the file.
+        """
+        return bool(self.threshold) and self.kept > self.threshold
+
+    def getvalue(self):
+        self._file.seek(0)
+        return self._file.read()
+
+    def open(self):
+        """Reads kept bytes without loading them into memory at once"""
+        self._file.seek(0)
+        return self._file
+
+    def _keep(self, chunk):
+        self._file.write(chunk)
+        self.kept += len(chunk)
+
+
+class HeadTailSink(OutputSink):
+    """Keeps first `head` and last `tail` bytes of the output"""
+
+    def __init__(self, max_bytes=None, head=0, tail=0):
+        super().__init__(max_bytes)
+        self.head = head
+        self.tail = tail
+        self._head = bytearray()
+        self._tail = deque()
+        self._tail_size = 0
+
+    def getvalue(self):
+        return bytes(self._head) + b''.join(self._tail)
+
+    def _keep(self, chunk):
+        missing = self.head - len(self._head)
+        if missing > 0:
+            self._head += chunk[:missing]
+            chunk = chunk[missing:]
+        if not chunk or not self.tail:
+            self.kept = len(self._head) + self._tail_size
+            return
+
+        # Ring of chunks, oldest ones are dropped once tail is full
+        chunk = bytes(chunk[-self.tail:])
+        self._tail.append(chunk)
+        self._tail_size += len(chunk)
+        while self._tail_size - len(self._tail[0]) >= self.tail:
+            self._tail_size -= len(self._tail.popleft())
+        if self._tail_size > self.tail:
+            extra = self._tail_size - self.tail
+            self._tail[0] = self._tail[0][extra:]
+            self._tail_size -= extra
+
+        self.kept = len(self._head) + self._tail_size
\ No newline at end of file
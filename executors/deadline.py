@@ -0,0 +1,249 @@
+"""Deadlines, cancellation and circuit breaking for remote executors
+
+Deadline bounds the whole operation, e.g. connect, login and command
+execution together, rather than each blocking call by itself, so one
+black-holed host can't hold the worker for the sum of all timeouts:
+
+    deadline = Deadline(30)
+    executor = SSHExecutor('10.0.0.1', user='admin')
+    executor.connect(deadline)
+    try:
+        code, stdout, stderr = executor.execute('uptime', deadline=deadline)
+    finally:
+        executor.disconnect()
+
+Deadline may also be cancelled from another thread, executors waiting for
+the remote side are woken up then and raise ExecutionCancelled.
+"""
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(TimeoutError):
+    """Operation did not finish before its deadline"""
+
+
+class ExecutionCancelled(Exception):
+    """Operation was cancelled by `Deadline.cancel`"""
+
+
+class CircuitOpenError(ValueError):
+    """Host failed too many times in a row and is not tried for a while"""
+
+
+class Deadline:
+    """Point in time, by which the operation must finish, and its
+    cancellation
+
+    Executors take from it what is left for each blocking call, see
+    `remaining`, and register callbacks, which interrupt their waits on
+    cancellation, see `on_cancel`.
+    """
+
+    def __init__(self, seconds=None):
+        """
+        :seconds: - time given to the operation, None for no limit, then
+                    deadline is only used for cancellation
+        """
+        self.expires = (None if seconds is None
+                        else time.monotonic() + seconds)
+        self._cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @property
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def remaining(self, timeout=None):
+        """Seconds left for the next blocking call
+
+        Raises DeadlineExceeded or ExecutionCancelled, if there is no time
+        left, so the result can be passed as timeout right away.
+
+        :timeout: - own timeout of the call, result never exceeds it
+        :return: seconds, None if neither deadline nor timeout is set
+        """
+        self.check()
+        if self.expires is None:
+            return timeout
+        left = self.expires - time.monotonic()
+        return left if timeout is None else min(left, timeout)
+
+    def check(self):
+        """Raises, if operation was cancelled or its deadline passed"""
+        if self._cancelled:
+            raise ExecutionCancelled('Operation was cancelled')
+        if self.expired:
+            raise DeadlineExceeded('Deadline exceeded')
+
+    def cancel(self):
+        """Cancels the operation, calls registered callbacks once"""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Registers callback, which interrupts blocking wait on cancellation
+
+        Callback is called right away, if deadline is already cancelled, and
+        must not raise.
+
+        :return: function without arguments, which unregisters the callback
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    @contextmanager
+    def watch(self, callback):
+        """Calls callback, if deadline passes or is cancelled inside the block
+
+        For the blocking calls, which can't take what is left of the
+        deadline, e.g. several steps with own timeouts done by a library.
+        Callback should interrupt them, e.g. by shutting the socket down, and
+        is called right away, if the deadline has already passed.
+        """
+        unregister = self.on_cancel(callback)
+        timer = None
+        if self.expires is not None:
+            timer = threading.Timer(max(0, self.expires - time.monotonic()),
+                                    callback)
+            timer.daemon = True
+            timer.start()
+        try:
+            yield
+        finally:
+            unregister()
+            if timer is not None:
+                timer.cancel()
+
+    def _unregister(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class CircuitBreaker:
+    """Fails fast for hosts, which failed `threshold` times in a row
+
+    Open circuit rejects calls with CircuitOpenError for `cooldown` seconds,
+    so dead hosts don't take concurrency slots. Then single trial call is
+    let through: success closes the circuit, failure opens it again.
+
+        breaker = CircuitBreaker()
+        result = breaker.call(host, lambda: run_on(host))
+
+    Calls, which raised, are counted as failures, result codes of the
+    commands are not.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    DEFAULT_THRESHOLD = 3
+    DEFAULT_COOLDOWN = 30
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        """
+        :threshold: - failures in a row, which open the circuit
+        :cooldown:  - seconds the circuit stays open
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        # key -> failures in a row
+        self._failures = Counter()
+        # key -> monotonic time, when open circuit lets the trial call
+        self._opened = {}
+        # Keys with the trial call running
+        self._trials = set()
+        self._rejected = 0
+
+    def state(self, key):
+        with self._lock:
+            if key in self._trials:
+                return self.HALF_OPEN
+            reopens = self._opened.get(key)
+            if reopens is None:
+                return self.CLOSED
+            return self.OPEN if reopens > time.monotonic() else self.HALF_OPEN
+
+    def check(self, key):
+        """Raises CircuitOpenError, if calls to the key must fail fast
+
+        Call, which passed the check, must be reported with `record_success`
+        or `record_failure`.
+        """
+        with self._lock:
+            reopens = self._opened.get(key)
+            if reopens is None:
+                return
+            if reopens <= time.monotonic() and key not in self._trials:
+                self._trials.add(key)
+                return
+            self._rejected += 1
+        raise CircuitOpenError(f'{key} failed {self.threshold} times in a '
+                               'row, not trying it for a while')
+
+    def record_success(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+            self._opened.pop(key, None)
+            self._trials.discard(key)
+
+    def release(self, key):
+        """Ends the call, which is neither success nor failure of the key"""
+        with self._lock:
+            self._trials.discard(key)
+
+    def record_failure(self, key):
+        with self._lock:
+            self._failures[key] += 1
+            trial = key in self._trials
+            self._trials.discard(key)
+            if trial or self._failures[key] >= self.threshold:
+                self._opened[key] = time.monotonic() + self.cooldown
+
+    def call(self, key, function):
+        """Calls function, unless circuit of the key is open
+
+        :return: result of the function
+        """
+        self.check(key)
+        try:
+            result = function()
+        except BaseException as err:
+            if (isinstance(err, Exception)
+                    and not isinstance(err, ExecutionCancelled)):
+                self.record_failure(key)
+            else:
+                # Host is not to blame, e.g. for KeyboardInterrupt
+                self.release(key)
+            raise
+        self.record_success(key)
+        return result
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'open': sum(reopens > now for reopens in self._opened.values()),
+                'failing': len(self._failures),
+                'rejected': self._rejected,
+            }
\ No newline at end of file
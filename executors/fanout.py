@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+
+from executors.deadline import Deadline
+
+
+def parse_inventory(lines):
+    """Reads hosts from inventory, one connection string per line
+
+    Empty lines and lines starting with `#` are skipped.
+
+    :lines: iterable of strings, e.g. opened file
+    :return: list of connection strings
+    """
+    hosts = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            hosts.append(line)
+    return hosts
+
+
+def fan_out(targets, task, concurrency, timeout=None, breaker=None,
+            key=None, deadlines=False):
+    """Runs task for every target in parallel, yields results as they come
+
+    At most `concurrency` tasks run at once. Task, which runs for longer than
+    `timeout` seconds, is reported as failed with `TimeoutError`, and its
+    slot is given to the next target. Timed out task keeps running in the
+    background, unless it stops by its deadline (see `deadlines`), and its
+    result is dropped.
+
+    With `breaker` (see executors.deadline.CircuitBreaker) targets, which
+    hosts failed repeatedly, are reported as failed with CircuitOpenError
+    right away, without taking the slot.
+
+    :targets:     iterable of targets, e.g. connection strings, it is read
+                  lazily, as slots free up, so it may block for more targets
+    :task:        function, which takes target and returns the result
+    :concurrency: max number of tasks running at once
+    :timeout:     seconds, None for no limit
+    :breaker:     CircuitBreaker, shared by calls for the same hosts
+    :key:         function, which takes target and returns its breaker key,
+                  e.g. host, target itself by default
+    :deadlines:   if set, task also takes Deadline of `timeout` seconds,
+                  which is cancelled when the task is reported as timed out,
+                  so executors stop waiting for the host
+    :return: generator of (target, result, error), error is None on success
+    """
+    if hasattr(targets, '__len__'):
+        concurrency = min(concurrency, len(targets))
+    pending = enumerate(targets)
+    # Serializes reads of the targets, separately from `lock`, as reading
+    # may block
+    pending_lock = threading.Lock()
+
+    # (target, result, error) of finished tasks, None when worker found no
+    # more targets
+    done = queue.Queue()
+    # index of the target -> (target, monotonic time of the task start,
+    # deadline)
+    running = {}
+    lock = threading.Lock()
+
+    def call(target, deadline):
+        if deadline is None:
+            return task(target)
+        return task(target, deadline)
+
+    def work():
+        while True:
+            with pending_lock:
+                index, target = next(pending, (None, None))
+            if index is None:
+                done.put(None)
+                return
+
+            deadline = Deadline(timeout) if deadlines else None
+            with lock:
+                running[index] = target, time.monotonic(), deadline
+            try:
+                if breaker is None:
+                    result, error = call(target, deadline), None
+                else:
+                    result, error = breaker.call(
+                        target if key is None else key(target),
+                        lambda: call(target, deadline),
+                    ), None
+            except Exception as err:
+                result, error = None, err
+            with lock:
+                # Task was already reported as timed out and this worker
+                # was replaced, so the concurrency is kept
+                if running.pop(index, None) is None:
+                    return
+            done.put((target, result, error))
+
+    def start_worker():
+        # Daemon threads don't keep the process alive for hung tasks
+        threading.Thread(target=work, daemon=True).start()
+
+    def expire():
+        """Reports tasks, which run for longer than `timeout`"""
+        deadline = time.monotonic() - timeout
+        with lock:
+            expired = [index for index, (_, started, _) in running.items()
+                       if started <= deadline]
+            expired = [running.pop(index) for index in expired]
+
+        for target, _, task_deadline in expired:
+            if task_deadline is not None:
+                task_deadline.cancel()
+            # Worker is stuck with the expired task, replace it
+            start_worker()
+            yield target, None, TimeoutError(
+                f'No result in {timeout} seconds')
+
+    workers = concurrency
+    for _ in range(workers):
+        start_worker()
+
+    while workers:
+        try:
+            result = done.get(timeout=_next_expiry(running, lock, timeout))
+        except queue.Empty:
+            yield from expire()
+            continue
+        if result is None:
+            workers -= 1
+        else:
+            yield result
+
+
+def _next_expiry(running, lock, timeout):
+    """:return: seconds until the first running task expires"""
+    if timeout is None:
+        return None
+
+    with lock:
+        if not running:
+            return timeout
+        first_started = min(started for _, started, _ in running.values())
+    return max(0, first_started + timeout - time.monotonic())
@@ -0,0 +1,306 @@
+"""Writes results of the commands to the binary stream in the chosen format
+
+    writer = new_writer('raw', sys.stdout.buffer)
+    writer.write_result(result, host='10.0.0.1')
+    writer.write_error(err, host='10.0.0.2')
+
+Formats are:
+- `json`: JSON line per result, `{"code": 0, "stdout": "...", ...}`, as
+  the CLI always printed them, bytes, which are not valid in the encoding of
+  the output, are written as U+FFFD
+- `ndjson`: same documents, compact and not escaping non ASCII characters,
+  UTF-8 outputs are escaped as bytes, without decoding them
+- `msgpack`: msgpack map per result, outputs are binary, not decoded, with
+  their `encoding`, needs `msgpack` package
+- `raw`: length prefixed frames, outputs are written as received, without
+  building a document, see RawWriter
+
+Every record is flushed as soon as it is written, so results can be read as
+they come.
+"""
+import codecs
+import functools
+import json
+import struct
+
+import simplejson
+
+from executors.base import raw_result
+
+# Parts of the records, smaller than this, are joined to write them at once
+JOIN_LIMIT = 65536
+
+JSON = 'json'
+NDJSON = 'ndjson'
+MSGPACK = 'msgpack'
+RAW = 'raw'
+FORMATS = (JSON, NDJSON, MSGPACK, RAW)
+DEFAULT_FORMAT = JSON
+
+# Characters of JSON strings, which are escaped by _json_string, backslash
+# goes first, not to escape backslashes of the other escapes
+_ESCAPES = ((b'\\', b'\\\\'), (b'"', b'\\"'), (b'\n', b'\\n'),
+            (b'\r', b'\\r'), (b'\t', b'\\t'))
+# Maps control characters, which have to be escaped too, to zero bytes and
+# the others to ones, outputs with them go through the encoder
+_CONTROLS = bytes(0 if char < 0x20 and char not in b'\t\n\r' else 1
+                  for char in range(256))
+
+
+def new_writer(name, stream):
+    """:name: format, one of FORMATS
+    :stream: binary file object, e.g. sys.stdout.buffer
+    :return: writer of the format
+    """
+    writers = {
+        JSON: JsonWriter,
+        NDJSON: NdjsonWriter,
+        MSGPACK: MsgpackWriter,
+        RAW: RawWriter,
+    }
+    if name not in writers:
+        raise ValueError(f'Unknown format: {name}')
+    return writers[name](stream)
+
+
+def json_repr(code, output, err, **extra):
+    """:return: JSON line of the result, as `json` format writes it"""
+    return simplejson.dumps({
+        'code': code,
+        'stdout': output,
+        'stderr': err,
+        **extra,
+    })
+
+
+def text_result(result):
+    """Decodes outputs of the result for JSON documents
+
+    :result: CommandResult or (code, stdout, stderr) of text outputs
+    :return: (code, stdout, stderr), bytes, which are not valid in the
+             encoding, are replaced with U+FFFD instead of failing, raw and
+             msgpack formats keep such outputs as they are
+    """
+    code, stdout, stderr, encoding = raw_result(result)
+    return (code, str(stdout, encoding, 'replace'),
+            str(stderr, encoding, 'replace'))
+
+
+def error_repr(err, **extra):
+    """:return: JSON line of the error, as `json` format writes it"""
+    return simplejson.dumps({
+        'error': error_text(err),
+        **extra,
+    })
+
+
+def error_text(error):
+    """:return: `type: message` of the exception, string is returned as is"""
+    if isinstance(error, str):
+        return error
+    return f'{type(error).__name__}: {error}'
+
+
+class JsonWriter:
+    """Writes JSON line per result, see module docstring and json_repr"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write_result(self, result, **extra):
+        """:result: (code, stdout, stderr) of the command
+        :extra: other fields of the record, e.g. host
+        """
+        self._write(json_repr(*text_result(result), **extra))
+
+    def write_error(self, error, **extra):
+        """:error: exception or its text, see error_text
+        :extra: other fields of the record, e.g. host
+        """
+        self._write(error_repr(error, **extra))
+
+    def _write(self, line):
+        # Non ASCII characters are escaped, so the line is ASCII
+        self.stream.write(line.encode('ascii') + b'\n')
+        self.stream.flush()
+
+
+class NdjsonWriter:
+    """Writes compact JSON line per result, see module docstring
+
+    UTF-8 outputs are escaped as bytes and written as they are, without
+    decoding them and encoding back, other ones go through the encoder.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._encoder = json.JSONEncoder(ensure_ascii=False,
+                                         separators=(',', ':'))
+
+    def write_result(self, result, **extra):
+        code, stdout, stderr, encoding = raw_result(result)
+        if _is_utf8(encoding):
+            stdout, stderr = _json_string(stdout), _json_string(stderr)
+        else:
+            stdout = stderr = None
+        if stdout is None or stderr is None:
+            code, stdout, stderr = text_result(result)
+            # Without quotes, as escaped outputs
+            stdout = self._encode(stdout)[1:-1]
+            stderr = self._encode(stderr)[1:-1]
+
+        # Codes are ints, except for unusual executors
+        code = b'%d' % code if type(code) is int else self._encode(code)
+        parts = [b'{"code":', code, b',"stdout":"', stdout,
+                 b'","stderr":"', stderr, b'"']
+        if extra:
+            # Fields of the object, without its braces
+            parts += [b',', self._encode(extra)[1:-1]]
+        parts.append(b'}\n')
+        if len(stdout) + len(stderr) < JOIN_LIMIT:
+            self.stream.write(b''.join(parts))
+        else:
+            # Large outputs are not copied once more
+            for part in parts:
+                self.stream.write(part)
+        self.stream.flush()
+
+    def write_error(self, error, **extra):
+        self.stream.write(self._encode({'error': error_text(error), **extra})
+                          + b'\n')
+        self.stream.flush()
+
+    def _encode(self, value):
+        return self._encoder.encode(value).encode('utf-8', 'surrogateescape')
+
+
+class MsgpackWriter:
+    """Writes msgpack map per result, see module docstring
+
+    Results are `{"code": 0, "stdout": b"...", "stderr": b"...",
+    "encoding": "utf-8", ...}`, errors are `{"error": "...", ...}`.
+    """
+
+    def __init__(self, stream):
+        try:
+            import msgpack
+        except ImportError:
+            raise ValueError('msgpack is needed for msgpack format')
+        self.stream = stream
+        self._packer = msgpack.Packer(use_bin_type=True)
+
+    def write_result(self, result, **extra):
+        code, stdout, stderr, encoding = raw_result(result)
+        self._write({'code': code, 'stdout': stdout, 'stderr': stderr,
+                     'encoding': encoding, **extra})
+
+    def write_error(self, error, **extra):
+        self._write({'error': error_text(error), **extra})
+
+    def _write(self, document):
+        self.stream.write(self._packer.pack(document))
+        self.stream.flush()
+
+
+class RawWriter:
+    """Writes length prefixed frame per result
+
+    Frame starts with FRAME_HEADER: kind (RESULT or ERROR), result code,
+    length of the metadata, of stdout and of stderr. It is followed by the
+    metadata, JSON object with `encoding` of the outputs, `error` text and
+    extra fields, stdout and stderr, as received from the command. Outputs
+    are written to the stream directly, without copying them into the frame,
+    see read_frames to read them.
+    """
+    RESULT = b'R'
+    ERROR = b'E'
+    FRAME_HEADER = struct.Struct('!ciIII')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def write_result(self, result, **extra):
+        code, stdout, stderr, encoding = raw_result(result)
+        self._write(self.RESULT, code, {'encoding': encoding, **extra},
+                    stdout, stderr)
+
+    def write_error(self, error, **extra):
+        self._write(self.ERROR, 0, {'error': error_text(error), **extra},
+                    b'', b'')
+
+    def _write(self, kind, code, metadata, stdout, stderr):
+        metadata = self._encoder.encode(metadata).encode('ascii')
+        # Small header and metadata are joined, outputs are not copied
+        self.stream.write(self.FRAME_HEADER.pack(kind, code, len(metadata),
+                                                 len(stdout), len(stderr))
+                          + metadata)
+        for part in (stdout, stderr):
+            if part:
+                self.stream.write(part)
+        self.stream.flush()
+
+
+def read_frames(stream):
+    """Reads frames, written by RawWriter
+
+    :stream: binary file object
+    :return: generator of dicts, `{"code": 0, "stdout": b"...",
+             "stderr": b"...", "encoding": "utf-8", ...}` for results and
+             `{"error": "...", ...}` for errors
+    """
+    header = RawWriter.FRAME_HEADER
+    while True:
+        data = stream.read(header.size)
+        if not data:
+            return
+        if len(data) < header.size:
+            raise ValueError('Frame is cut')
+        kind, code, metadata_size, stdout_size, stderr_size = (
+            header.unpack(data))
+
+        metadata = simplejson.loads(_read_exactly(stream, metadata_size))
+        if kind == RawWriter.ERROR:
+            yield metadata
+            continue
+        yield {'code': code,
+               'stdout': _read_exactly(stream, stdout_size),
+               'stderr': _read_exactly(stream, stderr_size),
+               **metadata}
+
+
+@functools.lru_cache(maxsize=None)
+def _is_utf8(encoding):
+    return codecs.lookup(encoding).name == 'utf-8'
+
+
+def _json_string(data):
+    """Escapes UTF-8 output for JSON string, without decoding it
+
+    Translation and replaces run over the bytes at C speed, several times
+    faster than encoding decoded output.
+
+    :data: bytes-like
+    :return: bytes, content of JSON string without quotes, None if the
+             output is not valid UTF-8 or has control characters, other
+             than new lines and tabs
+    """
+    data = bytes(data)
+    if 0 in data.translate(_CONTROLS):
+        return None
+    try:
+        # Validates, escaping below keeps multibyte characters as they are
+        str(data, 'utf-8')
+    except UnicodeDecodeError:
+        return None
+    # Replace returns the same bytes, if there is nothing to replace
+    for char, escaped in _ESCAPES:
+        data = data.replace(char, escaped)
+    return data
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise ValueError('Frame is cut')
+    return data
\ No newline at end of file
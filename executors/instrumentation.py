@@ -0,0 +1,75 @@
+import time
+
+
+class PhaseEvent:
+    """Timing of one finished phase of `connect`, login or `execute`
+
+    Timestamps are taken from `time.monotonic`, so they are comparable
+    within the process only.
+    """
+    __slots__ = ('executor', 'phase', 'started', 'finished', 'nbytes',
+                 'failed')
+
+    def __init__(self, executor, phase, started, finished, nbytes=None,
+                 failed=False):
+        """
+        :executor: - executor, which went through the phase
+        :phase:    - phase name, e.g. `connect.tcp` or `execute.transfer`
+        :started:  - monotonic time of the phase start
+        :finished: - monotonic time of the phase end
+        :nbytes:   - number of bytes transferred, if phase transfers any
+        :failed:   - whether phase was ended by the exception
+        """
+        self.executor = executor
+        self.phase = phase
+        self.started = started
+        self.finished = finished
+        self.nbytes = nbytes
+        self.failed = failed
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+    def __repr__(self):
+        return (f'PhaseEvent({self.phase!r}, duration={self.duration:.6f}, '
+                f'nbytes={self.nbytes!r}, failed={self.failed!r})')
+
+
+class Phase:
+    """Context manager, which emits PhaseEvent when the block is done"""
+    __slots__ = ('executor', 'name', 'started', 'nbytes')
+
+    def __init__(self, executor, name):
+        self.executor = executor
+        self.name = name
+        self.started = None
+        self.nbytes = None
+
+    def add_bytes(self, size):
+        self.nbytes = (self.nbytes or 0) + size
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.executor._emit(self.name, self.started, time.monotonic(),
+                            self.nbytes, exc_type is not None)
+
+
+class _NoPhase:
+    """Stands for Phase, when nobody listens"""
+    __slots__ = ()
+
+    def add_bytes(self, size):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        pass
+
+
+NO_PHASE = _NoPhase()
\ No newline at end of file
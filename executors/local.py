@@ -1,25 +1,513 @@
+import errno
+import os
+import queue
+import re
+import selectors
+import shlex
+import signal
 import subprocess
+import threading
 
-from executors.base import BaseExecutor
+from contextlib import nullcontext
+
+from executors.base import (
+    BaseExecutor,
+    CommandResult,
+    ExecutionResult,
+    input_chunks,
+)
+from executors.capture import MemorySink
 
 class LocalExecutor(BaseExecutor):
-    """Creates subprocess and executes command locally"""
+    """Creates subprocess and executes command locally
+
+    If `capture` policy is passed (see executors.capture), outputs are read
+    chunk by chunk into its sinks and `execute` returns ExecutionResult.
+    Command is killed as soon as any output exceeds policy's `max_bytes`.
+
+    Command is also killed, once `deadline` passes or is cancelled (see
+    executors.deadline), `execute` raises DeadlineExceeded or
+    ExecutionCancelled then.
+
+    `stdin` is written to the pipe as the command reads it, while outputs
+    are drained, so neither side waits for the other to free the pipe.
+
+    With `session` set, commands are not spawned by Python, but sent to the
+    long-lived `sh`, which runs them one by one, so each command costs the
+    shell's fork and exec only, shell builtins cost none. Commands run with
+    the same arguments and get no stdin, commands with `stdin` are spawned as
+    usual. Shell is started by the first command, it is restarted, if the
+    command killed it or made it exit, e.g. by the deadline. Session keeps
+    the shell's state, e.g. `cd` changes working directory of the next
+    commands. Commands of the session run one at a time, call `close` or use
+    the instance as context manager to stop the shell.
+    """
     DEFAULT_ENCODING = 'utf-8'
+    # Max size of the single chunk read from the pipe
+    CHUNK_SIZE = 65536
 
-    def __init__(self, encoding=DEFAULT_ENCODING):
+    def __init__(self, encoding=DEFAULT_ENCODING, capture=None, session=False):
         self.encoding = encoding
+        self.capture = capture
 
-    def execute(self, command, parameters=None):
+        self.session = session
+        self._shell = None
+        self._shell_lock = threading.Lock()
+
+    def execute(self, command, parameters=None, deadline=None, *,
+                stdin=None):
         """Initiates command execution
 
         :command: string, command to execute
         :parameters: tuple, params for command
+        :deadline: Deadline, bounding the execution
+        :stdin: bytes, binary file object or iterable of bytes chunks
         :return: result code, stdout, stderr
         """
         if parameters:
             command = [command] + list(parameters)
+        if deadline is not None:
+            deadline.check()
+
+        if self.session and stdin is None:
+            return self._execute_in_session(command, deadline)
+        if self.capture is not None:
+            return self._execute_captured(command, deadline, stdin)
+        if stdin is not None:
+            stdout, stderr = MemorySink(), MemorySink()
+            code = self._run_piped(command, stdout, stderr, deadline, stdin)
+            return CommandResult(code, stdout.getvalue(), stderr.getvalue(),
+                                 self.encoding)
+
+        with self._phase('execute.spawn'):
+            process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+        with self._phase('execute.run') as phase, \
+                _watch(process, deadline):
+            stdout, stderr = process.communicate()
+            phase.add_bytes(len(stdout) + len(stderr))
+        _check_killed(process.returncode, deadline)
+        return CommandResult(process.returncode, stdout, stderr, self.encoding)
+
+    def _execute_in_session(self, command, deadline=None):
+        """Runs command in the session's shell
+
+        :return: CommandResult or ExecutionResult, if capture is set
+        """
+        if self.capture is not None:
+            stdout, stderr = self.capture.new_sink(), self.capture.new_sink()
+        else:
+            stdout, stderr = MemorySink(), MemorySink()
+        argv = [command] if isinstance(command, str) else command
+
+        with self._shell_lock:
+            shell = self._live_shell()
+            started = self._now()
+            try:
+                code = self._run_in_shell(shell, argv, stdout, stderr,
+                                          deadline)
+            except BrokenPipeError:
+                # Shell died after the check, the command was not sent
+                shell = self._live_shell()
+                started = self._now()
+                code = self._run_in_shell(shell, argv, stdout, stderr,
+                                          deadline)
+        self._emit('execute.run', started,
+                   nbytes=stdout.received + stderr.received)
+
+        if code is None:
+            # Shell found no such command
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                    argv[0])
+        _check_killed(code, deadline)
+        if self.capture is not None:
+            return ExecutionResult(code, stdout, stderr, self.encoding,
+                                   self.capture.name)
+        return CommandResult(code, stdout.getvalue(), stderr.getvalue(),
+                             self.encoding)
+
+    def _live_shell(self):
+        """:return: running shell of the session, new one, if there is no
+        shell yet or it died while idle, must be called under the lock"""
+        if self._shell is not None and not self._shell.alive:
+            self._shell.close()
+            self._shell = None
+        if self._shell is None:
+            with self._phase('execute.spawn'):
+                self._shell = _ShellSession()
+        return self._shell
+
+    def _run_in_shell(self, shell, argv, stdout, stderr, deadline=None):
+        """Runs command in the shell, drops the shell, if it did not survive
+
+        :return: result code, see _ShellSession.run
+        """
+        try:
+            with _watch(shell, deadline):
+                return shell.run(argv, stdout, stderr, self.CHUNK_SIZE)
+        except BaseException:
+            # Shell is in unknown state, e.g. interrupted amid the frame
+            shell.kill()
+            raise
+        finally:
+            if not shell.alive:
+                shell.close()
+                self._shell = None
+
+    def close(self):
+        """Stops the session's shell, if it runs"""
+        with self._shell_lock:
+            if self._shell is not None:
+                self._shell.close()
+                self._shell = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def _execute_captured(self, command, deadline=None, stdin=None):
+        """Executes command, passing its outputs through capture sinks
+
+        :return: ExecutionResult
+        """
+        stdout, stderr = self.capture.new_sink(), self.capture.new_sink()
+        code = self._run_piped(command, stdout, stderr, deadline, stdin)
+        return ExecutionResult(code, stdout, stderr, self.encoding,
+                               self.capture.name)
+
+    def _run_piped(self, command, stdout, stderr, deadline=None, stdin=None):
+        """Runs command, feeding stdin and writing outputs into sinks chunk
+        by chunk
+
+        :stdout: OutputSink for stdout
+        :stderr: OutputSink for stderr
+        :return: result code
+        """
+        with self._phase('execute.spawn'):
+            process = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                stdin=None if stdin is None else subprocess.PIPE,
+            )
+        started = self._now()
+        sinks = {process.stdout: stdout, process.stderr: stderr}
+        feeder = None if stdin is None else _Feeder(process.stdin, stdin)
+
+        try:
+            with selectors.DefaultSelector() as selector, \
+                    _watch(process, deadline):
+                for pipe in sinks:
+                    selector.register(pipe, selectors.EVENT_READ)
+                if feeder is not None:
+                    selector.register(process.stdin, selectors.EVENT_WRITE)
+
+                while selector.get_map():
+                    for key, _ in selector.select():
+                        if key.fileobj is process.stdin:
+                            if not feeder.write():
+                                selector.unregister(process.stdin)
+                                process.stdin.close()
+                            continue
+
+                        chunk = os.read(key.fd, self.CHUNK_SIZE)
+                        if not chunk:
+                            selector.unregister(key.fileobj)
+                        elif not sinks[key.fileobj].write(chunk):
+                            process.kill()
+                            # Nothing more is needed, don't wait for EOF
+                            for pipe in list(selector.get_map().values()):
+                                selector.unregister(pipe.fileobj)
+                            break
+        except BaseException:
+            # E.g. stdin raised, don't leave the command behind
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            for pipe in (process.stdin, *sinks):
+                if pipe is not None:
+                    pipe.close()
+        code = process.wait()
+        self._emit('execute.run', started,
+                   nbytes=stdout.received + stderr.received)
+        _check_killed(code, deadline)
+        return code
+
+
+class LocalPool:
+    """Runs many local commands at once, yields results as they complete
+
+    At most `size` commands run at once, each by its own LocalExecutor, so
+    with `session` set, there are at most `size` shells, each running one
+    command at a time.
+
+        with LocalPool(size=16, session=True) as pool:
+            for index, result, error in pool.execute_as_completed(probes):
+                ...
+            results = pool.execute_many(['uptime', ('cat', ('/proc/loadavg',))])
+    """
+    DEFAULT_SIZE = 16
+
+    def __init__(self, size=DEFAULT_SIZE, session=False,
+                 encoding=LocalExecutor.DEFAULT_ENCODING, capture=None):
+        """
+        :size:     - max number of commands running at once
+        :session:  - if set, commands are run by long-lived shells, see
+                     LocalExecutor
+        :encoding: - encoding of the outputs
+        :capture:  - CapturePolicy, see LocalExecutor
+        """
+        self.size = size
+        self.executors = [
+            LocalExecutor(encoding, capture, session) for _ in range(size)
+        ]
+        self._idle = queue.SimpleQueue()
+        for executor in self.executors:
+            self._idle.put(executor)
+
+    def add_listener(self, listener):
+        for executor in self.executors:
+            executor.add_listener(listener)
+
+    def execute_as_completed(self, commands, timeout=None):
+        """Runs commands in parallel
+
+        :commands: iterable of commands, each is either string or tuple
+                   (command, parameters), it is read as slots free up
+        :timeout: seconds given to each command, it is killed and reported
+                  as failed with TimeoutError then
+        :return: generator of (index of the command, result, error), error
+                 is None on success
+        """
+        # Threads of fan_out are needed by the pool only
+        from executors.fanout import fan_out
+
+        def run(item, deadline=None):
+            _, command = item
+            command, parameters = ((command, None) if isinstance(command, str)
+                                   else command)
+            executor = self._idle.get()
+            try:
+                return executor.execute(command, parameters, deadline)
+            finally:
+                self._idle.put(executor)
+
+        for (index, _), result, error in fan_out(
+                enumerate(commands), run, self.size, timeout,
+                deadlines=timeout is not None):
+            yield index, result, error
+
+    def execute_many(self, commands, timeout=None):
+        """Runs commands in parallel
+
+        :commands: list of commands, see execute_as_completed
+        :timeout: seconds given to each command
+        :return: list of results, in the order of commands
+        """
+        results = [None] * len(commands)
+        errors = {}
+        for index, result, error in self.execute_as_completed(commands,
+                                                              timeout):
+            results[index] = result
+            if error is not None:
+                errors[index] = error
+        if errors:
+            raise errors[min(errors)]
+        return results
+
+    def close(self):
+        """Stops shells of the sessions"""
+        for executor in self.executors:
+            executor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+class _ShellSession:
+    """Long-lived `sh`, which runs commands one at a time
+
+    Command is sent with the script, which runs it with stdin from
+    /dev/null and prints unique marker after its outputs. Stdout ends with
+    new line, the marker and the result code of the command on its own line,
+    stderr ends with the marker.
+
+    Shell runs in its own process group, which is killed with commands it
+    started.
+    """
+    SHELL = '/bin/sh'
+    # Code, printed instead of the result one, if there is no such command
+    MISSING = b'missing'
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [self.SHELL], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, start_new_session=True,
+        )
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, argv, stdout, stderr, chunk_size):
+        """Runs command, writing its outputs into the sinks
+
+        :argv: list, command and its parameters
+        :stdout: OutputSink for stdout
+        :stderr: OutputSink for stderr
+        :return: result code, None if there is no such command, raises
+                 BrokenPipeError, if the shell died before the command was
+                 sent
+        """
+        marker = f'__mcduck_{os.urandom(16).hex()}__'
+        command = ' '.join(shlex.quote(str(arg)) for arg in argv)
+        # New line before the brace ends commands with comments too
+        script = (
+            f'if command -v {shlex.quote(argv[0])} >/dev/null 2>&1; then '
+            f'{{ {command}\n}} </dev/null; m_ret=$?; '
+            f'else m_ret={self.MISSING.decode()}; fi; '
+            f"printf '\\n%s %s\\n' {marker} \"$m_ret\"; "
+            f'printf %s {marker} >&2\n'
+        )
+        marker = marker.encode()
+        outputs = {
+            self.process.stdout: _FramedOutput(
+                stdout, re.compile(b'\\n' + marker + rb' (\w+)\n\Z'),
+                len(marker) + 32),
+            self.process.stderr: _FramedOutput(
+                stderr, re.compile(marker + rb'\Z'), len(marker)),
+        }
+
+        self.process.stdin.write(script.encode())
+        self.process.stdin.flush()
+
+        with selectors.DefaultSelector() as selector:
+            for pipe in outputs:
+                selector.register(pipe, selectors.EVENT_READ)
+            while selector.get_map():
+                for key, _ in selector.select():
+                    output = outputs[key.fileobj]
+                    chunk = os.read(key.fd, chunk_size)
+                    if not chunk:
+                        # Shell exited, e.g. killed or by `exit` command
+                        output.finish()
+                        selector.unregister(key.fileobj)
+                    elif not output.write(chunk):
+                        self.kill()
+                    elif output.done:
+                        selector.unregister(key.fileobj)
+
+        code = outputs[self.process.stdout].code
+        if code is None or not outputs[self.process.stderr].done:
+            return self.process.wait()
+        if code == self.MISSING:
+            return None
+        return int(code)
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def close(self):
+        """Lets the shell exit at the end of input, kills it, if it does
+        not"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self.process.wait(1)
+        except subprocess.TimeoutExpired:
+            self.kill()
+            self.process.wait()
+        self.process.stdout.close()
+        self.process.stderr.close()
+
+
+class _FramedOutput:
+    """Passes output of the session's command to the sink, until its end
+    marker"""
+
+    def __init__(self, sink, end, max_end_size):
+        """
+        :sink:         - OutputSink
+        :end:          - compiled regex, matching end of the output
+        :max_end_size: - max size of the match, so many last bytes are held
+                         back, as they may turn out to be the end
+        """
+        self.sink = sink
+        self.end = end
+        self.max_end_size = max_end_size
+        self.held = b''
+        self.done = False
+        # First group of the end match
+        self.code = None
+
+    def write(self, chunk):
+        """:return: False if the output exceeded sink's `max_bytes`"""
+        data = self.held + chunk
+        match = self.end.search(data, max(0, len(data) - self.max_end_size))
+        if match is not None:
+            self.done = True
+            self.code = match.groups()[0] if match.groups() else None
+            cut = match.start()
+        else:
+            cut = max(0, len(data) - self.max_end_size)
+        self.held = data[cut:] if match is None else b''
+        return self.sink.write(data[:cut]) if cut else True
+
+    def finish(self):
+        """Writes held back bytes, once the output ended without marker"""
+        if self.held:
+            self.sink.write(self.held)
+            self.held = b''
+
+
+class _Feeder:
+    """Writes stdin chunks into the pipe without blocking"""
+
+    def __init__(self, pipe, stdin):
+        os.set_blocking(pipe.fileno(), False)
+        self.fd = pipe.fileno()
+        self.chunks = input_chunks(stdin)
+        self.pending = memoryview(b'')
+
+    def write(self):
+        """Writes as much as the pipe takes
+
+        Next chunk is read from stdin only once the previous one is written.
+
+        :return: False, when stdin is exhausted or the command closed the
+                 pipe, so it must be closed
+        """
+        try:
+            if not self.pending:
+                self.pending = memoryview(next(self.chunks)).cast('B')
+            self.pending = self.pending[os.write(self.fd, self.pending):]
+        except StopIteration:
+            return False
+        except BlockingIOError:
+            pass
+        except BrokenPipeError:
+            # Command exited or closed its stdin, the rest is not needed
+            return False
+        return True
+
+
+def _watch(process, deadline):
+    """:return: context manager, killing the process at the deadline"""
+    if deadline is None:
+        return nullcontext()
+    return deadline.watch(process.kill)
+
 
-        res = subprocess.run(command, capture_output=True)
-        return (res.returncode,
-                res.stdout.decode(self.encoding),
-                res.stderr.decode(self.encoding))
\ No newline at end of file
+def _check_killed(code, deadline):
+    """Raises, if the process was killed by the deadline or cancellation"""
+    if deadline is not None and code < 0:
+        deadline.check()
\ No newline at end of file
@@ -0,0 +1,319 @@
+"""Runs commands on many hosts, as described by the playbook file
+
+Playbook is JSON or YAML (needs PyYAML) document:
+
+    {
+        "concurrency": 64,
+        "per_host_concurrency": 1,
+        "defaults": {"transport": "ssh", "credentials": "ops", "timeout": 30},
+        "credentials": {
+            "ops": {"user": "admin", "password_env": "OPS_PASSWORD"}
+        },
+        "commands": ["uptime", ["ls", "-a", "/etc"]],
+        "hosts": [
+            {"host": "10.0.0.1"},
+            {"host": "10.0.0.2", "transport": "telnet", "commands": ["pwd"]},
+            {"transport": "local", "commands": [["df", "-h"]]}
+        ]
+    }
+
+Each host entry gets one connection, used for all of its commands, which
+run in order. Hosts without own `commands` run the top level ones. Secrets
+are referenced by the names of environment variables (`password_env`,
+`passphrase_env`), so playbooks can be kept in repositories.
+"""
+import json
+import os
+import queue
+import threading
+
+from collections import Counter
+
+from executors.deadline import CircuitBreaker
+from executors.registry import registry
+
+DEFAULT_CONCURRENCY = 64
+DEFAULT_PER_HOST_CONCURRENCY = 1
+
+TRANSPORTS = ('ssh', 'telnet', 'local')
+# Connection options, which may be set for the host, defaults or credentials
+OPTIONS = ('transport', 'port', 'user', 'password', 'key_path', 'passphrase',
+           'timeout')
+
+
+def load_playbook(path):
+    """Reads playbook from JSON or YAML file, by the file extension
+
+    :return: Playbook
+    """
+    with open(path) as playbook_file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError('PyYAML is needed to read YAML playbooks')
+            return Playbook(yaml.safe_load(playbook_file))
+        return Playbook(json.load(playbook_file))
+
+
+class Playbook:
+    """Parsed and validated playbook, see module docstring"""
+
+    def __init__(self, document):
+        """
+        :document: dict, loaded from the playbook file
+        """
+        if not isinstance(document, dict) or not document.get('hosts'):
+            raise ValueError('Playbook must have the list of hosts')
+
+        self.concurrency = document.get('concurrency', DEFAULT_CONCURRENCY)
+        self.per_host_concurrency = document.get(
+            'per_host_concurrency', DEFAULT_PER_HOST_CONCURRENCY)
+
+        credentials = document.get('credentials', {})
+        defaults = document.get('defaults', {})
+        commands = document.get('commands', [])
+        self.jobs = [
+            HostJob(index, self._resolve(entry, defaults, credentials),
+                    [_parse_command(command)
+                     for command in entry.get('commands', commands)])
+            for index, entry in enumerate(document['hosts'])
+        ]
+
+    def _resolve(self, entry, defaults, credentials):
+        """Merges host entry with defaults and referenced credentials
+
+        :return: dict of connection options, see OPTIONS, and host
+        """
+        options = {}
+        for source in (defaults, entry):
+            reference = source.get('credentials')
+            if reference is not None:
+                if reference not in credentials:
+                    raise ValueError(f'Unknown credentials: {reference}')
+                options.update(_read_secrets(credentials[reference]))
+            options.update(_read_secrets({
+                name: value for name, value in source.items()
+                if name in OPTIONS or name.endswith('_env')
+            }))
+
+        options['host'] = entry.get('host')
+        options.setdefault('transport', 'ssh')
+        if options['transport'] not in TRANSPORTS:
+            raise ValueError(f"Unknown transport: {options['transport']}")
+        if options['transport'] != 'local' and not options['host']:
+            raise ValueError('Remote hosts must have `host`')
+        return options
+
+
+class HostJob:
+    """Commands to run over one connection"""
+
+    def __init__(self, index, options, commands):
+        """
+        :index:    - position of the host in the playbook, identifies the job
+        :options:  - dict of connection options, see Playbook._resolve
+        :commands: - list of (command, parameters)
+        """
+        self.index = index
+        self.options = options
+        self.commands = commands
+
+    @property
+    def host(self):
+        return self.options['host'] or 'localhost'
+
+    def connect(self):
+        """:return: (executor, function closing its connection)"""
+        options = {name: value for name, value in self.options.items()
+                   if value is not None}
+        transport = options.pop('transport')
+        executor_class = registry.get(transport)
+
+        if transport == 'local':
+            return executor_class(), lambda: None
+
+        host = options.pop('host')
+        if transport == 'telnet':
+            executor = executor_class(host, options.get('user'),
+                                      options.get('password'),
+                                      port=options.get('port'),
+                                      timeout=options.get('timeout'))
+            return executor, executor.close
+
+        executor = executor_class(host, **options)
+        executor.connect()
+        return executor, executor.disconnect
+
+
+class PlaybookRunner:
+    """Runs jobs of the playbook in parallel, yields results as they come
+
+    At most `concurrency` jobs run at once and at most `per_host_concurrency`
+    of them connect to the same host. Commands of the job run one after
+    another in its connection.
+
+    Results are dicts, ready to be written as JSON lines:
+        {"job": 0, "host": "10.0.0.1", "index": 1, "command": "ls",
+         "parameters": ["-a"], "code": 0, "stdout": "...", "stderr": ""}
+    Commands, which were not run as job failed to connect or its previous
+    command raised, get `error` instead of `code`, `stdout` and `stderr`.
+
+    Connections go through the circuit breaker, so once the host failed to
+    connect several times in a row, its other jobs fail right away.
+    """
+
+    def __init__(self, playbook, concurrency=None, per_host_concurrency=None,
+                 done=(), breaker=None):
+        """
+        :playbook:             - Playbook
+        :concurrency:          - overrides playbook's one
+        :per_host_concurrency: - overrides playbook's one
+        :done:                 - (job, index) of commands to skip, which were
+                                 completed by the previous run, see read_done
+        :breaker:              - CircuitBreaker, keyed by host, new one if
+                                 not set
+        """
+        self.playbook = playbook
+        self.concurrency = concurrency or playbook.concurrency
+        self.per_host_concurrency = (per_host_concurrency
+                                     or playbook.per_host_concurrency)
+        self.done = set(done)
+        self.breaker = breaker or CircuitBreaker()
+
+    def run(self):
+        """:return: generator of results, see class docstring"""
+        pending = [job for job in self.playbook.jobs
+                   if any((job.index, index) not in self.done
+                          for index in range(len(job.commands)))]
+        results = queue.Queue()
+        running = Counter()
+        condition = threading.Condition()
+
+        def take_job():
+            """:return: next job, which host has free slot, None if done"""
+            with condition:
+                while pending:
+                    for position, job in enumerate(pending):
+                        if running[job.host] < self.per_host_concurrency:
+                            running[job.host] += 1
+                            return pending.pop(position)
+                    condition.wait()
+            return None
+
+        def work():
+            try:
+                while True:
+                    job = take_job()
+                    if job is None:
+                        return
+                    try:
+                        self._run_job(job, results.put)
+                    finally:
+                        with condition:
+                            running[job.host] -= 1
+                            condition.notify_all()
+            finally:
+                # Marks worker as finished
+                results.put(None)
+
+        workers = min(self.concurrency, len(pending))
+        for _ in range(workers):
+            threading.Thread(target=work, daemon=True).start()
+
+        while workers:
+            result = results.get()
+            if result is None:
+                workers -= 1
+            else:
+                yield result
+
+    def _run_job(self, job, report):
+        """Runs not yet done commands of the job, reports their results"""
+        commands = [
+            (index, command, parameters)
+            for index, (command, parameters) in enumerate(job.commands)
+            if (job.index, index) not in self.done
+        ]
+
+        try:
+            executor, close = self.breaker.call(job.host, job.connect)
+        except Exception as err:
+            for index, command, parameters in commands:
+                report(_error_result(job, index, command, parameters, err))
+            return
+
+        try:
+            for position, (index, command, parameters) in enumerate(commands):
+                try:
+                    code, stdout, stderr = executor.execute(command,
+                                                            parameters)
+                except Exception as err:
+                    # Connection is in unknown state, skip the rest
+                    for index, command, parameters in commands[position:]:
+                        report(_error_result(job, index, command, parameters,
+                                             err))
+                    return
+                report({**_result_base(job, index, command, parameters),
+                        'code': code, 'stdout': stdout, 'stderr': stderr})
+        finally:
+            try:
+                close()
+            except Exception:
+                pass
+
+
+def read_done(lines):
+    """Finds commands completed by the previous run
+
+    :lines: iterable of JSON lines, written from PlaybookRunner results,
+            unreadable ones, e.g. cut by the crash, are skipped
+    :return: set of (job, index)
+    """
+    done = set()
+    for line in lines:
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(result, dict) and 'code' in result:
+            done.add((result['job'], result['index']))
+    return done
+
+
+def _parse_command(command):
+    """:return: (command, parameters) from string or list"""
+    if isinstance(command, str):
+        return command, None
+    if isinstance(command, list) and command:
+        return command[0], tuple(command[1:]) or None
+    raise ValueError(f'Command must be string or non empty list: {command}')
+
+
+def _read_secrets(options):
+    """Replaces `<name>_env` options with values of environment variables"""
+    resolved = {}
+    for name, value in options.items():
+        if not name.endswith('_env'):
+            resolved[name] = value
+            continue
+        if value not in os.environ:
+            raise ValueError(f'Environment variable {value} is not set')
+        resolved[name[:-len('_env')]] = os.environ[value]
+    return resolved
+
+
+def _result_base(job, index, command, parameters):
+    return {
+        'job': job.index,
+        'host': job.host,
+        'user': job.options.get('user'),
+        'index': index,
+        'command': command,
+        'parameters': list(parameters or ()),
+    }
+
+
+def _error_result(job, index, command, parameters, err):
+    return {**_result_base(job, index, command, parameters),
+            'error': f'{type(err).__name__}: {err}'}
\ No newline at end of file
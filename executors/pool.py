@@ -0,0 +1,414 @@
+import threading
+import time
+
+from collections import Counter, OrderedDict
+
+
+class SSHConnectionPool:
+    """Shares authenticated ssh connections between executors
+
+    Connections are kept per key (see `SSHExecutor.pool_key`), single
+    connection can be borrowed by many executors at once, as each command
+    runs in its own channel. Connections, which are not borrowed by anyone,
+    are closed after `idle_ttl` seconds, or least recently used ones, when
+    there are more than `max_size` connections in the pool.
+
+    Pool counts its `hits` (active connection was reused), `misses` (new
+    connection was opened), `reconnects` (pooled connection was dead and
+    was replaced) and `evictions`.
+    """
+    DEFAULT_MAX_SIZE = 64
+    DEFAULT_IDLE_TTL = 300
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, idle_ttl=DEFAULT_IDLE_TTL):
+        """
+        :max_size:  - max number of connections kept, borrowed connections
+                      are never evicted, so pool can temporarily grow over it
+        :idle_ttl:  - seconds, after which unused connection is closed
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        # key -> _PooledConnection, from least to most recently used
+        self._connections = OrderedDict()
+
+    def acquire(self, key, connect):
+        """Borrows connection, opens it if there is no active one
+
+        :key:     - hashable, identifies the host and credentials
+        :connect: - function, which returns connected paramiko.SSHClient
+        :return: paramiko.SSHClient, must be given back with `release`
+        """
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is None:
+                entry = self._connections[key] = _PooledConnection()
+            entry.borrowers += 1
+            self._connections.move_to_end(key)
+
+        # Connection is established under its own lock, so executors do not
+        # wait for handshakes with other hosts
+        with entry.lock:
+            if entry.is_active():
+                self._count('hits')
+                return entry.client
+
+            if entry.client is not None:
+                entry.client.close()
+                entry.client = None
+                self._count('reconnects')
+            self._count('misses')
+
+            try:
+                entry.client = connect()
+            except Exception:
+                self.release(key)
+                raise
+
+            return entry.client
+
+    def release(self, key):
+        """Gives back connection, borrowed with `acquire`"""
+        with self._lock:
+            entry = self._connections[key]
+            entry.borrowers -= 1
+            entry.last_used = time.monotonic()
+            self._connections.move_to_end(key)
+            evicted = self._collect_evicted()
+
+        for entry in evicted:
+            entry.close()
+
+    def evict_idle(self):
+        """Closes connections idle for longer than `idle_ttl`
+
+        Idle connections are evicted on every `release` anyway, this is
+        useful to free them when pool is not used for a long time.
+        """
+        with self._lock:
+            evicted = self._collect_evicted()
+
+        for entry in evicted:
+            entry.close()
+
+    def stats(self):
+        """:return: dict with pool counters and number of kept connections"""
+        with self._lock:
+            return {
+                'size': len(self._connections),
+                'hits': self.hits,
+                'misses': self.misses,
+                'reconnects': self.reconnects,
+                'evictions': self.evictions,
+            }
+
+    def close(self):
+        """Closes all connections, which are not borrowed at the moment"""
+        with self._lock:
+            evicted = [
+                self._connections.pop(key)
+                for key, entry in list(self._connections.items())
+                if not entry.borrowers
+            ]
+
+        for entry in evicted:
+            entry.close()
+
+    def _collect_evicted(self):
+        """Removes expired and excess connections, must be called under lock
+
+        :return: list of removed entries, to be closed outside the lock
+        """
+        evicted = []
+        expire_before = time.monotonic() - self.idle_ttl
+        excess = len(self._connections) - self.max_size
+
+        for key, entry in list(self._connections.items()):
+            if entry.borrowers:
+                continue
+            if excess > 0 or entry.last_used < expire_before:
+                evicted.append(self._connections.pop(key))
+                excess -= 1
+
+        self.evictions += len(evicted)
+        return evicted
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+class _PooledConnection:
+    """Pooled client and its usage details"""
+    __slots__ = ('client', 'borrowers', 'last_used', 'lock')
+
+    def __init__(self):
+        self.client = None
+        self.borrowers = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def is_active(self):
+        if self.client is None:
+            return False
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+class TelnetSessionPool:
+    """Keeps logged in telnet sessions warm between executors
+
+    Unlike ssh connections, telnet session runs one command at a time, so
+    each session is given to a single executor until it is released. Before
+    being given out again, idle session is checked with a cheap probe.
+
+    Sessions are kept per key (see `TelnetExecutor`), which starts with host
+    and port. At most `max_per_host` sessions are opened to the same host,
+    idle session of other credentials is closed to make place for a new
+    one, executors wait for a free one when all of them are in use. Sessions
+    are closed after `max_commands` commands or `max_age` seconds, idle
+    ones after `idle_ttl` seconds.
+
+    Pool counts its `hits` (idle session was reused), `misses` (new session
+    was opened), `dead` (idle session failed the probe), `recycled` and
+    `evictions` (idle session was closed for other key or by `evict_idle`).
+    """
+    DEFAULT_MAX_PER_HOST = 4
+    DEFAULT_MAX_COMMANDS = 1000
+    DEFAULT_MAX_AGE = 600
+    DEFAULT_IDLE_TTL = 300
+
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST,
+                 max_commands=DEFAULT_MAX_COMMANDS, max_age=DEFAULT_MAX_AGE,
+                 wait_timeout=None, idle_ttl=DEFAULT_IDLE_TTL):
+        """
+        :max_per_host:  - max number of sessions opened to the same host
+        :max_commands:  - session is closed after executing that many
+                          commands, None for no limit
+        :max_age:       - seconds, after which session is closed, None for
+                          no limit
+        :wait_timeout:  - seconds to wait for the free session, when there
+                          are `max_per_host` sessions in use, None to wait
+                          forever
+        :idle_ttl:      - seconds, after which unused session is closed by
+                          `evict_idle`, None for no limit
+        """
+        self.max_per_host = max_per_host
+        self.max_commands = max_commands
+        self.max_age = max_age
+        self.wait_timeout = wait_timeout
+        self.idle_ttl = idle_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.dead = 0
+        self.recycled = 0
+        self.evictions = 0
+
+        self._available = threading.Condition()
+        # key -> list of idle sessions, most recently used last
+        self._idle = {}
+        # session -> _PooledSession
+        self._sessions = {}
+        # (host, port) -> number of opened sessions, both idle and in use
+        self._opened = Counter()
+
+    def acquire(self, key, connect, probe):
+        """Takes idle session or opens a new one
+
+        :key:     - tuple, which starts with host and port
+        :connect: - function, which returns logged in session
+        :probe:   - function, which takes session and returns whether it is
+                    still usable
+        :return: session, must be given back with `release`
+        """
+        while True:
+            session = self._take(key)
+            if session is None:
+                break
+
+            if not self._is_expired(session) and probe(session):
+                with self._available:
+                    self.hits += 1
+                return session
+
+            with self._available:
+                self.dead += 1
+            self._discard(key, session)
+
+        try:
+            session = connect()
+        except Exception:
+            with self._available:
+                self._opened[key[:2]] -= 1
+                self._available.notify()
+            raise
+
+        with self._available:
+            self.misses += 1
+            self._sessions[session] = _PooledSession()
+        return session
+
+    def release(self, key, session, commands=0):
+        """Gives back session taken with `acquire`
+
+        :commands: - number of commands, executed in session since `acquire`
+        """
+        with self._available:
+            self._sessions[session].commands += commands
+            self._sessions[session].last_used = time.monotonic()
+            expired = self._is_expired(session)
+            if expired:
+                self.recycled += 1
+            else:
+                self._idle.setdefault(key, []).append(session)
+                self._available.notify()
+
+        if expired:
+            self._discard(key, session)
+
+    def stats(self):
+        """:return: dict with pool counters and number of opened sessions"""
+        with self._available:
+            return {
+                'opened': sum(self._opened.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'dead': self.dead,
+                'recycled': self.recycled,
+                'evictions': self.evictions,
+            }
+
+    def evict_idle(self):
+        """Closes idle sessions, unused for longer than `idle_ttl` or older
+        than `max_age`
+
+        Useful for long running processes, e.g. the agent, which otherwise
+        keep idle sessions to hosts, which are not used anymore.
+        """
+        now = time.monotonic()
+        evicted = []
+        with self._available:
+            for key, sessions in list(self._idle.items()):
+                for session in list(sessions):
+                    pooled = self._sessions[session]
+                    if self._is_expired(session) or (
+                            self.idle_ttl is not None
+                            and now - pooled.last_used >= self.idle_ttl):
+                        sessions.remove(session)
+                        evicted.append((key, session))
+                if not sessions:
+                    del self._idle[key]
+            self.evictions += len(evicted)
+
+        for key, session in evicted:
+            self._discard(key, session)
+
+    def close(self):
+        """Closes all idle sessions"""
+        with self._available:
+            idle = self._idle
+            self._idle = {}
+
+        for key, sessions in idle.items():
+            for session in sessions:
+                self._discard(key, session)
+
+    def _take(self, key):
+        """Pops idle session for the key or reserves place for a new one
+
+        :return: idle session or None, if new session should be opened
+        """
+        host = key[:2]
+        with self._available:
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    return idle.pop()
+
+                if self._opened[host] < self.max_per_host:
+                    self._opened[host] += 1
+                    return None
+
+                # Idle sessions of other credentials would never be given
+                # to this key, so waiting for them is pointless
+                victim = self._pop_idle_of_host(host)
+                if victim is not None:
+                    self.evictions += 1
+                    break
+
+                if not self._available.wait(self.wait_timeout):
+                    raise ValueError(
+                        f'No free telnet sessions to {host[0]}:{host[1]}')
+
+        # Place of the closed session is taken by the new one
+        _close_session(victim)
+        return None
+
+    def _pop_idle_of_host(self, host):
+        """Removes least recently used idle session to the host, must be
+        called under the lock
+
+        :return: session, which still counts as opened, or None
+        """
+        candidates = [
+            (self._sessions[sessions[0]].last_used, key)
+            for key, sessions in self._idle.items()
+            if key[:2] == host and sessions
+        ]
+        if not candidates:
+            return None
+        _, key = min(candidates)
+        session = self._idle[key].pop(0)
+        if not self._idle[key]:
+            del self._idle[key]
+        del self._sessions[session]
+        return session
+
+    def _discard(self, key, session):
+        """Closes session and frees its place"""
+        with self._available:
+            self._sessions.pop(session, None)
+            self._opened[key[:2]] -= 1
+            self._available.notify()
+
+        _close_session(session)
+
+    def _is_expired(self, session):
+        pooled = self._sessions[session]
+        if (self.max_commands is not None
+                and pooled.commands >= self.max_commands):
+            return True
+        return (self.max_age is not None
+                and time.monotonic() - pooled.created >= self.max_age)
+
+
+class _PooledSession:
+    """Usage details of the pooled session"""
+    __slots__ = ('created', 'last_used', 'commands')
+
+    def __init__(self):
+        self.created = self.last_used = time.monotonic()
+        self.commands = 0
+
+
+def _close_session(session):
+    try:
+        session.close()
+    except OSError:
+        pass
+
+
+# Process-wide pools, pass them to executors to share connections
+ssh_pool = SSHConnectionPool()
+telnet_pool = TelnetSessionPool()
@@ -0,0 +1,77 @@
+import importlib
+
+# Third party packages register their executors under this entry point
+# group, e.g. in setup.cfg:
+#     [options.entry_points]
+#     mcduck.executors =
+#         winrm = mcduck_winrm:WinRMExecutor
+ENTRY_POINT_GROUP = 'mcduck.executors'
+
+BUILTIN_EXECUTORS = {
+    'local': 'executors.local:LocalExecutor',
+    'ssh': 'executors.ssh:SSHExecutor',
+    'telnet': 'executors.telnet:TelnetExecutor',
+}
+
+
+class ExecutorRegistry:
+    """Maps executor names to classes, which are imported on first use
+
+    Executors are registered by `module:attribute` path, so their backends,
+    e.g. paramiko, are imported only when the executor is actually needed.
+    Names, which are not registered, are looked up among installed plugins
+    (see ENTRY_POINT_GROUP).
+
+        SSHExecutor = registry.get('ssh')
+    """
+
+    def __init__(self, executors=None):
+        """
+        :executors: - dict, name -> `module:attribute` path or class
+        """
+        self._executors = dict(BUILTIN_EXECUTORS if executors is None
+                               else executors)
+        self._discovered = False
+
+    def register(self, name, executor):
+        """:executor: - `module:attribute` path or class"""
+        self._executors[name] = executor
+
+    def names(self):
+        """:return: sorted names of all executors, including plugins"""
+        self.discover()
+        return sorted(self._executors)
+
+    def get(self, name):
+        """:return: executor class, raises ValueError for unknown name"""
+        if name not in self._executors:
+            self.discover()
+        if name not in self._executors:
+            raise ValueError(f'Unknown executor: {name}')
+
+        executor = self._executors[name]
+        if isinstance(executor, str):
+            module_name, _, attribute = executor.partition(':')
+            executor = getattr(importlib.import_module(module_name),
+                               attribute)
+            self._executors[name] = executor
+        return executor
+
+    def discover(self):
+        """Registers executors of installed plugins, once
+
+        Plugins are not imported here, only their paths are read. Builtin
+        and explicitly registered executors are not overridden.
+        """
+        if self._discovered:
+            return
+        self._discovered = True
+
+        # Reading package metadata is slow, so it is done only when needed
+        from importlib.metadata import entry_points
+
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            self._executors.setdefault(entry_point.name, entry_point.value)
+
+
+registry = ExecutorRegistry()
\ No newline at end of file
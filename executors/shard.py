@@ -0,0 +1,326 @@
+"""Fans out over many worker processes, for fleets too large for one
+
+paramiko does its crypto and packet handling in Python, under the GIL, so
+threads of a single process stop scaling at a few hundred hosts.
+sharded_fan_out runs fan_out in `processes` worker processes, each with its
+own connections and `concurrency` threads:
+
+    for target, result, err in sharded_fan_out(hosts, run_on, processes=8,
+                                               concurrency=128):
+        ...
+
+Targets are handed out in batches, as workers report results, so fast
+workers get more of them. Once all targets are handed out, targets still
+queued in a worker, which fell behind, are taken back and given to the idle
+ones. Results come back over pipes as compact frames with raw outputs, see
+encode_result, rather than as pickled objects.
+"""
+import math
+import multiprocessing
+import pickle
+import queue
+import struct
+import threading
+
+from multiprocessing.connection import wait
+
+from executors.base import CommandResult, raw_result
+from executors.fanout import fan_out
+
+# Frames sent to workers, first byte is the kind
+TARGETS = b'T'
+STEAL = b'S'
+STOP = b'X'
+# Frames sent by workers
+RESULT = b'R'
+OBJECT = b'O'
+ERROR = b'E'
+RETURNED = b'B'
+
+# kind, index of the target, result code, stdout and stderr lengths, length
+# of the encoding name, followed by the encoding name, stdout and stderr
+RESULT_HEADER = struct.Struct('!cIiIIB')
+# kind, index of the target, followed by pickled result or error
+INDEX_HEADER = struct.Struct('!cI')
+
+
+def sharded_fan_out(targets, task, processes, concurrency, timeout=None,
+                    deadlines=False, context=None):
+    """Runs task for every target in worker processes, yields results as
+    they come
+
+    Same as fan_out, but `concurrency` tasks run in each of the `processes`
+    workers. Task and targets are passed to workers, so with `spawn` start
+    method they must be picklable. Results, which are (code, stdout, stderr),
+    come as CommandResult, other ones are pickled. Exceptions, which can't be
+    pickled, come as RuntimeError with the original type name. Targets of the
+    worker, which died, are reported as failed with ChildProcessError.
+
+    :targets:     iterable of targets, e.g. connection strings
+    :task:        function, which takes target and returns the result
+    :processes:   number of worker processes
+    :concurrency: max number of tasks running at once in each worker
+    :timeout:     seconds given to each task, see fan_out
+    :deadlines:   if set, task also takes Deadline, see fan_out
+    :context:     multiprocessing context, `fork` one where available, as
+                  it does not need to pickle the task
+    :return: generator of (target, result, error), error is None on success
+    """
+    pending = list(enumerate(targets))
+    if not pending:
+        return
+    # Taken from the end, so first targets go first
+    pending.reverse()
+    if context is None:
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in multiprocessing.get_all_start_methods()
+            else None)
+
+    workers = [
+        _Worker(context, task, concurrency, timeout, deadlines)
+        for _ in range(min(processes, len(pending)))
+    ]
+    try:
+        yield from _Scheduler(workers, pending, concurrency).run()
+    finally:
+        for worker in workers:
+            worker.close()
+
+
+class _Worker:
+    """Worker process and the parent's ends of its pipes"""
+
+    def __init__(self, context, task, concurrency, timeout, deadlines):
+        inbox, self.inbox = context.Pipe(duplex=False)
+        self.outbox, outbox = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=work,
+            args=(inbox, outbox, task, concurrency, timeout, deadlines),
+            daemon=True,
+        )
+        self.process.start()
+        # Worker's ends are used by the worker only
+        inbox.close()
+        outbox.close()
+
+        # index -> target, handed to the worker and not reported yet
+        self.assigned = {}
+        self.stealing = False
+
+    def send(self, frame):
+        self.inbox.send_bytes(frame)
+
+    def close(self):
+        try:
+            self.send(STOP)
+        except OSError:
+            # Worker is already gone
+            pass
+        self.inbox.close()
+        self.outbox.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            # Stuck with hung tasks, which were already reported
+            self.process.kill()
+            self.process.join()
+
+
+class _Scheduler:
+    """Hands targets out to workers and collects their results"""
+
+    def __init__(self, workers, pending, concurrency):
+        """
+        :workers:     - list of _Worker
+        :pending:     - list of (index, target) not handed out yet, from
+                        the last to the first one
+        :concurrency: - number of tasks running at once in each worker
+        """
+        self.workers = workers
+        self.pending = pending
+        self.concurrency = concurrency
+        # Worker gets more targets, once it has as many as it runs at once,
+        # so it always has the next ones queued
+        self.prefetch = 2 * concurrency
+
+    def run(self):
+        """:return: generator of (target, result, error)"""
+        live = {worker.outbox: worker for worker in self.workers}
+        remaining = len(self.pending)
+        self.dispatch(live.values())
+
+        while remaining:
+            for outbox in wait(list(live)):
+                worker = live[outbox]
+                try:
+                    frame = outbox.recv_bytes()
+                except (EOFError, OSError):
+                    del live[outbox]
+                    error = ChildProcessError(
+                        f'Worker process exited with code '
+                        f'{worker.process.exitcode}')
+                    for index in list(worker.assigned):
+                        remaining -= 1
+                        yield worker.assigned.pop(index), None, error
+                    if not live:
+                        # Nobody is left to run the rest
+                        for _, target in reversed(self.pending):
+                            remaining -= 1
+                            yield target, None, error
+                        self.pending.clear()
+                    continue
+
+                if frame[:1] == RETURNED:
+                    worker.stealing = False
+                    returned = pickle.loads(frame[1:])
+                    for index, _ in returned:
+                        del worker.assigned[index]
+                    # Given out before the rest of pending ones
+                    self.pending.extend(reversed(returned))
+                else:
+                    index, result, error = decode_result(frame)
+                    remaining -= 1
+                    yield worker.assigned.pop(index), result, error
+            self.dispatch(live.values())
+
+    def dispatch(self, workers):
+        """Hands pending targets to workers with free slots first, then to
+        the ones about to run out of queued targets. Once there are no
+        pending targets, takes queued ones back from the slowest worker for
+        the idle ones"""
+        workers = sorted(workers, key=lambda worker: len(worker.assigned))
+        for limit in (self.concurrency, self.prefetch):
+            # Leaves some targets for the other workers
+            share = math.ceil(len(self.pending) / len(workers or [None]))
+            for worker in workers:
+                assigned = len(worker.assigned)
+                if assigned > self.concurrency:
+                    continue
+                batch = [
+                    self.pending.pop()
+                    for _ in range(min(limit - assigned, share,
+                                       len(self.pending)))
+                ]
+                if batch:
+                    worker.assigned.update(batch)
+                    worker.send(TARGETS + pickle.dumps(batch))
+
+        if (workers and not self.pending
+                and len(workers[0].assigned) < self.concurrency
+                and not any(worker.stealing for worker in workers)):
+            # Worker runs `concurrency` of its targets, the rest are queued
+            victim = workers[-1]
+            if len(victim.assigned) > self.concurrency:
+                victim.stealing = True
+                victim.send(STEAL)
+
+
+def work(inbox, outbox, task, concurrency, timeout, deadlines):
+    """Runs in the worker process, runs targets sent to inbox, sends results
+    to outbox, until STOP frame comes"""
+    queued = queue.Queue()
+    send_lock = threading.Lock()
+
+    def send(frame):
+        with send_lock:
+            outbox.send_bytes(frame)
+
+    def read():
+        while True:
+            try:
+                frame = inbox.recv_bytes()
+            except EOFError:
+                frame = STOP
+
+            kind = frame[:1]
+            if kind == TARGETS:
+                for item in pickle.loads(frame[1:]):
+                    queued.put(item)
+            elif kind == STEAL:
+                returned = []
+                while True:
+                    try:
+                        item = queued.get_nowait()
+                    except queue.Empty:
+                        break
+                    returned.append(item)
+                send(RETURNED + pickle.dumps(returned))
+            else:
+                queued.put(None)
+                return
+
+    threading.Thread(target=read, daemon=True).start()
+
+    def run(item, *deadline):
+        _, target = item
+        return task(target, *deadline)
+
+    for (index, _), result, error in fan_out(iter(queued.get, None), run,
+                                             concurrency, timeout,
+                                             deadlines=deadlines):
+        if error is None:
+            send(encode_result(index, result))
+        else:
+            send(encode_error(index, error))
+
+
+def encode_result(index, result):
+    """:return: frame with result of the target with given index"""
+    if not _is_command_result(result):
+        return INDEX_HEADER.pack(OBJECT, index) + pickle.dumps(result)
+
+    # Sent as received, without decoding, unless cut
+    code, stdout, stderr, encoding = raw_result(result)
+    encoding = encoding.encode()
+    return b''.join((
+        RESULT_HEADER.pack(RESULT, index, code, len(stdout), len(stderr),
+                           len(encoding)),
+        encoding, stdout, stderr,
+    ))
+
+
+def encode_error(index, error):
+    """:return: frame with exception, raised for the target with given
+    index"""
+    try:
+        payload = pickle.dumps(error)
+        # Some exceptions pickle, but fail to unpickle, e.g. ones with
+        # required keyword arguments
+        pickle.loads(payload)
+    except Exception:
+        payload = pickle.dumps(RuntimeError(f'{type(error).__name__}: '
+                                            f'{error}'))
+    return INDEX_HEADER.pack(ERROR, index) + payload
+
+
+def decode_result(frame):
+    """:return: (index of the target, result, error) from the frame of
+    RESULT, OBJECT or ERROR kind"""
+    kind = frame[:1]
+    if kind != RESULT:
+        _, index = INDEX_HEADER.unpack_from(frame)
+        payload = pickle.loads(memoryview(frame)[INDEX_HEADER.size:])
+        if kind == ERROR:
+            return index, None, payload
+        return index, payload, None
+
+    _, index, code, stdout_size, stderr_size, encoding_size = (
+        RESULT_HEADER.unpack_from(frame))
+    start = RESULT_HEADER.size
+    encoding = frame[start:start + encoding_size].decode()
+    start += encoding_size
+
+    # Outputs are slices of the frame, not copies
+    view = memoryview(frame)
+    stdout = view[start:start + stdout_size]
+    start += stdout_size
+    stderr = view[start:start + stderr_size]
+    return index, CommandResult(code, stdout, stderr, encoding), None
+
+
+def _is_command_result(result):
+    """:return: True, if result is (code, stdout, stderr) of text outputs"""
+    if isinstance(result, CommandResult):
+        return isinstance(result.code, int)
+    return (isinstance(result, tuple) and len(result) == 3
+            and isinstance(result[0], int) and isinstance(result[1], str)
+            and isinstance(result[2], str))
\ No newline at end of file
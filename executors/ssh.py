@@ -1,9 +1,24 @@
 import base64
+import hashlib
+import select
+import socket
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
 import paramiko
 
 from socket import gaierror
 
-from executors.base import BaseExecutor
+from executors.base import (
+    BaseExecutor,
+    CommandResult,
+    ExecutionResult,
+    STDOUT,
+    STDERR,
+    input_chunks,
+)
 
 
 class SSHExecutor(BaseExecutor):
@@ -12,13 +27,35 @@ class SSHExecutor(BaseExecutor):
     Before running `execute`, to actually execute command, please run `connect`
     method to establish connection. And don't forget to `disconnect` when you
     are done. Or just use context manager with the instance.
+
+    If `pool` is passed (see executors.pool), `connect` borrows connection
+    from it instead of opening a new one, and `disconnect` gives it back.
+
+    If `capture` policy is passed (see executors.capture), outputs are read
+    into its sinks and `execute` returns ExecutionResult. Channel is closed as
+    soon as any output exceeds policy's `max_bytes`, which stops the command,
+    its result code is -1 then.
+
+    `connect` and `execute` may be bounded by `deadline` (see
+    executors.deadline), which also lets other threads cancel them.
+
+    `stdin` is sent into the channel by its own thread, as the channel
+    window allows, while outputs are drained, so neither side stalls.
     """
 
     SSH_PORT = paramiko.client.SSH_PORT
     DEFAULT_ENCODING = 'utf-8'
+    # Max size of the single chunk read from the channel
+    CHUNK_SIZE = 32768
+    # Seconds to wait for the channel activity before rechecking its state
+    POLL_INTERVAL = 0.1
+    # OpenSSH allows 10 sessions per connection by default (see MaxSessions)
+    DEFAULT_MAX_CHANNELS = 10
 
     def __init__(self, host, user=None, key_path=None, password=None, passphrase=None,
-                 port=SSH_PORT, encoding=DEFAULT_ENCODING):
+                 port=SSH_PORT, encoding=DEFAULT_ENCODING,
+                 max_channels=DEFAULT_MAX_CHANNELS, pool=None, timeout=None,
+                 capture=None):
         self.host = host
         self.user = user
         self.key_path = key_path
@@ -27,40 +64,235 @@ class SSHExecutor(BaseExecutor):
         self.port = port
 
         self.encoding = encoding
+        self.capture = capture
+        # Seconds to wait for TCP connect, ssh banner and auth each
+        self.timeout = timeout
+
+        # Limits channels, opened at once by `submit` and `execute_many`
+        self.max_channels = max_channels
+        self._workers = None
+
+        self.pool = pool
+        self._borrowed = False
+
+        self.client = self._new_client()
+
+    def connect(self, deadline=None):
+        """Opens connection or borrows it from the pool
 
-        self.client = paramiko.SSHClient()
+        :deadline: - Deadline, bounding connection and auth together
+        """
+        if self.pool is None:
+            self._connect_client(self.client, deadline)
+            return
+        if self._borrowed:
+            return
+
+        with self._phase('connect.pool_acquire'):
+            self.client = self.pool.acquire(
+                self.pool_key(), lambda: self._open_pooled_client(deadline))
+        self._borrowed = True
+
+    def pool_key(self):
+        """Identifies connection in the pool by host and credentials
+
+        Password is hashed, so it is not kept in the pool as is.
+        """
+        password_hash = None
+        if self.password:
+            password_hash = hashlib.sha256(
+                self.password.encode(self.encoding)).hexdigest()
+        return (self.host, self.port, self.user, self.key_path, password_hash)
+
+    def _new_client(self):
+        client = paramiko.SSHClient()
         # Will ignore Unknow host key
-        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        return client
+
+    def _open_pooled_client(self, deadline=None):
+        client = self._new_client()
+        self._connect_client(client, deadline)
+        return client
 
-    def connect(self):
+    def _connect_client(self, client, deadline=None):
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = deadline.remaining(timeout)
         try:
-            self.client.connect(
-                self.host,
-                port=self.port,
-                username=self.user,
-                password=self.password,
-                key_filename=self.key_path,
-                passphrase=self.passphrase,
-            )
+            sock = self._open_socket(self.host, self.port, timeout)
         except gaierror as err:
             raise ValueError(f"Failed to connect to {self.host}:\n{err}")
+
+        # paramiko takes timeout for each step of the handshake, so the
+        # socket is shut down once the deadline passes
+        watch = nullcontext() if deadline is None else deadline.watch(
+            lambda: _shutdown(sock))
+        try:
+            with self._phase('connect.handshake'), watch:
+                client.connect(
+                    self.host,
+                    sock=sock,
+                    port=self.port,
+                    username=self.user,
+                    password=self.password,
+                    key_filename=self.key_path,
+                    passphrase=self.passphrase,
+                    timeout=timeout,
+                    banner_timeout=timeout,
+                    auth_timeout=timeout,
+                )
         except (paramiko.ssh_exception.AuthenticationException, 
                 paramiko.ssh_exception.BadAuthenticationType,
                 paramiko.ssh_exception.PartialAuthentication,
                 paramiko.ssh_exception.PasswordRequiredException) as err:
             raise ValueError(f"Failder to auth at {self.host}:\n{err}")
-
+        except Exception:
+            if deadline is not None:
+                # Failure caused by the shut down socket is reported as such
+                deadline.check()
+            raise
 
     def disconnect(self):
-        self.client.close()
+        if self._workers is not None:
+            self._workers.shutdown()
+            self._workers = None
+
+        if self.pool is None:
+            self.client.close()
+        elif self._borrowed:
+            self._borrowed = False
+            self.pool.release(self.pool_key())
+            self.client = self._new_client()
 
-    def execute(self, command, parameters=None):
+    def execute(self, command, parameters=None, deadline=None, *,
+                stdin=None):
         """Initiates command execution
 
+        Both stdout and stderr are drained while command runs, so output of
+        any size will not stall the channel.
+
         :command: string, command to execute
         :parameters: tuple, params for command
+        :deadline: Deadline, bounding the execution
+        :stdin: bytes, binary file object or iterable of bytes chunks
         :return: result code, stdout, stderr
         """
+        if self.capture is not None:
+            return self._execute_captured(command, parameters, deadline,
+                                          stdin)
+
+        chunks = {STDOUT: [], STDERR: []}
+        stream = self.execute_stream(command, parameters, deadline, stdin)
+        started = self._now()
+        first_chunk = None
+        for name, chunk in stream:
+            if first_chunk is None and started is not None:
+                first_chunk = self._now()
+            chunks[name].append(chunk)
+        self._emit_run(started, first_chunk, sum(
+            len(chunk) for chunk in chunks[STDOUT] + chunks[STDERR]))
+
+        return CommandResult(stream.code, b''.join(chunks[STDOUT]),
+                             b''.join(chunks[STDERR]), self.encoding)
+
+    def _emit_run(self, started, first_chunk, nbytes):
+        """Reports time till the first output and transfer of the rest
+
+        Output of the command, which prints as it goes, is transferred while
+        it runs, so `execute.transfer` includes its remaining runtime then.
+        """
+        if started is None:
+            return
+        finished = self._now()
+        if first_chunk is None:
+            first_chunk = finished
+        self._emit('execute.wait', started, first_chunk)
+        self._emit('execute.transfer', first_chunk, finished, nbytes)
+
+    def _execute_captured(self, command, parameters, deadline=None,
+                          stdin=None):
+        """Executes command, passing its outputs through capture sinks
+
+        :return: ExecutionResult
+        """
+        sinks = {STDOUT: self.capture.new_sink(),
+                 STDERR: self.capture.new_sink()}
+        stream = self.execute_stream(command, parameters, deadline, stdin)
+        started = self._now()
+        first_chunk = None
+        for name, chunk in stream:
+            if first_chunk is None and started is not None:
+                first_chunk = self._now()
+            if not sinks[name].write(chunk):
+                stream.close()
+                break
+        self._emit_run(started, first_chunk, sinks[STDOUT].received
+                       + sinks[STDERR].received)
+
+        code = -1 if stream.code is None else stream.code
+        return ExecutionResult(code, sinks[STDOUT], sinks[STDERR],
+                               self.encoding, self.capture.name)
+
+    def submit(self, command, parameters=None, deadline=None, *,
+               stdin=None):
+        """Schedules command execution in its own channel
+
+        All channels share the connection opened by `connect`, at most
+        `max_channels` of them are opened at once, the rest of the commands
+        wait for the running ones to finish.
+
+        :command: string, command to execute
+        :parameters: tuple, params for command
+        :deadline: Deadline, bounding the execution, including the wait for
+                   the free channel
+        :stdin: bytes, binary file object or iterable of bytes chunks
+        :return: concurrent.futures.Future with result code, stdout, stderr
+        """
+        if self._workers is None:
+            self._workers = ThreadPoolExecutor(
+                max_workers=self.max_channels,
+                thread_name_prefix=f'ssh-{self.host}',
+            )
+        return self._workers.submit(self.execute, command, parameters,
+                                    deadline, stdin=stdin)
+
+    def execute_many(self, commands, deadline=None):
+        """Executes commands in parallel channels
+
+        :commands: iterable of commands, each is either string or
+                   `(command, parameters)` tuple
+        :deadline: Deadline, bounding the whole batch
+        :return: list of (result code, stdout, stderr), in order of commands
+        """
+        futures = [
+            self.submit(command, None, deadline) if isinstance(command, str)
+            else self.submit(*command, deadline=deadline)
+            for command in commands
+        ]
+        return [future.result() for future in futures]
+
+    def execute_stream(self, command, parameters=None, deadline=None,
+                       stdin=None):
+        """Initiates command execution and streams its output
+
+        Returned iterator yields `(stream, chunk)` pairs, where stream is
+        either `executors.base.STDOUT` or `executors.base.STDERR` and chunk is
+        raw bytes, in the order they arrive. When iterator is exhausted, exit
+        code of the command is available as its `code` attribute:
+
+            stream = executor.execute_stream('cat', ('/var/log/syslog',))
+            for name, chunk in stream:
+                ...
+            print(stream.code)
+
+        :command: string, command to execute
+        :parameters: tuple, params for command
+        :deadline: Deadline, bounding opening of the channel and iteration
+        :stdin: bytes, binary file object or iterable of bytes chunks, sent
+                while the output is iterated over
+        :return: OutputStream
+        """
         transport = self.client.get_transport()
         if transport is None or not transport.is_active():
             raise ValueError(f"Transport must be opened to execute commands")
@@ -68,16 +300,15 @@ class SSHExecutor(BaseExecutor):
         if parameters:
             command = command + ' ' + ' '.join(parameters)
 
-        channel = self.client.get_transport().open_session()
-        channel.exec_command(command)
-
-        code = channel.recv_exit_status()
-        stdout = channel.makefile().read().decode(self.encoding)
-        stderr = channel.makefile_stderr().read().decode(self.encoding)
-
-        channel.close()
+        with self._phase('execute.channel_open'):
+            if deadline is None:
+                channel = transport.open_session()
+            else:
+                channel = transport.open_session(timeout=deadline.remaining())
+            channel.exec_command(command)
 
-        return code, stdout, stderr
+        return OutputStream(channel, self.CHUNK_SIZE, self.POLL_INTERVAL,
+                            deadline, stdin)
 
     def __enter__(self):
         self.connect()
@@ -88,4 +319,117 @@ class SSHExecutor(BaseExecutor):
 
     def __del__(self):
         # Just in case
-        self.disconnect()
\ No newline at end of file
+        self.disconnect()
+
+
+class OutputStream:
+    """Iterates over output chunks of the command running in the channel
+
+    stdout and stderr are read as soon as any data is available in either of
+    them, so the remote side never waits for the channel window to be freed.
+    Channel is closed when the command finishes or the iteration is stopped.
+
+    Iteration raises DeadlineExceeded or ExecutionCancelled as soon as the
+    `deadline` passes or is cancelled, at most `poll_interval` later.
+
+    `stdin` is sent by StdinSender from the moment the stream is created.
+    Iteration raises the error of reading stdin, if any, once the channel is
+    closed by it.
+    """
+
+    def __init__(self, channel, chunk_size, poll_interval, deadline=None,
+                 stdin=None):
+        self.channel = channel
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.deadline = deadline
+        # Exit code of the command, set when output is exhausted
+        self.code = None
+        self.sender = None if stdin is None else StdinSender(channel, stdin)
+
+    def __iter__(self):
+        channel = self.channel
+        try:
+            while True:
+                poll_interval = self.poll_interval
+                if self.deadline is not None:
+                    poll_interval = self.deadline.remaining(poll_interval)
+                # Channel's fileno becomes readable on data in any stream or
+                # on EOF, timeout guards against missed wakeups
+                select.select([channel], [], [], poll_interval)
+
+                while channel.recv_ready():
+                    yield STDOUT, channel.recv(self.chunk_size)
+                while channel.recv_stderr_ready():
+                    yield STDERR, channel.recv_stderr(self.chunk_size)
+
+                if self._is_drained():
+                    break
+
+            if self.sender is not None and self.sender.error is not None:
+                raise self.sender.error
+            self.code = channel.recv_exit_status()
+        finally:
+            channel.close()
+
+    def close(self):
+        """Stops reading and closes the channel, stopping the command"""
+        self.channel.close()
+
+    def _is_drained(self):
+        """Checks whether command finished and all its output was read"""
+        channel = self.channel
+        finished = ((channel.exit_status_ready() and channel.eof_received)
+                    or channel.closed)
+        return (finished
+                and not channel.recv_ready()
+                and not channel.recv_stderr_ready())
+
+
+class StdinSender:
+    """Sends stdin into the channel from its own thread
+
+    `sendall` blocks while the channel window is full, until the command
+    reads what was sent, so stdin is read no faster than it is consumed.
+    Outputs are drained meanwhile by the thread iterating the OutputStream.
+    """
+
+    def __init__(self, channel, stdin):
+        # Exception, raised by reading stdin, the channel is closed then
+        self.error = None
+        self.thread = threading.Thread(target=self._send,
+                                       args=(channel, stdin), daemon=True)
+        self.thread.start()
+
+    def _send(self, channel, stdin):
+        chunks = input_chunks(stdin)
+        while True:
+            try:
+                chunk = next(chunks, None)
+            except Exception as err:
+                # I/O errors of stdin too, the command must not wait for
+                # the rest of it
+                self.error = err
+                channel.close()
+                return
+            if chunk is None:
+                break
+            try:
+                channel.sendall(chunk)
+            except OSError:
+                # Channel was closed, the command finished or was stopped
+                return
+
+        try:
+            # Command gets EOF on stdin
+            channel.shutdown_write()
+        except OSError:
+            pass
+
+
+def _shutdown(sock):
+    """Interrupts blocking calls on the socket from another thread"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
\ No newline at end of file
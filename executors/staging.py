@@ -0,0 +1,371 @@
+"""Stages scripts on ssh hosts once, runs staged copies afterwards
+
+Large scripts, sent as commands, cost their whole size on the wire and their
+parsing by the remote shell on every run. ScriptStager uploads the script
+over SFTP, on the connection of the executor, to the remote cache directory,
+named by the SHA-256 of its content, and runs it from there:
+
+    stager = ScriptStager(SSHExecutor('10.0.0.1', user='admin'))
+    with stager.executor:
+        return_code, stdout, stderr = stager.execute(script, ('--check',))
+
+Local index remembers scripts each host already has, so later runs send only
+a short command, which checks that the file is there and executes it. Index
+is a hint: scripts, which disappeared from the host, are uploaded again.
+
+Every run touches the staged file, so its modification time tells when it was
+used last, by any client. Once the cache directory has more than
+`max_scripts` scripts or `max_bytes` of them, least recently used ones are
+removed, when the next script is uploaded.
+"""
+import hashlib
+import json
+import os
+import re
+import shlex
+import stat
+import threading
+import time
+import uuid
+
+from collections import Counter
+
+from executors.base import STDIN_CHUNK_SIZE, CommandResult
+
+# Relative to the home directory of the remote user, like both SFTP and
+# commands of the session
+DEFAULT_DIRECTORY = '.cache/mcduck/scripts'
+DEFAULT_MAX_SCRIPTS = 256
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+
+# Result of the run, which found no staged script
+MISSING_CODE = 127
+MISSING_MESSAGE = 'mcduck: script is not staged'
+
+# Uploads, left by interrupted runs, are removed after this many seconds
+STALE_UPLOAD_AGE = 3600
+
+_SCRIPT_NAME = re.compile(r'[0-9a-f]{64}')
+
+
+def default_index_path():
+    """:return: path of the index file in the user's cache directory"""
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join('~', '.cache')
+    return os.path.join(os.path.expanduser(cache), 'mcduck', 'staged.json')
+
+
+class StagingIndex:
+    """Scripts staged on each host, kept in JSON file
+
+    Hosts are keyed as `user@host:port`. File is rewritten on every change,
+    the last of concurrent writers wins, which is harmless: missing entry
+    costs an upload, stale one costs a failed run, which uploads the script.
+    """
+
+    def __init__(self, path=None):
+        """
+        :path: - path of the index file, index is kept in memory if not set
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # host key -> set of digests
+        self._scripts = {}
+        if path is not None:
+            self._load()
+
+    def has(self, host, digest):
+        with self._lock:
+            return digest in self._scripts.get(host, ())
+
+    def add(self, host, digest):
+        with self._lock:
+            scripts = self._scripts.setdefault(host, set())
+            if digest in scripts:
+                return
+            scripts.add(digest)
+            self._save()
+
+    def discard(self, host, digests=None):
+        """Forgets scripts of the host
+
+        :digests: - iterable of digests to forget, all if not set
+        """
+        with self._lock:
+            scripts = self._scripts.get(host)
+            if not scripts:
+                return
+            if digests is None:
+                scripts.clear()
+            else:
+                scripts.difference_update(digests)
+            if not scripts:
+                del self._scripts[host]
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.path) as index_file:
+                document = json.load(index_file)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            # Cut by the crash, scripts will be uploaded again
+            return
+        self._scripts = {host: set(digests)
+                         for host, digests in document.items()}
+
+    def _save(self):
+        """Replaces index file atomically, must be called under the lock"""
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as index_file:
+            json.dump({host: sorted(digests)
+                       for host, digests in self._scripts.items()},
+                      index_file)
+        os.replace(temporary, self.path)
+
+
+class ScriptStager:
+    """Runs scripts from the cache directory of the ssh host, see module
+    docstring
+
+    Stager counts runs of already staged scripts (`hits`), uploads
+    (`uploads`), of them ones of scripts, which the index wrongly listed
+    (`restaged`), and scripts removed from the host (`collected`).
+    """
+
+    def __init__(self, executor, index=None, directory=DEFAULT_DIRECTORY,
+                 max_scripts=DEFAULT_MAX_SCRIPTS, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :executor:    - SSHExecutor, connected before scripts are run
+        :index:       - StagingIndex, shared by stagers, one in the file at
+                        `default_index_path()` if not set
+        :directory:   - remote cache directory, relative to the home
+                        directory of the user, or absolute
+        :max_scripts: - max number of scripts kept in the remote directory
+        :max_bytes:   - max total size of scripts kept in the remote
+                        directory
+        """
+        self.executor = executor
+        self.index = index or StagingIndex(default_index_path())
+        self.directory = directory.rstrip('/')
+        self.max_scripts = max_scripts
+        self.max_bytes = max_bytes
+
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def host_key(self):
+        """:return: key of the host in the index"""
+        return (f'{self.executor.user or ""}@{self.executor.host}:'
+                f'{self.executor.port}')
+
+    def execute(self, script, parameters=None, deadline=None, *,
+                stdin=None):
+        """Runs the script, uploads it first, if the host does not have it
+
+        Script is executed as a file, so it may start with `#!` line to
+        choose the interpreter, scripts without it are run by `sh`.
+
+        :script: string or bytes, content of the script
+        :parameters: tuple, params for the script
+        :deadline: Deadline, bounding the upload and the execution
+        :stdin: bytes, binary file object or iterable of bytes chunks
+        :return: result code, stdout, stderr
+        """
+        content = self._encode(script)
+        digest = hashlib.sha256(content).hexdigest()
+        host = self.host_key
+
+        staged = self.index.has(host, digest)
+        if staged and not _replayable(stdin):
+            # Streamed stdin can't be sent twice, so the script is checked
+            # before the run instead of after
+            staged = self._exists(digest, deadline)
+            if not staged:
+                self._count('restaged')
+        if not staged:
+            self._upload(content, digest, deadline)
+
+        command = self._command(digest, parameters)
+        result = self.executor.execute(command, deadline=deadline,
+                                       stdin=stdin)
+        if not _is_missing(result):
+            if staged:
+                self._count('hits')
+            return result
+
+        # Removed from the host behind our back
+        self.index.discard(host, (digest,))
+        self._count('restaged')
+        self._upload(content, digest, deadline)
+        return self.executor.execute(command, deadline=deadline, stdin=stdin)
+
+    def stage(self, script, deadline=None):
+        """Uploads the script, if the host does not have it
+
+        :return: remote path of the staged script
+        """
+        content = self._encode(script)
+        digest = hashlib.sha256(content).hexdigest()
+        if not self.index.has(self.host_key, digest):
+            self._upload(content, digest, deadline)
+        return self.path(digest)
+
+    def path(self, digest):
+        """:return: remote path of the script with given SHA-256"""
+        return f'{self.directory}/{digest}'
+
+    def collect(self, deadline=None):
+        """Removes least recently used scripts over the limits
+
+        :return: number of removed scripts
+        """
+        with self._sftp(deadline) as sftp:
+            return self._collect(sftp)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self._counters['hits'],
+                'uploads': self._counters['uploads'],
+                'restaged': self._counters['restaged'],
+                'collected': self._counters['collected'],
+            }
+
+    def _encode(self, script):
+        if isinstance(script, str):
+            return script.encode(self.executor.encoding)
+        return bytes(script)
+
+    def _command(self, digest, parameters=None):
+        """:return: command, which runs the staged script, if it is there"""
+        path = shlex.quote(self.path(digest))
+        run = path
+        if parameters:
+            # Same as for other commands, parameters are passed as is
+            run = run + ' ' + ' '.join(parameters)
+        return (f'if [ -f {path} ]; then touch -c {path}; exec {run}; fi; '
+                f"echo '{MISSING_MESSAGE}' >&2; exit {MISSING_CODE}")
+
+    def _exists(self, digest, deadline=None):
+        with self._sftp(deadline) as sftp:
+            try:
+                sftp.stat(self.path(digest))
+            except FileNotFoundError:
+                return False
+        return True
+
+    def _upload(self, content, digest, deadline=None):
+        """Writes script under temporary name and renames it, so other
+        clients never run partially written script"""
+        path = self.path(digest)
+        temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+        with self._sftp(deadline) as sftp, \
+                self.executor._phase('execute.stage'):
+            _make_directories(sftp, self.directory)
+            with sftp.open(temporary, 'wb') as remote_file:
+                # Does not wait for acknowledgement of each write
+                remote_file.set_pipelined(True)
+                for start in range(0, len(content), STDIN_CHUNK_SIZE):
+                    remote_file.write(content[start:start + STDIN_CHUNK_SIZE])
+            sftp.chmod(temporary, 0o700)
+            sftp.posix_rename(temporary, path)
+            self.index.add(self.host_key, digest)
+            self._count('uploads')
+            self._collect(sftp, keep=digest)
+
+    def _collect(self, sftp, keep=None):
+        """Removes scripts over the limits, least recently used first
+
+        :keep: - digest of the script, which is never removed
+        :return: number of removed scripts
+        """
+        now = time.time()
+        scripts = []
+        for attributes in sftp.listdir_attr(self.directory):
+            name = attributes.filename
+            if _SCRIPT_NAME.fullmatch(name):
+                scripts.append(attributes)
+            elif (name.endswith('.tmp')
+                  and now - attributes.st_mtime > STALE_UPLOAD_AGE):
+                _remove(sftp, f'{self.directory}/{name}')
+
+        # From the most to the least recently used
+        scripts.sort(key=lambda attributes: (attributes.filename == keep,
+                                             attributes.st_mtime),
+                     reverse=True)
+        removed = []
+        total = 0
+        for position, attributes in enumerate(scripts):
+            total += attributes.st_size
+            if attributes.filename != keep and (
+                    position >= self.max_scripts or total > self.max_bytes):
+                _remove(sftp, self.path(attributes.filename))
+                removed.append(attributes.filename)
+
+        if removed:
+            self.index.discard(self.host_key, removed)
+            self._count('collected', len(removed))
+        return len(removed)
+
+    def _sftp(self, deadline=None):
+        """:return: SFTPClient on the executor's connection"""
+        transport = self.executor.client.get_transport()
+        if transport is None or not transport.is_active():
+            raise ValueError(f"Transport must be opened to stage scripts")
+        sftp = self.executor.client.open_sftp()
+        if deadline is not None:
+            sftp.get_channel().settimeout(deadline.remaining())
+        return sftp
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+
+def _make_directories(sftp, directory):
+    """Creates directory with its parents, accessible by the owner only"""
+    try:
+        if stat.S_ISDIR(sftp.stat(directory).st_mode):
+            return
+    except FileNotFoundError:
+        pass
+    parent = os.path.dirname(directory)
+    if parent and parent != directory:
+        _make_directories(sftp, parent)
+    try:
+        sftp.mkdir(directory, 0o700)
+    except OSError:
+        # Created by the concurrent upload
+        if not stat.S_ISDIR(sftp.stat(directory).st_mode):
+            raise
+
+
+def _remove(sftp, path):
+    try:
+        sftp.remove(path)
+    except FileNotFoundError:
+        # Removed by the other client
+        pass
+
+
+def _replayable(stdin):
+    """:return: True, if stdin can be sent again"""
+    return stdin is None or isinstance(stdin, (bytes, bytearray, memoryview))
+
+
+def _is_missing(result):
+    """Checks the result without decoding stdout, which may be large or
+    binary"""
+    if isinstance(result, CommandResult):
+        code, stderr = result.code, bytes(result.stderr_bytes)
+    else:
+        code, _, stderr = result
+        stderr = stderr.encode()
+    return code == MISSING_CODE and stderr.strip() == MISSING_MESSAGE.encode()
\ No newline at end of file
@@ -1,8 +1,28 @@
-import telnetlib
+import hashlib
+import re
 
+from contextlib import contextmanager
 from socket import gaierror
 
-from executors.base import BaseExecutor
+from executors.base import (
+    BaseExecutor,
+    CommandResult,
+    input_chunks,
+)
+from executors.deadline import DeadlineExceeded, ExecutionCancelled
+from executors.telnet_engine import TELNET_PORT, TelnetConnection, expect_all
+from executors.telnet_protocol import (
+    LOGIN_INCORRECT,
+    PASSWORD_PROMPT,
+    SENTINEL_TERMINAL_SETUP,
+    FrameCapture,
+    check_frame_end,
+    encode_stdin,
+    frame_command,
+    frame_header,
+    new_marker,
+    split_frame,
+)
 
 class TelnetExecutor(BaseExecutor):
     """Opens telnet connection and executes commands in remote shell
@@ -11,61 +31,371 @@ class TelnetExecutor(BaseExecutor):
     credentials. After successful initialization you can call `execute` method
     to run commands in remote shell.
 
-    To separate return code, stdout and stderr of the command, special shell
-    variables are created in the remote shell and outputs are put there (see
-    TelnetExecutor._wrap_command). To get output, executor runs command, and
-    after completion, echoes t_std, t_err and t_err shell vars.
+    By default command is sent in a single wrapper, which prints return code,
+    lengths of stdout and stderr and then outputs themselves between unique
+    sentinel markers (see telnet_protocol.frame_command), so the whole result
+    is received in one round trip.
+
+    Shells without `mktemp`/`wc` can use `shell_vars` framing instead: special
+    shell variables are created in the remote shell and outputs are put there
+    (see TelnetExecutor._wrap_command). To get output, executor runs command,
+    and after completion, echoes t_std, t_err and t_err shell vars.
+
+    If `pool` is passed (see executors.pool), logged in session is taken from
+    it instead of opening a new one. Call `close` or use the instance as
+    context manager to give the session back.
+
+    If `capture` policy is passed (see executors.capture), outputs are read
+    into its sinks and `execute` returns ExecutionResult. Outputs are saved
+    into remote files first, so the command can't be killed, but only first
+    `max_bytes` of each output are transferred. Requires sentinel framing.
+
+    With `compressed` transfer outputs are gzipped and base64 encoded on the
+    remote side, which cuts the bytes on the wire several times for text
+    outputs and keeps binary ones intact, whatever the terminal does to
+    them. Hosts without `gzip` or `base64` send outputs as is. Requires
+    sentinel framing.
+
+    Login and commands may be bounded by `deadline` (see executors.deadline),
+    which also lets other threads cancel them. Session, interrupted by the
+    deadline, is closed, as the command may still print into it.
+
+    `stdin` is uploaded through the terminal as base64 lines, decoded on the
+    remote side as they arrive (see telnet_protocol.frame_command). Writes
+    block while the remote side does not read, so stdin is read no faster
+    than the command consumes it. Requires sentinel framing.
     """
     DEFAULT_ENCODING = 'ascii'
 
+    FRAMING_SENTINEL = 'sentinel'
+    FRAMING_SHELL_VARS = 'shell_vars'
+    DEFAULT_FRAMING = FRAMING_SENTINEL
+
+    TRANSFER_PLAIN = 'plain'
+    TRANSFER_COMPRESSED = 'compressed'
+    DEFAULT_TRANSFER = TRANSFER_PLAIN
+    # Max size of commands pipelined by `execute_many`, which are not
+    # completed yet, stays within the default terminal input buffer
+    PIPELINE_WINDOW = 4096
+    # Seconds to wait for the prompt, when checking pooled session
+    PROBE_TIMEOUT = 5
+
     def __init__(self, host, user, password, port=None, prompt=None,
-                 encoding=DEFAULT_ENCODING):
+                 encoding=DEFAULT_ENCODING, framing=DEFAULT_FRAMING,
+                 pool=None, timeout=None, capture=None, listeners=(),
+                 transfer=DEFAULT_TRANSFER, deadline=None):
         """
         :host:      - either domain name or IP addres of the server,
                       without port
         :user:      - remote account to be logged into
         :password:  - password for remote account to be logged into
         :port:      - port to connect to, if not set defaults to
-                      telnetlib.TELNET_PORT
+                      TELNET_PORT
         :prompt:    - function, which must return a string, to be used as
                       regex to define borders of the call
         :encoding:  - encoding to be used to encode and decode messages
                       to/from the remote shell
+        :framing:   - how outputs are separated from each other, either
+                      `sentinel` (single round trip) or `shell_vars`
+        :pool:      - TelnetSessionPool to take logged in session from
+        :timeout:   - seconds to wait for connection and each login step
+        :capture:   - CapturePolicy for the outputs
+        :listeners: - callables taking PhaseEvent, passed here to time the
+                      login, which is done by the initializer
+        :transfer:  - how outputs are sent, either `plain` or `compressed`
+        :deadline:  - Deadline, bounding connection and login together
         """
         if not user or not password:
             raise ValueError('Userless/passwordless logins are prohibited')
+        if framing not in (self.FRAMING_SENTINEL, self.FRAMING_SHELL_VARS):
+            raise ValueError(f'Unknown framing: {framing}')
+        if capture is not None and framing != self.FRAMING_SENTINEL:
+            raise ValueError('Capture policy requires sentinel framing')
+        if transfer not in (self.TRANSFER_PLAIN, self.TRANSFER_COMPRESSED):
+            raise ValueError(f'Unknown transfer: {transfer}')
+        if (transfer == self.TRANSFER_COMPRESSED
+                and framing != self.FRAMING_SENTINEL):
+            raise ValueError('Compressed transfer requires sentinel framing')
 
-        port = port or telnetlib.TELNET_PORT
+        self.host = host
+        self.port = port or TELNET_PORT
         self.prompt = prompt or self._default_get_prompt
         self.user = user
         self.encoding = encoding
+        self.framing = framing
+        self.timeout = timeout
+        self.capture = capture
+        self.listeners = tuple(listeners)
+        self.transfer = transfer
+
+        self.pool = pool
+        # Commands executed in the current session, used to recycle it
+        self._commands = 0
+        self.tn = None
+
+        if self.pool is None:
+            self._login(password, deadline)
+            return
 
+        password_hash = hashlib.sha256(
+            password.encode(self.encoding)).hexdigest()
+        self._pool_key = (self.host, self.port, self.user, password_hash,
+                          self.framing)
+        with self._phase('connect.pool_acquire'):
+            self.tn = self.pool.acquire(self._pool_key,
+                                        lambda: self._login(password,
+                                                            deadline),
+                                        self._is_alive)
+
+    def _login(self, password, deadline=None):
+        """Opens connection and logs into the remote shell
+
+        :return: TelnetConnection, which is also set as `tn` attribute
+        """
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = deadline.remaining(timeout)
         try:
-            self.tn = telnetlib.Telnet(host)
+            sock = self._open_socket(self.host, self.port, timeout)
         except gaierror as err:
             # get address info error, usually means we cannot resolve
-            raise ValueError(f"Failed to connect to {host}:\n{err}")
-
-        self.tn.write(self.user.encode(self.encoding) + b'\n')
-        self.tn.read_until(b'Password: ')
-        self.tn.write(password.encode(self.encoding) + b'\n')
-        matched_index, _, _ = self.tn.expect([
-            self.prompt().encode(self.encoding),
-            'Login incorrect'.encode(self.encoding),
-        ])
+            raise ValueError(f"Failed to connect to {self.host}:\n{err}")
+        self.tn = TelnetConnection(self.host, self.port, self.timeout, sock)
+
+        try:
+            with self.tn.bounded(deadline):
+                self._send_credentials(password)
+        except BaseException:
+            # E.g. EOFError or OSError, when the host drops the connection
+            if self.tn is not None:
+                self.tn.close()
+                self.tn = None
+            raise
+        return self.tn
+
+    def _send_credentials(self, password):
+        """Logs into the remote shell over opened connection"""
+        with self._phase('login.user'):
+            self.tn.write(self.user.encode(self.encoding) + b'\n')
+            self.tn.read_until(PASSWORD_PROMPT, self.timeout)
+        with self._phase('login.password'):
+            self.tn.write(password.encode(self.encoding) + b'\n')
+            matched_index, _, _ = self.tn.expect([
+                self.prompt().encode(self.encoding),
+                LOGIN_INCORRECT,
+            ], self.timeout)
         if matched_index != 0:
             # 'Login incorrect' or other was found
+            self.tn.close()
+            self.tn = None
             raise ValueError('Login with given credentials failed')
 
-    def execute(self, command, parameters=None):
+        if self.framing == self.FRAMING_SENTINEL:
+            with self._phase('login.setup'):
+                self._write_ignore_output(SENTINEL_TERMINAL_SETUP)
+
+    def _is_alive(self, tn):
+        """Checks that pooled session still responds with a prompt"""
+        try:
+            # Drops anything left unread by the previous user
+            tn.read_very_eager()
+            tn.write(b'\n')
+            matched_index, _, _ = tn.expect(
+                [self.prompt().encode(self.encoding)],
+                self.PROBE_TIMEOUT,
+            )
+        except (EOFError, OSError, ValueError):
+            # ValueError is raised by selectors for the closed socket
+            return False
+        return matched_index == 0
+
+    def close(self):
+        """Closes the session or gives it back to the pool"""
+        if self.tn is None:
+            return
+
+        if self.pool is None:
+            self.tn.close()
+        else:
+            self.pool.release(self._pool_key, self.tn, self._commands)
+        self.tn = None
+        self._commands = 0
+
+    def execute(self, command, parameters=None, deadline=None, *,
+                stdin=None):
         """Initiates command execution
 
         :command: string, command to execute
         :parameters: tuple, params for command
+        :deadline: Deadline, bounding the execution
+        :stdin: bytes, binary file object or iterable of bytes chunks
         :return: result code, stdout, stderr
         """
         if parameters:
             command = command + ' ' + ' '.join(parameters)
+        if stdin is not None and self.framing != self.FRAMING_SENTINEL:
+            raise ValueError('stdin requires sentinel framing')
+
+        with self._bounded(deadline):
+            if self.framing == self.FRAMING_SHELL_VARS:
+                return self._execute_shell_vars(command)
+
+            self._commands += 1
+            marker = new_marker()
+            with self._phase('execute.send') as phase:
+                self.tn.write(self._frame_command(command, marker,
+                                                  stdin is not None))
+                if stdin is not None:
+                    self._upload(stdin, marker, phase, deadline)
+            return self._read_frame(marker)
+
+    def _upload(self, stdin, marker, phase, deadline=None):
+        """Sends stdin of the command, framed with `stdin` set"""
+        try:
+            for line in encode_stdin(input_chunks(stdin), marker):
+                if deadline is not None:
+                    # Writes wait for the deadline only when they block
+                    deadline.check()
+                self.tn.write(line)
+                phase.add_bytes(len(line))
+        except Exception:
+            # Remote side waits for the rest of stdin, session is unusable
+            self.tn.close()
+            raise
+
+    def execute_many(self, commands, window=None, deadline=None):
+        """Executes batch of commands, pipelining them into the session
+
+        Framed commands are written to the remote shell without waiting for
+        the previous ones to complete, results are taken from the received
+        stream by their markers. Commands must not read stdin, otherwise they
+        will consume the commands queued after them.
+
+        Terminal drops input which does not fit its buffer, so commands are
+        written in one go only while their total size fits `window` bytes,
+        the rest are sent as soon as the results of the previous ones arrive.
+
+        :commands: iterable of commands, each is either string or
+                   `(command, parameters)` tuple
+        :window:   max size in bytes of commands sent, but not completed yet,
+                   defaults to PIPELINE_WINDOW
+        :deadline: Deadline, bounding the whole batch
+        :return: list of (result code, stdout, stderr), in order of commands
+        """
+        commands = [
+            (command, None) if isinstance(command, str) else command
+            for command in commands
+        ]
+
+        if self.framing == self.FRAMING_SHELL_VARS:
+            return [self.execute(command, parameters, deadline)
+                    for command, parameters in commands]
+
+        self._commands += len(commands)
+        window = window or self.PIPELINE_WINDOW
+        markers = []
+        framed = []
+        for command, parameters in commands:
+            if parameters:
+                command = command + ' ' + ' '.join(parameters)
+            markers.append(new_marker())
+            framed.append(self._frame_command(command, markers[-1]))
+
+        results = []
+        sent = 0
+        in_flight = 0
+        with self._bounded(deadline):
+            while len(results) < len(framed):
+                batch = []
+                # At least one command is always sent, even if it is too large
+                while sent < len(framed) and (
+                        not in_flight
+                        or in_flight + len(framed[sent]) <= window):
+                    batch.append(framed[sent])
+                    in_flight += len(framed[sent])
+                    sent += 1
+                if batch:
+                    self.tn.write(b''.join(batch))
+
+                index = len(results)
+                results.append(self._read_frame(markers[index]))
+                in_flight -= len(framed[index])
+
+        return results
+
+    @contextmanager
+    def _bounded(self, deadline):
+        """Applies deadline to the session, closes session it interrupted"""
+        try:
+            with self.tn.bounded(deadline):
+                yield
+        except (DeadlineExceeded, ExecutionCancelled):
+            # Command may still be running and print into the session
+            self.tn.close()
+            raise
+
+    def _frame_command(self, command, marker, stdin=False):
+        """:return: encoded command, wrapped with `frame_command`"""
+        limit = None if self.capture is None else self.capture.max_bytes
+        compress = self.transfer == self.TRANSFER_COMPRESSED
+        return frame_command(command, marker, limit, compress,
+                             stdin).encode(self.encoding)
+
+    def _read_frame(self, marker):
+        """Reads frame printed by the command wrapped with `frame_command`
+
+        :return: result code, stdout, stderr
+        """
+        marker = marker.encode(self.encoding)
+        with self._phase('execute.wait'):
+            _, header, _ = self.tn.expect([frame_header(marker)])
+        if self.capture is not None:
+            return self._capture_frame(header.groups(), marker)
+
+        with self._phase('execute.transfer') as phase:
+            # Outputs are read up to the closing marker without regex, which
+            # would rescan whole received buffer on each read
+            payload = self.tn.read_until(marker)[:-len(marker)]
+            phase.add_bytes(len(payload))
+            # Frame is followed by the prompt, just skip it
+            self.tn.expect([self.prompt().encode(self.encoding)])
+
+        with self._phase('execute.decode'):
+            return split_frame(header.groups(), payload, self.encoding)
+
+    def _capture_frame(self, header, marker):
+        """Passes outputs of the frame through capture sinks as they arrive
+
+        :header: groups of the `frame_header` regex match
+        :return: ExecutionResult
+        """
+        frame = FrameCapture(self.capture, header)
+        started = self._now()
+        if frame.compressed:
+            # Size of the compressed outputs is not known in advance, but
+            # base64 can't contain the marker
+            payload = self.tn.read_until(marker)[:-len(marker)]
+            transferred = len(payload)
+            frame.write_compressed(payload)
+        else:
+            transferred = frame.size
+            for chunk in self.tn.read_exactly(transferred):
+                frame.write(chunk)
+            check_frame_end(self.tn.read_until(marker), marker)
+        self._emit('execute.transfer', started, nbytes=transferred)
+
+        # Frame is followed by the prompt, just skip it
+        self.tn.expect([self.prompt().encode(self.encoding)])
+
+        return frame.result(self.encoding)
+
+    def _execute_shell_vars(self, command):
+        """Executes command using `shell_vars` framing
+
+        :command: string, command with parameters to execute
+        :return: result code, stdout, stderr
+        """
+        self._commands += 1
         command = self._wrap_command(command)
 
         self._clean_shell_vars()
@@ -76,7 +406,7 @@ class TelnetExecutor(BaseExecutor):
         stderr = self._parse_last_stderr()
         self._clean_shell_vars()
 
-        return result_code, stdout, stderr
+        return CommandResult(result_code, stdout, stderr, self.encoding)
 
     def _wrap_command(self, command):
         """Embedds command into expression to redirect outputs
@@ -124,17 +454,18 @@ class TelnetExecutor(BaseExecutor):
         return self._echo_variable('t_err')
 
     def _echo_variable(self, variable):
-        """Executes `echo ${variable}` in the remote shell and reads output"""
+        """Executes `echo ${variable}` in the remote shell
+
+        :return: bytes, output of the echo
+        """
         self.tn.write(f'echo ${variable}\n'
             .encode(self.encoding))
 
         _, matched, read = self.tn.expect([
             self.prompt().encode(self.encoding)
         ])
-        output = read.decode(self.encoding)
         # We don't need the next prompt in our output
-        result = output[:matched.start(0)]
-        return result
+        return read[:matched.start(0)]
 
     def _write_ignore_output(self, command):
         """Writes command to the remote shell reads output up to the next
@@ -154,8 +485,75 @@ class TelnetExecutor(BaseExecutor):
         """
         return f"\\s*{self.user}.*?\\$"
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
     def __del__(self):
         try:
-            self.tn.close()
+            self.close()
         except AttributeError:
-            pass
\ No newline at end of file
+            pass
+
+def execute_all(executors, command, parameters=None):
+    """Executes the same command in many sessions at once from one thread
+
+    Command is written to every session first, then all outputs are read as
+    they arrive. Executors must use the sentinel framing.
+
+    :executors: list of TelnetExecutor
+    :command: string, command to execute
+    :parameters: tuple, params for command
+    :return: list of (result code, stdout, stderr), in order of executors
+    """
+    if any(executor.framing != TelnetExecutor.FRAMING_SENTINEL
+           for executor in executors):
+        raise ValueError('All executors must use sentinel framing')
+
+    if parameters:
+        command = command + ' ' + ' '.join(parameters)
+
+    markers = []
+    for executor in executors:
+        marker = new_marker()
+        executor._commands += 1
+        executor.tn.write(executor._frame_command(command, marker))
+        markers.append(marker.encode(executor.encoding))
+
+    headers = expect_all([
+        (executor.tn, [frame_header(marker)])
+        for executor, marker in zip(executors, markers)
+    ])
+    payloads = expect_all([
+        (executor.tn, [marker])
+        for executor, marker in zip(executors, markers)
+    ])
+    # Frames are followed by the prompts, just skip them
+    expect_all([
+        (executor.tn, [re.compile(executor.prompt().encode(executor.encoding))])
+        for executor in executors
+    ])
+
+    return [
+        split_frame(header.groups(), payload[:-len(marker)], executor.encoding)
+        if executor.capture is None
+        else _capture_payload(executor, header.groups(), payload[:-len(marker)])
+        for executor, marker, (_, header, _), (_, _, payload)
+        in zip(executors, markers, headers, payloads)
+    ]
+
+
+
+def _capture_payload(executor, header, payload):
+    """Passes outputs from the received frame through capture sinks
+
+    :return: ExecutionResult
+    """
+    frame = FrameCapture(executor.capture, header)
+    if frame.compressed:
+        frame.write_compressed(payload)
+    else:
+        frame.write(payload)
+    return frame.result(executor.encoding)
\ No newline at end of file
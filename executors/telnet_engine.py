@@ -0,0 +1,307 @@
+import re
+import selectors
+import socket
+import time
+
+from contextlib import contextmanager
+
+from executors.deadline import DeadlineExceeded
+from executors.telnet_protocol import ReceiveBuffer, TelnetCodec
+
+TELNET_PORT = 23
+
+
+class TelnetConnection:
+    """Telnet client on the non-blocking socket
+
+    Replaces telnetlib, which is removed from Python 3.13, and keeps the part
+    of its interface used by executors: `write`, `read_until`, `expect`,
+    `read_very_eager`, `close`. Received data is searched incrementally (see
+    telnet_protocol.ReceiveBuffer), so waiting for the end of a large output
+    takes linear time.
+
+    Many connections can be driven from one thread with `expect_all`.
+
+    Waits inside `bounded` block are cut by the deadline (see
+    executors.deadline) and interrupted by its cancellation.
+    """
+    # Max size of the single chunk read from the socket
+    CHUNK_SIZE = 65536
+
+    def __init__(self, host, port=TELNET_PORT, timeout=None, sock=None):
+        """
+        :host:      - either domain name or IP addres of the server
+        :port:      - port to connect to
+        :timeout:   - seconds to wait for connection
+        :sock:      - already connected socket to use instead of connecting
+        """
+        self.host = host
+        self.port = port
+        self.sock = sock or socket.create_connection((host, port), timeout)
+        self.sock.setblocking(False)
+        # Commands are small and latency bound, don't hold them back
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.codec = TelnetCodec()
+        self.buffer = ReceiveBuffer()
+        self.eof = False
+        # Deadline of the current operation, see `bounded`
+        self.deadline = None
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.sock, selectors.EVENT_READ)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def get_socket(self):
+        return self.sock
+
+    def close(self):
+        if self.sock is None:
+            return
+        self._selector.close()
+        self.sock.close()
+        self.sock = None
+        self.eof = True
+
+    @contextmanager
+    def bounded(self, deadline):
+        """Applies deadline to all waits inside the block
+
+        Waits raise DeadlineExceeded, once the deadline passes, and
+        ExecutionCancelled, once it is cancelled. Cancellation shuts the
+        socket down, so connection can't be used after that.
+
+        :deadline: executors.deadline.Deadline or None for no limit
+        """
+        if deadline is None:
+            yield self
+            return
+
+        deadline.check()
+        self.deadline = deadline
+        unregister = deadline.on_cancel(self.interrupt)
+        try:
+            yield self
+        finally:
+            unregister()
+            self.deadline = None
+
+    def interrupt(self):
+        """Wakes up waits from another thread, by shutting the socket down"""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            # Already closed
+            pass
+
+    def write(self, data):
+        """Sends data, escaping IAC bytes
+
+        While socket is not writable, received data is read, so the server
+        is never blocked on sending to us.
+        """
+        self._send(TelnetCodec.encode(data))
+
+    def read_until(self, match, timeout=None):
+        """Reads until bytes `match` or timeout
+
+        :return: data read including `match`, or all read data on timeout
+        """
+        _, _, text = self._wait([match], timeout)
+        if text is None:
+            return self.read_very_eager()
+        return text
+
+    def expect(self, patterns, timeout=None):
+        """Reads until one of regexes matches or timeout
+
+        :patterns: list of compiled regexes or regex bytes
+        :return: (index, match, text) of the first matched pattern in the
+                 list, or (-1, None, all read data) on timeout
+        """
+        patterns = [
+            re.compile(pattern) if isinstance(pattern, bytes) else pattern
+            for pattern in patterns
+        ]
+        index, matched, text = self._wait(patterns, timeout)
+        if index == -1:
+            return -1, None, self.read_very_eager()
+        return index, matched, text
+
+    def read_exactly(self, size, timeout=None):
+        """Reads next `size` bytes chunk by chunk, as they arrive
+
+        Lets large outputs be passed on without keeping them in memory.
+
+        :return: generator of bytes chunks, raises EOFError if connection is
+                 closed and TimeoutError if data stops arriving for `timeout`
+                 seconds
+        """
+        while size:
+            if not self.buffer:
+                if self.eof:
+                    self._raise_closed()
+                limit, by_deadline = self._limit(timeout)
+                if not self._selector.select(limit):
+                    self._timed_out(by_deadline)
+                    raise TimeoutError(f'No data from {self.host} in '
+                                       f'{timeout} seconds')
+                self._receive()
+                continue
+
+            chunk = self.buffer.consume(min(size, len(self.buffer)))
+            size -= len(chunk)
+            yield chunk
+
+    def read_very_eager(self):
+        """Reads everything available without blocking
+
+        :return: read data, raises EOFError if connection is closed and
+                 there is nothing left
+        """
+        while not self.eof and self._selector.select(0):
+            self._receive()
+
+        if self.eof and not self.buffer:
+            raise EOFError('telnet connection closed')
+        return self.buffer.consume()
+
+    def _wait(self, patterns, timeout):
+        """Reads until one of patterns is found, see ReceiveBuffer.search"""
+        timeout, by_deadline = self._limit(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        scanned = 0
+        while True:
+            found = self.buffer.search(patterns, scanned)
+            if found[0] != -1:
+                return found
+            scanned = len(self.buffer)
+
+            if self.eof:
+                self._raise_closed()
+            if not self._selector.select(_remaining(deadline)):
+                self._timed_out(by_deadline)
+                return found
+            self._receive()
+
+    def _receive(self):
+        """Reads available chunk, answers negotiation, buffers the data"""
+        try:
+            chunk = self.sock.recv(self.CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        if not chunk:
+            self.eof = True
+            return
+
+        data, reply = self.codec.feed(chunk)
+        if reply:
+            self._send(reply)
+        self.buffer.feed(data)
+
+    def _send(self, data):
+        data = memoryview(data)
+        while data:
+            try:
+                sent = self.sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            data = data[sent:]
+            if not data:
+                return
+            if self.eof:
+                self._raise_closed()
+
+            self._selector.modify(
+                self.sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+            try:
+                limit, by_deadline = self._limit(None)
+                ready = self._selector.select(limit)
+                if not ready:
+                    self._timed_out(by_deadline)
+                for _, events in ready:
+                    if events & selectors.EVENT_READ:
+                        self._receive()
+            finally:
+                self._selector.modify(self.sock, selectors.EVENT_READ)
+
+
+    def _limit(self, timeout):
+        """Cuts timeout of the wait by the deadline of the current operation
+
+        :return: (timeout, whether it was cut by the deadline)
+        """
+        if self.deadline is None:
+            return timeout, False
+        limit = self.deadline.remaining(timeout)
+        return limit, limit != timeout
+
+    def _timed_out(self, by_deadline):
+        """Raises DeadlineExceeded, if the wait was cut by the deadline"""
+        if by_deadline:
+            self.deadline.check()
+            raise DeadlineExceeded(f'Deadline exceeded, waiting for {self.host}')
+
+    def _raise_closed(self):
+        # Connection, shut down by the cancellation, is reported as such
+        if self.deadline is not None:
+            self.deadline.check()
+        raise EOFError('telnet connection closed')
+
+
+def expect_all(requests, timeout=None):
+    """Waits for patterns in many connections at once from one thread
+
+    :requests: list of (TelnetConnection, patterns), patterns are compiled
+               regexes or bytes, which are searched literally
+    :timeout:  seconds to wait for all of them
+    :return: list of (index, match, text) in order of requests, see
+             ReceiveBuffer.search, index is -1 for timed out ones
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    results = [None] * len(requests)
+    scanned = [0] * len(requests)
+
+    selector = selectors.DefaultSelector()
+    try:
+        for position, (connection, patterns) in enumerate(requests):
+            found = connection.buffer.search(patterns)
+            if found[0] != -1:
+                results[position] = found
+            else:
+                scanned[position] = len(connection.buffer)
+                selector.register(connection.sock, selectors.EVENT_READ,
+                                  position)
+
+        while selector.get_map():
+            ready = selector.select(_remaining(deadline))
+            if not ready:
+                break
+
+            for key, _ in ready:
+                position = key.data
+                connection, patterns = requests[position]
+                connection._receive()
+
+                found = connection.buffer.search(patterns, scanned[position])
+                if found[0] != -1:
+                    results[position] = found
+                    selector.unregister(key.fileobj)
+                elif connection.eof:
+                    raise EOFError(
+                        f'telnet connection to {connection.host} closed')
+                else:
+                    scanned[position] = len(connection.buffer)
+    finally:
+        selector.close()
+
+    return [result or (-1, None, None) for result in results]
+
+
+def _remaining(deadline):
+    """:return: seconds left until deadline, None for no deadline"""
+    if deadline is None:
+        return None
+    return max(0, deadline - time.monotonic())
@@ -0,0 +1,476 @@
+import base64
+import binascii
+import re
+import uuid
+import zlib
+
+from executors.base import CommandResult, ExecutionResult
+
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+CR = 13
+NUL = 0
+
+# Login dialogue, as printed by login(1)
+PASSWORD_PROMPT = b'Password: '
+LOGIN_INCORRECT = b'Login incorrect'
+
+# Prepares remote terminal for the sentinel framing. Lengths in the frame
+# header are in bytes, so terminal must not turn "\n" of the outputs into
+# "\r\n" nor echo input, which arrives while command is running, into the
+# middle of the frame
+SENTINEL_TERMINAL_SETUP = 'stty -echo -onlcr\n'
+
+# Ends the frame header, if the payload is compressed, see frame_command
+COMPRESSED_FLAG = b'gzip'
+# Remote side checks for the tools on every command, so executor needs no
+# knowledge of the host and falls back to the plain payload by itself
+COMPRESSION_CHECK = ('if command -v gzip >/dev/null && '
+                     'command -v base64 >/dev/null; '
+                     "then m_z=' gzip'; else m_z=; fi; ")
+# Max size of the chunk, decompressed from the payload at once
+DECOMPRESS_CHUNK_SIZE = 65536
+# Bytes of stdin per base64 line of the upload, 76 characters long, well
+# within the terminal line limit
+STDIN_LINE_SIZE = 57
+
+
+class TelnetCodec:
+    """Separates data from telnet commands in the received stream
+
+    Like telnetlib, refuses every option the server asks for or offers, so
+    the session stays in the plain NVT mode. Data may be fed in chunks of any
+    size, command split between chunks is completed by the next `feed`.
+    """
+
+    def __init__(self):
+        # Unfinished command from the end of the previous chunk
+        self._command = bytearray()
+        self._in_subnegotiation = False
+        self._after_cr = False
+
+    def feed(self, chunk):
+        """Processes received chunk
+
+        :chunk: bytes, as received from the socket
+        :return: (data, reply), data for the application and bytes to be sent
+                 back to the server
+        """
+        if (not self._command and not self._in_subnegotiation
+                and IAC not in chunk):
+            # Fast path for the chunk without commands, most of them are so
+            if self._after_cr and chunk[:1] == b'\0':
+                chunk = chunk[1:]
+            data = chunk.replace(b'\r\0', b'\r')
+            self._after_cr = data[-1:] == b'\r'
+            return data, b''
+
+        data = bytearray()
+        reply = bytearray()
+        command = self._command
+
+        for byte in chunk:
+            if command:
+                command.append(byte)
+                if len(command) == 2:
+                    if byte == IAC:
+                        # Escaped 255 data byte
+                        if not self._in_subnegotiation:
+                            data.append(IAC)
+                        command.clear()
+                    elif byte == SB:
+                        self._in_subnegotiation = True
+                        command.clear()
+                    elif byte == SE:
+                        self._in_subnegotiation = False
+                        command.clear()
+                    elif byte not in (DO, DONT, WILL, WONT):
+                        # Two bytes command, e.g. NOP or GA
+                        command.clear()
+                else:
+                    if command[1] == DO:
+                        reply += bytes((IAC, WONT, byte))
+                    elif command[1] == WILL:
+                        reply += bytes((IAC, DONT, byte))
+                    command.clear()
+            elif byte == IAC:
+                command.append(byte)
+            elif self._in_subnegotiation:
+                continue
+            elif byte == NUL and self._after_cr:
+                # NVT sends bare carriage return as CR NUL
+                self._after_cr = False
+            else:
+                self._after_cr = byte == CR
+                data.append(byte)
+
+        return bytes(data), bytes(reply)
+
+    @staticmethod
+    def encode(data):
+        """Escapes data to be sent to the server"""
+        return data.replace(bytes((IAC,)), bytes((IAC, IAC)))
+
+
+def new_marker():
+    """Generates sentinel, which can't be met in the command output"""
+    return f'__mcduck_{uuid.uuid4().hex}__'
+
+
+def frame_command(command, marker, limit=None, compress=False, stdin=False):
+    """Embedds command into script, which prints all results at once
+
+    Outputs of the command are saved into temporary files, then the frame
+    is printed:
+        <marker> <ret code> <stdout length> <stderr length>\n
+        <stdout><stderr><marker>\n
+
+    Marker is passed to `printf` in two halves, so echo of the typed
+    command by the remote terminal never contains the marker itself.
+
+    If `limit` is set, only first `limit` bytes of each output are printed,
+    while header still has their full lengths.
+
+    If `compress` is set and the remote host has `gzip` and `base64`, the
+    header ends with ` gzip` and outputs are printed gzipped and base64
+    encoded, in lines of base64(1) width, instead of raw bytes. Header keeps
+    lengths of the raw outputs. Without the tools frame is printed as usual.
+
+    If `stdin` is set, the command reads its stdin from the terminal, as
+    base64 lines, ended by the line with the marker, see encode_stdin. Lines
+    are decoded as they arrive, so the command runs while the upload goes.
+    If the command exits early, the rest of the upload is still consumed,
+    so it never reaches the shell. Needs `sed` and `base64` on the remote
+    host.
+    """
+    head, tail = marker[:5], marker[5:]
+    if limit is None:
+        outputs = 'cat "$m_out" "$m_err"'
+    else:
+        outputs = (f'{{ head -c {int(limit)} "$m_out"; '
+                   f'head -c {int(limit)} "$m_err"; }}')
+
+    if compress:
+        check = COMPRESSION_CHECK
+        flag = '%s'
+        flag_value = ' "$m_z"'
+        variables = 'm_out m_err m_ret m_z'
+        print_outputs = (f'if [ -n "$m_z" ]; then {outputs} | gzip -c | '
+                         f'base64; else {outputs}; fi; ')
+    else:
+        check = flag = flag_value = ''
+        variables = 'm_out m_err m_ret'
+        print_outputs = outputs + '; '
+
+    if stdin:
+        # base64 complains only if it is missing, not when the command
+        # exits without reading all of stdin
+        decode = ('(base64 -d 2>/dev/null || command -v base64 >/dev/null '
+                  "|| echo 'base64 is needed for stdin' >&2)")
+        run = (f"sed -n '/^'{head}'{tail}$/q;p' | "
+               f'(({decode} | ({command})) >"$m_out" 2>"$m_err"; m_ret=$?; '
+               'cat >/dev/null; exit $m_ret); m_ret=$?; ')
+    else:
+        run = f'({command}) >"$m_out" 2>"$m_err"; m_ret=$?; '
+
+    return ('m_out=$(mktemp) m_err=$(mktemp); '
+            + run + check +
+            f"printf '%s%s %d %d %d{flag}\\n' {head} {tail} \"$m_ret\" "
+            '$(wc -c <"$m_out") $(wc -c <"$m_err")' + flag_value + '; '
+            + print_outputs +
+            f"printf '%s%s\\n' {head} {tail}; "
+            f'rm -f "$m_out" "$m_err"; unset {variables}\n')
+
+
+class StdinEncoder:
+    """Encodes stdin of the command, framed with `stdin` set, chunk by chunk
+
+    Only whole base64 lines are encoded, the rest of the chunk is kept for
+    the next one.
+    """
+
+    def __init__(self):
+        self._rest = b''
+
+    def encode(self, chunk):
+        """:return: bytes, base64 lines, may be empty"""
+        data = self._rest + chunk
+        cut = len(data) - len(data) % STDIN_LINE_SIZE
+        self._rest = bytes(data[cut:])
+        return base64.encodebytes(data[:cut])
+
+    def finish(self, marker):
+        """:marker: marker passed to `frame_command`
+        :return: bytes, the rest of stdin and the marker line, which ends it
+        """
+        rest, self._rest = self._rest, b''
+        return base64.encodebytes(rest) + marker.encode('ascii') + b'\n'
+
+
+def encode_stdin(chunks, marker):
+    """Encodes stdin of the command, framed with `stdin` set
+
+    :chunks: iterable of bytes
+    :marker: marker passed to `frame_command`
+    :return: generator of bytes, base64 lines followed by the marker line
+    """
+    encoder = StdinEncoder()
+    for chunk in chunks:
+        lines = encoder.encode(chunk)
+        if lines:
+            yield lines
+    yield encoder.finish(marker)
+
+
+def frame_header(marker):
+    """:return: compiled regex, matching header of the frame with marker
+
+    :marker: bytes, marker passed to `frame_command`
+    """
+    return re.compile(re.escape(marker) + rb' (\d+) (\d+) (\d+)'
+                      rb'(?: (' + COMPRESSED_FLAG + rb'))?\r?\n')
+
+
+def parse_header(header):
+    """:header: groups of the `frame_header` regex match
+    :return: (result code, stdout length, stderr length, compressed)
+    """
+    result_code, out_len, err_len, *flag = header
+    return (int(result_code), int(out_len), int(err_len),
+            bool(flag and flag[0]))
+
+
+def decompress_payload(payload, chunk_size=DECOMPRESS_CHUNK_SIZE):
+    """Decodes payload of the compressed frame
+
+    :payload: bytes between the header and the closing marker
+    :return: generator of decompressed chunks, at most `chunk_size` bytes
+             each, so large outputs are not unpacked into memory at once
+    """
+    try:
+        # Line breaks and other non base64 bytes are skipped
+        data = base64.b64decode(payload)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while data:
+            chunk = decompressor.decompress(data, chunk_size)
+            data = decompressor.unconsumed_tail
+            yield chunk
+        rest = decompressor.flush()
+        eof = decompressor.eof
+    except (binascii.Error, zlib.error) as err:
+        raise ValueError(f'Received frame is malformed: {err}')
+    if rest:
+        yield rest
+    if not eof:
+        raise ValueError('Received frame is malformed: truncated gzip stream')
+
+
+def split_outputs(chunks, sizes):
+    """Splits payload of the frame between outputs, chunk by chunk
+
+    :chunks: iterable of bytes, payload as sent or decompressed
+    :sizes:  sizes of the outputs in the payload
+    :return: generator of (index of the output, bytes)
+    """
+    splitter = OutputSplitter(sizes)
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    splitter.close()
+
+
+class OutputSplitter:
+    """Splits payload of the frame between outputs, as it is received
+
+    Push counterpart of split_outputs, for readers, which can't be wrapped
+    into the generator, e.g. asyncio ones.
+    """
+
+    def __init__(self, sizes):
+        """
+        :sizes: - sizes of the outputs in the payload
+        """
+        self.sizes = sizes
+        self.received = 0
+        self._index = 0
+        self._left = sizes[0]
+
+    def feed(self, chunk):
+        """:chunk: bytes, next part of the payload
+        :return: list of (index of the output, bytes)
+        """
+        self.received += len(chunk)
+        pieces = []
+        while chunk:
+            while not self._left and self._index < len(self.sizes) - 1:
+                self._index += 1
+                self._left = self.sizes[self._index]
+            if not self._left:
+                # Extra bytes, counted and reported by `close`
+                break
+            piece, chunk = chunk[:self._left], chunk[self._left:]
+            self._left -= len(piece)
+            pieces.append((self._index, piece))
+        return pieces
+
+    def close(self):
+        """Raises ValueError, unless exactly `sizes` bytes were received"""
+        if self.received != sum(self.sizes):
+            raise ValueError('Received frame is malformed: expected '
+                             f'{sum(self.sizes)} bytes, got {self.received}')
+
+
+class FrameCapture:
+    """Passes outputs of the frame through capture sinks, as they arrive
+
+    Shared by the blocking and asyncio telnet executors: each reads the
+    frame its own way and feeds the payload here.
+
+        frame = FrameCapture(capture, header.groups())
+        if frame.compressed:
+            frame.write_compressed(<payload up to the closing marker>)
+        else:
+            frame.write(<next frame.size bytes>)
+            check_frame_end(<rest up to the closing marker>, marker)
+        return frame.result(encoding)
+    """
+
+    def __init__(self, capture, header):
+        """
+        :capture: - CapturePolicy
+        :header:  - groups of the `frame_header` regex match
+        """
+        self.capture = capture
+        self.code, *self.lengths, self.compressed = parse_header(header)
+        # Only first `max_bytes` of each output are printed into the frame
+        self.sent = [length if capture.max_bytes is None
+                     else min(length, capture.max_bytes)
+                     for length in self.lengths]
+        self.sinks = [capture.new_sink() for _ in self.lengths]
+        self._splitter = OutputSplitter(self.sent)
+
+    @property
+    def size(self):
+        """:return: number of output bytes in the plain frame"""
+        return sum(self.sent)
+
+    def write(self, chunk):
+        """:chunk: bytes, next part of the outputs, as printed in the frame"""
+        for index, piece in self._splitter.feed(chunk):
+            self.sinks[index].write(piece)
+
+    def write_compressed(self, payload):
+        """:payload: bytes of the compressed frame, without the marker"""
+        for chunk in decompress_payload(payload):
+            self.write(chunk)
+
+    def result(self, encoding):
+        """:return: ExecutionResult, raises ValueError if the outputs were
+        not received in full"""
+        self._splitter.close()
+        for sink, length, size in zip(self.sinks, self.lengths, self.sent):
+            sink.skip(length - size)
+        return ExecutionResult(self.code, *self.sinks, encoding,
+                               self.capture.name)
+
+
+def check_frame_end(rest, marker):
+    """Raises ValueError, unless only the closing marker follows outputs
+
+    :rest:   bytes, read after the outputs up to the closing marker
+    :marker: bytes, marker passed to `frame_command`
+    """
+    if rest != marker:
+        raise ValueError('Received frame is malformed: '
+                         f'{len(rest) - len(marker)} unexpected bytes')
+
+
+def split_frame(header, payload, encoding):
+    """Splits payload of the frame into stdout and stderr
+
+    :header:   groups of the `frame_header` regex match
+    :payload:  bytes between the header and the closing marker
+    :encoding: encoding of the outputs
+    :return: CommandResult, outputs are views into the payload
+    """
+    result_code, out_len, err_len, compressed = parse_header(header)
+    if compressed:
+        payload = b''.join(decompress_payload(payload))
+    if len(payload) != out_len + err_len:
+        raise ValueError('Received frame is malformed: expected '
+                         f'{out_len + err_len} bytes, got {len(payload)}')
+
+    payload = memoryview(payload)
+    return CommandResult(result_code, payload[:out_len], payload[out_len:],
+                         encoding)
+
+
+class ReceiveBuffer:
+    """Received data, searched for prompts and markers incrementally
+
+    Search is resumed from where the previous one stopped, so large outputs
+    are not rescanned on every received chunk. Regex match is expected to be
+    shorter than MAX_MATCH bytes and not to cross line breaks in its middle,
+    which holds for prompts and frame headers.
+
+    Patterns are either compiled regexes or bytes, searched literally.
+    """
+    # Max length of the regex match, searched incrementally
+    MAX_MATCH = 4096
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def __len__(self):
+        return len(self.data)
+
+    def feed(self, data):
+        self.data += data
+
+    def search(self, patterns, scanned=0):
+        """Looks for the first of patterns in order, consumes data up to it
+
+        :patterns: list of compiled regexes or bytes
+        :scanned:  size of data already searched for the same patterns
+        :return: (index, match, text), where text is consumed bytes and match
+                 is regex match object in it (None for literal pattern), or
+                 (-1, None, None) if nothing was found
+        """
+        data = self.data
+        for index, pattern in enumerate(patterns):
+            if isinstance(pattern, (bytes, bytearray)):
+                start = data.find(pattern, max(0, scanned - len(pattern) + 1))
+                if start == -1:
+                    continue
+                end = start + len(pattern)
+            else:
+                resume = max(data.rfind(b'\n', 0, scanned) + 1,
+                             scanned - self.MAX_MATCH, 0)
+                matched = pattern.search(data, resume)
+                if matched is None:
+                    continue
+                start, end = matched.span()
+
+            text = self.consume(end)
+            if isinstance(pattern, (bytes, bytearray)):
+                return index, None, text
+            # Match is repeated on the consumed copy, buffer has changed
+            return index, pattern.search(text, start), text
+
+        return -1, None, None
+
+    def consume(self, size=None):
+        """Removes data from the beginning of the buffer
+
+        :return: removed bytes
+        """
+        if size is None:
+            size = len(self.data)
+        text = bytes(self.data[:size])
+        del self.data[:size]
+        return text
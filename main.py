@@ -1,31 +1,58 @@
 import getpass
+import os
+import sys
 
 import click
 import simplejson
 
-from executors.ssh import SSHExecutor
-from executors.local import LocalExecutor
-from executors.telnet import TelnetExecutor
+from executors.fanout import fan_out, parse_inventory
+# json_repr and error_repr are imported from here by code, written before
+# the output formats
+from executors.formats import (
+    DEFAULT_FORMAT,
+    FORMATS,
+    error_repr,
+    json_repr,
+    new_writer,
+)
+from executors.playbook import PlaybookRunner, load_playbook, read_done
+from executors.registry import registry
+
+# Executors and agent are imported by subcommands, which need them, so e.g.
+# `local` does not import paramiko. Default ssh port is repeated here for the
+# same reason
+SSH_PORT = 22
 
 
 @click.group()
-def cli():
-    pass
+@click.option('-f', '--format', 'output_format', type=click.Choice(FORMATS),
+              default=DEFAULT_FORMAT, show_default=True,
+              help='Format of the results: JSON lines, compact JSON lines, '
+                   'msgpack (needs msgpack) or length prefixed raw frames. '
+                   'Not used by playbook, which always writes JSON lines.')
+@click.pass_context
+def cli(context, output_format):
+    try:
+        context.obj = new_writer(output_format, sys.stdout.buffer)
+    except ValueError as err:
+        raise click.BadParameter(str(err), param_hint='--format')
 
 
 @click.command(context_settings={'ignore_unknown_options':True,})
 @click.argument('command')
 @click.argument('command_args', nargs=-1, type=click.UNPROCESSED)
-def local(command, command_args):
+@click.option('--input', 'input_file', type=click.File('rb'),
+              help='File to stream to COMMAND\'s stdin, "-" for stdin')
+def local(command, input_file, command_args):
     """ Will execute COMMAND locally """
-    executor = LocalExecutor()
+    executor = registry.get('local')()
     try:
-        res = json_repr(*executor.execute(command, command_args))
+        res = executor.execute(command, command_args, stdin=input_file)
     except FileNotFoundError:
         click.echo(f"Could not find {command}")
         return None
 
-    click.echo(res)
+    write_result(res)
 
 
 @click.command(context_settings={'ignore_unknown_options':True,})
@@ -33,14 +60,22 @@ def local(command, command_args):
 @click.argument('command')
 @click.argument('command_args', nargs=-1, type=click.UNPROCESSED)
 @click.option('-i', '--identity', help='Full path to identity file')
-@click.option('-p', '--port', type=click.INT, default=SSHExecutor.SSH_PORT,
+@click.option('-p', '--port', type=click.INT, default=SSH_PORT,
               help='Port to connect.', show_default=True)
 @click.option('--rpass', is_flag=True,
               help='If passed, will request password for connection')
 @click.option('--rphrase', is_flag=True,
               help='If passed will request passphrase for identity file')
+@click.option('--no-agent', is_flag=True,
+              help='If passed, will not use running agent')
+@click.option('--input', 'input_file', type=click.File('rb'),
+              help='File to stream to COMMAND\'s stdin, "-" for stdin, '
+                   'agent is not used then')
+@click.option('--script', is_flag=True,
+              help='If passed, COMMAND is local script, which is uploaded to '
+                   'the host once and run from there, agent is not used then')
 def ssh(connection_string, command, identity, port,
-        rpass, rphrase, command_args):
+        rpass, rphrase, no_agent, input_file, script, command_args):
     """Will execute COMMAND via ssh
 
     Please pass CONNECTION_STRING in the followin format:
@@ -57,7 +92,25 @@ def ssh(connection_string, command, identity, port,
 
     passphrase = getpass.getpass('Passphrase: ') if rphrase else None
 
-    executor = SSHExecutor(
+    client = None if no_agent or input_file or script else connect_agent()
+    if client is not None:
+        with client:
+            try:
+                res = client.execute(
+                    'ssh', host, command, command_args,
+                    port=port,
+                    user=user,
+                    password=password,
+                    key_path=identity,
+                    passphrase=passphrase,
+                )
+            except ValueError as err:
+                click.echo(err)
+                return None
+        write_result(res)
+        return None
+
+    executor = registry.get('ssh')(
         host,
         port=port,
         user=user,
@@ -66,10 +119,22 @@ def ssh(connection_string, command, identity, port,
         passphrase=passphrase,
     )
 
+    if script:
+        # Imported only here, as it is not needed for other commands
+        from executors.staging import ScriptStager
+
+        with open(command, 'rb') as script_file:
+            content = script_file.read()
+        stager = ScriptStager(executor)
+        with executor:
+            res = stager.execute(content, command_args, stdin=input_file)
+        write_result(res)
+        return None
+
     with executor:
-        res = json_repr(*executor.execute(command, command_args))
+        res = executor.execute(command, command_args, stdin=input_file)
 
-    click.echo(res)
+    write_result(res)
 
 
 @click.command(context_settings={'ignore_unknown_options':True,})
@@ -77,7 +142,16 @@ def ssh(connection_string, command, identity, port,
 @click.argument('command')
 @click.argument('command_args', nargs=-1, type=click.UNPROCESSED)
 @click.password_option(confirmation_prompt=False, default='')
-def telnet(connection_string, command, password, command_args):
+@click.option('--no-agent', is_flag=True,
+              help='If passed, will not use running agent')
+@click.option('--compress', is_flag=True,
+              help='If passed, outputs are gzipped on the remote host, if '
+                   'it has gzip and base64')
+@click.option('--input', 'input_file', type=click.File('rb'),
+              help='File to stream to COMMAND\'s stdin, "-" for stdin, '
+                   'agent is not used then')
+def telnet(connection_string, command, password, no_agent, compress,
+           input_file, command_args):
     """ Will execute COMMAND via telnet
 
     Please pass CONNECTION_STRING in the followin format: <username>@<host>
@@ -87,23 +161,292 @@ def telnet(connection_string, command, password, command_args):
     COMMAND_ARGS: params, passed to COMMAND, please prepend them with "--"\n
     """
     user, _, host = parse_connection_string(connection_string)
+    transfer = 'compressed' if compress else 'plain'
+
+    client = None if no_agent or input_file else connect_agent()
+    if client is not None:
+        with client:
+            try:
+                res = client.execute(
+                    'telnet', host, command, command_args,
+                    user=user,
+                    password=password,
+                    transfer=transfer,
+                )
+            except ValueError as err:
+                click.echo(err)
+                return None
+        write_result(res)
+        return None
 
     try:
-        executor = TelnetExecutor(host, user, password)
+        executor = registry.get('telnet')(host, user, password,
+                                          transfer=transfer)
     except ValueError as err:
         click.echo(err)
         return None
 
-    res = json_repr(*executor.execute(command, parameters=command_args))
-    click.echo(res)
+    res = executor.execute(command, parameters=command_args,
+                           stdin=input_file)
+    write_result(res)
+
+
+@click.command(context_settings={'ignore_unknown_options':True,})
+@click.argument('inventory', type=click.File('r'))
+@click.argument('command')
+@click.argument('command_args', nargs=-1, type=click.UNPROCESSED)
+@click.option('-t', '--transport', type=click.Choice(['ssh', 'telnet']),
+              default='ssh', help='How to connect to hosts.', show_default=True)
+@click.option('-i', '--identity', help='Full path to identity file')
+@click.option('-p', '--port', type=click.INT,
+              help='Port to connect, defaults to the transport\'s one.')
+@click.option('--rpass', is_flag=True,
+              help='If passed, will request password for hosts without it')
+@click.option('--rphrase', is_flag=True,
+              help='If passed will request passphrase for identity file')
+@click.option('-c', '--concurrency', type=click.IntRange(min=1), default=64,
+              help='Max number of hosts processed at once by each process.',
+              show_default=True)
+@click.option('-P', '--processes', type=click.IntRange(min=1), default=1,
+              help='Number of worker processes, hosts are shared between '
+                   'them.', show_default=True)
+@click.option('--timeout', type=click.FLOAT, default=60,
+              help='Seconds given to each host, including connection.',
+              show_default=True)
+@click.option('--group', is_flag=True,
+              help='If passed, prints equal results once, with their hosts, '
+                   'after all hosts are done.')
+def fanout(inventory, command, transport, identity, port, rpass, rphrase,
+           concurrency, processes, timeout, group, command_args):
+    """Will execute COMMAND on every host from INVENTORY
+
+    INVENTORY: file with connection strings, one per line, in the format
+    [username[:password]@]<host>, pass "-" to read it from stdin
+
+    COMMAND: command to execute
+
+    COMMAND_ARGS: params, passed to COMMAND, please prepend them with "--"\n
+
+    Result of each host is printed as JSON line as soon as host is done.
+    With --group, each distinct result or error is printed once, as JSON line
+    with the hosts, which got it, most common first, followed by the summary
+    on stderr. With --processes, hosts are shared between worker processes,
+    each with its own connections and --concurrency, to use more than one
+    core.
+    """
+    targets = [parse_connection_string(connection_string)
+               for connection_string in parse_inventory(inventory)]
+
+    password = getpass.getpass('Password: ') if rpass else None
+    passphrase = getpass.getpass('Passphrase: ') if rphrase else None
+
+    executor_class = registry.get(transport)
+
+    def run_ssh(target, deadline):
+        user, host_password, host = target
+        executor = executor_class(
+            host,
+            port=port or SSH_PORT,
+            user=user,
+            password=host_password or password,
+            key_path=identity,
+            passphrase=passphrase,
+            timeout=timeout,
+        )
+        try:
+            executor.connect(deadline)
+            return executor.execute(command, command_args, deadline=deadline)
+        finally:
+            executor.disconnect()
+
+    def run_telnet(target, deadline):
+        user, host_password, host = target
+        with executor_class(host, user, host_password or password,
+                            port=port, timeout=timeout,
+                            deadline=deadline) as executor:
+            return executor.execute(command, command_args, deadline=deadline)
+
+    task = run_ssh if transport == 'ssh' else run_telnet
+    if processes > 1:
+        # multiprocessing is imported only when worker processes are used
+        from executors.shard import sharded_fan_out
+        results = sharded_fan_out(targets, task, processes, concurrency,
+                                  timeout, deadlines=True)
+    else:
+        results = fan_out(targets, task, concurrency, timeout, deadlines=True)
+
+    if group:
+        print_groups(results)
+        return None
+
+    writer = result_writer()
+    for target, result, err in results:
+        user, _, host = target
+        if err is not None:
+            writer.write_error(err, host=host, user=user)
+        else:
+            writer.write_result(result, host=host, user=user)
+
+
+def print_groups(results):
+    """ Will print distinct results of fanout with their hosts """
+    # Imported only here, as it is not needed for other commands
+    from executors.aggregate import FleetAggregator
+
+    aggregator = FleetAggregator()
+    for (user, _, host), result, err in results:
+        aggregator.add(host if user is None else f'{user}@{host}', result,
+                       err)
+
+    writer = result_writer()
+    for result_group in aggregator.groups():
+        extra = {'group': result_group.id, 'count': result_group.count,
+                 'hosts': result_group.hosts}
+        if result_group.error is not None:
+            writer.write_error(result_group.error, **extra)
+        else:
+            writer.write_result(result_group.result(), **extra)
+    click.echo(aggregator.summary(), err=True)
+
+
+@click.command()
+@click.argument('playbook_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='File to write results to, stdout by default')
+@click.option('--resume', is_flag=True,
+              help='If passed, will skip commands completed according to '
+                   'existing output file')
+@click.option('-c', '--concurrency', type=click.IntRange(min=1),
+              help='Max number of hosts processed at once, overrides '
+                   'playbook\'s one')
+@click.option('--per-host', type=click.IntRange(min=1),
+              help='Max number of connections to the same host, overrides '
+                   'playbook\'s one')
+def playbook(playbook_path, output, resume, concurrency, per_host):
+    """ Will execute commands described by PLAYBOOK_PATH
+
+    PLAYBOOK_PATH: JSON or YAML file, see executors.playbook
+
+    Result of each command is written as JSON line as soon as it is done,
+    whatever --format is, as --resume reads these lines back.
+    Commands of the same host run in order over one connection.
+    """
+    try:
+        book = load_playbook(playbook_path)
+    except ValueError as err:
+        click.echo(err)
+        return None
+
+    done = set()
+    if resume:
+        if output is None:
+            click.echo('--resume needs --output')
+            return None
+        if os.path.exists(output):
+            with open(output) as previous:
+                done = read_done(previous)
+
+    runner = PlaybookRunner(book, concurrency, per_host, done)
+    output_file = click.open_file(output or '-', 'a' if resume else 'w')
+    with output_file:
+        if resume and output_file.tell():
+            # Last line may be cut by the crash
+            output_file.write('\n')
+        for result in runner.run():
+            output_file.write(simplejson.dumps(result) + '\n')
+            output_file.flush()
+
+
+@click.group()
+def agent():
+    """ Manages agent, which keeps connections warm between calls
+
+    While agent is running, ssh and telnet commands are executed by it,
+    reusing its connections. Socket path is taken from MCDUCK_AGENT_SOCKET
+    environment variable, if it is set.
+    """
+
+
+@agent.command()
+@click.option('-f', '--foreground', is_flag=True,
+              help='If passed, will not detach from the terminal')
+def start(foreground):
+    """ Will start agent in the background """
+    from executors.agent import AgentServer
+
+    try:
+        server = AgentServer()
+    except ValueError as err:
+        click.echo(err)
+        return None
+
+    if not foreground:
+        if os.fork():
+            click.echo(f'Agent is listening at {server.socket_path}')
+            # Socket belongs to the child now, don't clean it up
+            os._exit(0)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in range(3):
+            os.dup2(devnull, fd)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+@agent.command()
+def stop():
+    """ Will stop running agent """
+    client = connect_agent()
+    if client is None:
+        click.echo('Agent is not running')
+        return None
+
+    with client:
+        client.request({'op': 'stop'})
+
+
+@agent.command()
+def status():
+    """ Will print pid and pools stats of running agent """
+    client = connect_agent()
+    if client is None:
+        click.echo('Agent is not running')
+        return None
+
+    with client:
+        click.echo(simplejson.dumps({
+            **client.request({'op': 'ping'}),
+            **client.request({'op': 'stats'}),
+        }))
+
+
+def connect_agent():
+    """:return: AgentClient connected to running agent or None"""
+    from executors.agent import AgentClient
+
+    try:
+        return AgentClient.connect()
+    except ValueError as err:
+        # Commands connect directly then, without sending credentials there
+        click.echo(f'Agent is not used: {err}', err=True)
+        return None
+
+
+def result_writer():
+    """:return: writer of results in the format, chosen for the run"""
+    context = click.get_current_context()
+    if context.obj is None:
+        # Subcommand is invoked without the group
+        context.obj = new_writer(DEFAULT_FORMAT, sys.stdout.buffer)
+    return context.obj
 
 
-def json_repr(code, output, err):
-    return simplejson.dumps({
-        'code': code,
-        'stdout': output,
-        'stderr': err,
-    })
+def write_result(result, **extra):
+    """ Will write result of the command in the format, chosen for the run """
+    result_writer().write_result(result, **extra)
 
 
 def parse_connection_string(connection_string):
@@ -133,6 +476,9 @@ def parse_connection_string(connection_string):
 cli.add_command(local)
 cli.add_command(ssh)
 cli.add_command(telnet)
+cli.add_command(fanout)
+cli.add_command(playbook)
+cli.add_command(agent)
 
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from benchmarks.servers import SSHStandInServer, TelnetStandInServer
+from executors.agent import AgentClient, AgentServer
+
+
+class TestAgent(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(directory, 'agent.sock')
+        self.server = AgentServer(self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def client(self):
+        return AgentClient.connect(self.socket_path)
+
+    def test_socket_is_private(self):
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+    def test_not_running(self):
+        self.assertIsNone(AgentClient.connect(self.socket_path + '.missing'))
+
+    def test_directory_of_other_mode_refused(self):
+        directory = os.path.dirname(self.socket_path)
+        os.chmod(directory, 0o755)
+        self.addCleanup(os.chmod, directory, 0o700)
+
+        with self.assertRaises(ValueError):
+            AgentClient.connect(self.socket_path)
+        with self.assertRaises(ValueError):
+            AgentServer(os.path.join(directory, 'other.sock'))
+
+    def test_symlinked_directory_refused(self):
+        link = os.path.join(tempfile.mkdtemp(), 'agent')
+        os.symlink(os.path.dirname(self.socket_path), link)
+        self.addCleanup(os.unlink, link)
+
+        with self.assertRaises(ValueError):
+            AgentClient.connect(os.path.join(link, 'agent.sock'))
+
+    def test_already_running(self):
+        with self.assertRaises(ValueError):
+            AgentServer(self.socket_path)
+
+    def test_ssh_connection_reused(self):
+        with SSHStandInServer() as server:
+            options = {'port': server.port, 'user': server.user,
+                       'password': server.password}
+            for _ in range(3):
+                with self.client() as client:
+                    result = client.execute('ssh', '127.0.0.1', 'echo',
+                                            ('hello',), **options)
+                self.assertEqual(result, (0, 'hello\n', ''))
+
+            with self.client() as client:
+                stats = client.request({'op': 'stats'})['ssh']
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 2)
+
+    def test_binary_output(self):
+        with SSHStandInServer() as server:
+            with self.client() as client:
+                result = client.execute('ssh', '127.0.0.1', "printf '\\377'",
+                                        port=server.port, user=server.user,
+                                        password=server.password)
+        self.assertEqual(result.code, 0)
+        self.assertEqual(bytes(result.stdout_bytes), b'\xff')
+
+    def test_telnet_session_reused(self):
+        with TelnetStandInServer() as server:
+            options = {'port': server.port, 'user': server.user,
+                       'password': server.password}
+            with self.client() as client:
+                for _ in range(3):
+                    result = client.execute('telnet', '127.0.0.1', 'pwd',
+                                            **options)
+                    self.assertEqual(result[0], 0)
+                stats = client.request({'op': 'stats'})['telnet']
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 2)
+
+    def test_error(self):
+        with TelnetStandInServer() as server:
+            with self.client() as client:
+                with self.assertRaises(ValueError):
+                    client.execute('telnet', '127.0.0.1', 'pwd',
+                                   port=server.port, user=server.user,
+                                   password='wrong')
+                # Connection is still usable
+                self.assertIn('pid', client.request({'op': 'ping'}))
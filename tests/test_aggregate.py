@@ -0,0 +1,65 @@
+import unittest
+
+from executors.aggregate import FleetAggregator, PayloadStore
+from executors.base import CommandResult
+from executors.capture import CapturePolicy
+from executors.local import LocalExecutor
+
+
+class TestPayloadStore(unittest.TestCase):
+    def test_kept_once(self):
+        store = PayloadStore()
+        first = store.add(b'Linux\n')
+        second = store.add(memoryview(b'xLinux\n')[1:])
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(store.add(b''), first)
+        self.assertEqual(store.get(first), b'Linux\n')
+        self.assertEqual((len(store), store.received, store.kept),
+                         (2, 12, 6))
+
+
+class TestFleetAggregator(unittest.TestCase):
+    def setUp(self):
+        self.aggregator = FleetAggregator()
+
+    def test_groups(self):
+        for index in range(5):
+            self.aggregator.add(f'a{index}',
+                                CommandResult(0, b'5.15\n', b'', 'utf-8'))
+        self.aggregator.add('b', (0, '5.4\nx86_64\n', ''))
+        self.aggregator.add('c', error=TimeoutError('took too long'))
+        self.aggregator.add('d', error=TimeoutError('took too long'))
+
+        groups = self.aggregator.groups()
+
+        self.assertEqual([group.count for group in groups], [5, 2, 1])
+        self.assertEqual(groups[0].hosts, [f'a{index}' for index in range(5)])
+        self.assertEqual(tuple(groups[0].result()), (0, '5.15\n', ''))
+        self.assertIsNone(groups[1].result())
+        self.assertEqual(self.aggregator.summary(), '\n'.join((
+            '5 hosts: code 0, "5.15"',
+            '2 hosts: TimeoutError: took too long',
+            '1 host: code 0, "5.4 ..."',
+        )))
+        self.assertEqual(self.aggregator.stats(), {
+            'hosts': 8, 'groups': 3, 'payloads': 3,
+            'received_bytes': 36, 'kept_bytes': 16,
+        })
+
+    def test_code_differs(self):
+        self.aggregator.add('a', (0, '', ''))
+        self.aggregator.add('b', (1, '', ''))
+
+        self.assertEqual(len(self.aggregator.groups()), 2)
+
+    def test_spooled(self):
+        executor = LocalExecutor(capture=CapturePolicy.spool(threshold=10))
+        self.aggregator.add('a', executor.execute('seq', ('1', '10000')))
+        self.aggregator.add('b', executor.execute('seq', ('1', '10000')))
+        self.aggregator.add('c', LocalExecutor().execute('seq', ('1', '10000')))
+
+        group, = self.aggregator.groups()
+        self.assertEqual(group.count, 3)
+        self.assertEqual(group.result().stdout_bytes,
+                         b''.join(b'%d\n' % i for i in range(1, 10001)))
\ No newline at end of file
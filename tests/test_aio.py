@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from executors.aio import (
+    AsyncLocalExecutor,
+    AsyncSSHExecutor,
+    AsyncTelnetExecutor,
+)
+from executors.capture import CapturePolicy
+from executors.deadline import Deadline, DeadlineExceeded, ExecutionCancelled
+
+
+class TestAsyncLocalExecutor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.executor = AsyncLocalExecutor()
+
+    async def test_ok(self):
+        return_code, stdout, stderr = await self.executor.execute('pwd')
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(stdout.strip(), '/app')
+        self.assertEqual(stderr.strip(), '')
+
+    async def test_command_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            await self.executor.execute('unknowncommand')
+
+    async def test_concurrent(self):
+        results = await asyncio.gather(*[
+            self.executor.execute('echo', (str(i),)) for i in range(20)
+        ])
+
+        self.assertEqual([stdout for _, stdout, _ in results],
+                         [f'{i}\n' for i in range(20)])
+
+    async def test_stdin(self):
+        async def chunks():
+            for i in range(3):
+                yield b'%d\n' % i
+
+        result = await self.executor.execute('cat', stdin=chunks())
+        self.assertEqual(tuple(result), (0, '0\n1\n2\n', ''))
+
+        result = await self.executor.execute('wc', ('-c',), stdin=b'a' * 10000)
+        self.assertEqual(result.stdout.strip(), '10000')
+
+    async def test_deadline(self):
+        with self.assertRaises(DeadlineExceeded):
+            await self.executor.execute('sleep', ('5',), Deadline(0.2))
+
+        result = await self.executor.execute('echo', ('ok',), Deadline(5))
+        self.assertEqual(result.stdout, 'ok\n')
+
+    async def test_cancelled(self):
+        deadline = Deadline(30)
+        started = time.monotonic()
+        threading.Timer(0.2, deadline.cancel).start()
+
+        with self.assertRaises(ExecutionCancelled):
+            await self.executor.execute('sleep', ('5',), deadline)
+        self.assertLess(time.monotonic() - started, 3)
+
+    async def test_stdin_keyword_only(self):
+        with self.assertRaises(TypeError):
+            await self.executor.execute('cat', None, None, b'data')
+
+
+class TestAsyncSSHExecutor(unittest.IsolatedAsyncioTestCase):
+    async def test_ok(self):
+        async with AsyncSSHExecutor('127.0.0.1', user='admin',
+                                    password='sIcretandsecYre') as executor:
+            return_code, stdout, stderr = await executor.execute('pwd')
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(stdout.strip(), '/home/admin')
+
+    async def test_io_pool(self):
+        with ThreadPoolExecutor(max_workers=2) as io_pool:
+            async with AsyncSSHExecutor('127.0.0.1', io_pool=io_pool,
+                                        user='admin',
+                                        password='sIcretandsecYre') as executor:
+                results = await asyncio.gather(*(
+                    executor.execute('echo', (str(index),))
+                    for index in range(5)))
+
+        self.assertEqual([result.stdout for result in results],
+                         [f'{index}\n' for index in range(5)])
+
+    async def test_wrong_password(self):
+        executor = AsyncSSHExecutor('127.0.0.1', user='admin',
+                                    password='wrongpassword')
+        with self.assertRaises(ValueError):
+            await executor.connect()
+
+
+class TestAsyncTelnetExecutor(unittest.IsolatedAsyncioTestCase):
+    async def test_ok(self):
+        async with AsyncTelnetExecutor('127.0.0.1', 'admin',
+                                       'sIcretandsecYre') as executor:
+            return_code, stdout, stderr = await executor.execute('pwd')
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(stdout.strip(), '/home/admin')
+        self.assertEqual(stderr.strip(), '')
+
+    async def test_command_failed(self):
+        async with AsyncTelnetExecutor('127.0.0.1', 'admin',
+                                       'sIcretandsecYre') as executor:
+            return_code, stdout, stderr = await executor.execute('which')
+
+        self.assertEqual(return_code, 1)
+        self.assertEqual(stdout.strip(), '')
+
+    async def test_capture(self):
+        for transfer in ('plain', 'compressed'):
+            async with AsyncTelnetExecutor(
+                    '127.0.0.1', 'admin', 'sIcretandsecYre',
+                    capture=CapturePolicy.memory(max_bytes=4),
+                    transfer=transfer) as executor:
+                result = await executor.execute('echo', ('abcdef',))
+
+            self.assertEqual(bytes(result.stdout_bytes), b'abcd')
+            self.assertTrue(result.stdout_dropped)
+
+    async def test_cancelled(self):
+        deadline = Deadline(30)
+        threading.Timer(0.2, deadline.cancel).start()
+        async with AsyncTelnetExecutor('127.0.0.1', 'admin',
+                                       'sIcretandsecYre') as executor:
+            with self.assertRaises(ExecutionCancelled):
+                await executor.execute('sleep', ('5',), deadline)
+
+    async def test_wrong_password(self):
+        executor = AsyncTelnetExecutor('127.0.0.1', 'admin',
+                                       'IncorrectPassword')
+        with self.assertRaises(ValueError):
+            await executor.connect()
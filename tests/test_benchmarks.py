@@ -0,0 +1,53 @@
+import unittest
+
+from benchmarks import formats
+from benchmarks.run import percentile, run
+from benchmarks.servers import TelnetStandInServer
+from executors.telnet import TelnetExecutor
+
+
+class TestStandInServers(unittest.TestCase):
+    def test_telnet_login_failed(self):
+        with TelnetStandInServer() as server:
+            with self.assertRaises(ValueError):
+                TelnetExecutor('127.0.0.1', server.user, 'wrong',
+                               port=server.port)
+
+    def test_run(self):
+        results = run(latency=0.001, output_sizes=(10, 100000), repeat=3,
+                      connects=1)
+
+        self.assertEqual([(result['executor'], result['output_size'])
+                          for result in results],
+                         [('local', 10), ('local', 100000),
+                          ('ssh', 10), ('ssh', 100000),
+                          ('telnet', 10), ('telnet', 100000)])
+        for result in results:
+            self.assertGreater(result['commands_per_sec'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+        self.assertIn('connect_p50', results[2])
+
+
+class TestPercentile(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertIsNone(percentile([], 50))
+
+
+class TestFormats(unittest.TestCase):
+    def test_run(self):
+        measurements = formats.run(output_sizes=(10, 100000),
+                                   total_bytes=200000, max_count=100)
+
+        # msgpack is measured only if it is installed
+        self.assertLessEqual({('json', 10), ('ndjson', 100000),
+                              ('raw', 100000)},
+                             {(measurement['format'],
+                               measurement['output_size'])
+                              for measurement in measurements})
+        for measurement in measurements:
+            self.assertGreater(measurement['results_per_sec'], 0)
+        self.assertIn('cpu_per_result', formats.format_table(measurements))
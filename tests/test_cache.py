@@ -0,0 +1,198 @@
+import threading
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from executors.base import BaseExecutor, CommandResult
+from executors.cache import CachingExecutor, ResultCache
+from executors.capture import CapturePolicy
+from executors.deadline import Deadline
+from executors.local import LocalExecutor
+
+
+class FakeExecutor(BaseExecutor):
+    def __init__(self, host='10.0.0.1', user='admin', delay=0, code=0,
+                 port=22):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.delay = delay
+        self.code = code
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def execute(self, command, parameters=None, deadline=None, *,
+                stdin=None):
+        self.deadline = deadline
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return self.code, f'{command} {parameters} {self.calls}', ''
+
+
+class TestCachingExecutor(unittest.TestCase):
+    def test_hit(self):
+        fake = FakeExecutor()
+        executor = CachingExecutor(fake)
+
+        first = executor.execute('uname', ('-a',))
+        second = executor.execute('uname', ('-a',))
+
+        self.assertEqual(first, second)
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual(executor.cache.stats()['hits'], 1)
+
+    def test_key(self):
+        cache = ResultCache()
+        admin = CachingExecutor(FakeExecutor(), cache)
+        root = CachingExecutor(FakeExecutor(user='root'), cache)
+        container = CachingExecutor(FakeExecutor(port=2222), cache)
+
+        admin.execute('nproc')
+        admin.execute('uname', ('-a',))
+        root.execute('nproc')
+        container.execute('nproc')
+        compressed = FakeExecutor()
+        compressed.transfer = 'compressed'
+        CachingExecutor(compressed, cache).execute('nproc')
+
+        self.assertEqual(cache.stats()['misses'], 5)
+
+    def test_capture_not_cached(self):
+        fake = FakeExecutor()
+        fake.capture = CapturePolicy.spool()
+        executor = CachingExecutor(fake)
+
+        executor.execute('nproc')
+        executor.execute('nproc')
+
+        self.assertEqual(fake.calls, 2)
+        self.assertEqual(executor.cache.stats()['size'], 0)
+
+    def test_cache_hit_event(self):
+        fake = FakeExecutor()
+        executor = CachingExecutor(fake)
+        events = []
+        executor.add_listener(events.append)
+
+        executor.execute('nproc')
+        executor.execute('nproc')
+
+        self.assertEqual(fake.listeners, (events.append,))
+        self.assertEqual([event.phase for event in events],
+                         ['execute.cache_hit'])
+        self.assertEqual(events[0].executor.host, fake.host)
+
+    def test_deadline_forwarded(self):
+        fake = FakeExecutor()
+        deadline = Deadline(10)
+
+        CachingExecutor(fake).execute('nproc', deadline=deadline)
+
+        self.assertIs(fake.deadline, deadline)
+
+    def test_binary_output(self):
+        class Binary(FakeExecutor):
+            def execute(self, command, parameters=None, deadline=None):
+                super().execute(command, parameters)
+                return CommandResult(0, b'\xff', b'', 'utf-8')
+
+        fake = Binary()
+        executor = CachingExecutor(fake)
+
+        executor.execute('cat')
+        result = executor.execute('cat')
+
+        self.assertEqual(result.stdout_bytes, b'\xff')
+        self.assertEqual(fake.calls, 1)
+
+    def test_ttl(self):
+        fake = FakeExecutor()
+        executor = CachingExecutor(fake, ttl=0.05)
+
+        executor.execute('nproc')
+        time.sleep(0.1)
+        executor.execute('nproc', ttl=0)
+        executor.execute('nproc')
+
+        self.assertEqual(fake.calls, 3)
+
+    def test_failures_not_kept(self):
+        fake = FakeExecutor(code=1)
+        executor = CachingExecutor(fake)
+
+        executor.execute('nproc')
+        executor.execute('nproc')
+
+        self.assertEqual(fake.calls, 2)
+
+    def test_lru(self):
+        fake = FakeExecutor()
+        executor = CachingExecutor(fake, ResultCache(max_size=2))
+
+        executor.execute('a')
+        executor.execute('b')
+        executor.execute('a')
+        executor.execute('c')
+        executor.execute('a')
+        executor.execute('b')
+
+        self.assertEqual(fake.calls, 4)
+        self.assertEqual(executor.cache.stats()['evictions'], 2)
+
+    def test_invalidate(self):
+        cache = ResultCache()
+        fake = FakeExecutor()
+        executor = CachingExecutor(fake, cache)
+        other = CachingExecutor(FakeExecutor(host='10.0.0.2'), cache)
+        for command in ('a', 'b'):
+            executor.execute(command)
+            other.execute(command)
+
+        self.assertEqual(executor.invalidate('a'), 1)
+        self.assertEqual(executor.invalidate(), 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+        executor.execute('a')
+        self.assertEqual(fake.calls, 3)
+
+    def test_single_flight(self):
+        fake = FakeExecutor(delay=0.1)
+        executor = CachingExecutor(fake)
+
+        with ThreadPoolExecutor(10) as pool:
+            results = list(pool.map(lambda _: executor.execute('nproc'),
+                                    range(10)))
+
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(executor.cache.stats()['coalesced'], 9)
+
+    def test_error_shared(self):
+        class Failing(FakeExecutor):
+            def execute(self, command, parameters=None, deadline=None):
+                super().execute(command, parameters)
+                raise ValueError('Transport must be opened')
+
+        fake = Failing(delay=0.1)
+        executor = CachingExecutor(fake)
+
+        def execute(_):
+            with self.assertRaises(ValueError):
+                executor.execute('nproc')
+
+        with ThreadPoolExecutor(5) as pool:
+            list(pool.map(execute, range(5)))
+        self.assertEqual(fake.calls, 1)
+
+        with self.assertRaises(ValueError):
+            executor.execute('nproc')
+        self.assertEqual(fake.calls, 2)
+
+    def test_local(self):
+        executor = CachingExecutor(LocalExecutor())
+
+        self.assertEqual(executor.execute('echo', ('hi',)), (0, 'hi\n', ''))
+        self.assertEqual(executor.execute('echo', ('hi',)), (0, 'hi\n', ''))
+        self.assertEqual(executor.encoding, 'utf-8')
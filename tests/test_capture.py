@@ -0,0 +1,124 @@
+import unittest
+
+from executors.base import CommandResult, ExecutionResult
+from executors.capture import CapturePolicy
+from executors.local import LocalExecutor
+
+
+class TestSinks(unittest.TestCase):
+    def test_memory(self):
+        sink = CapturePolicy.memory().new_sink()
+        for chunk in (b'ab', b'cd', b'e'):
+            self.assertTrue(sink.write(chunk))
+
+        self.assertEqual(sink.getvalue(), b'abcde')
+        self.assertEqual(sink.dropped, 0)
+
+    def test_max_bytes(self):
+        sink = CapturePolicy.memory(max_bytes=3).new_sink()
+
+        self.assertTrue(sink.write(b'ab'))
+        self.assertFalse(sink.write(b'cd'))
+        self.assertTrue(sink.exceeded)
+        self.assertEqual(sink.getvalue(), b'abc')
+        self.assertEqual(sink.dropped, 1)
+
+    def test_skip(self):
+        sink = CapturePolicy.memory(max_bytes=3).new_sink()
+        sink.write(b'abc')
+        sink.skip(5)
+
+        self.assertTrue(sink.exceeded)
+        self.assertEqual(sink.dropped, 5)
+
+    def test_spool(self):
+        sink = CapturePolicy.spool(threshold=4).new_sink()
+        sink.write(b'abcd')
+        self.assertFalse(sink.spooled)
+        sink.write(b'ef')
+        self.assertTrue(sink.spooled)
+
+        self.assertEqual(sink.getvalue(), b'abcdef')
+        self.assertEqual(sink.open().read(), b'abcdef')
+
+    def test_head_tail(self):
+        sink = CapturePolicy.head_tail(head=3, tail=4).new_sink()
+        for chunk in (b'ab', b'cdefg', b'hi', b'j', b'klm'):
+            sink.write(chunk)
+
+        self.assertEqual(sink.getvalue(), b'abcjklm')
+        self.assertEqual(sink.received, 13)
+        self.assertEqual(sink.dropped, 6)
+
+    def test_head_tail_short(self):
+        sink = CapturePolicy.head_tail(head=3, tail=4).new_sink()
+        sink.write(b'abcde')
+
+        self.assertEqual(sink.getvalue(), b'abcde')
+        self.assertEqual(sink.dropped, 0)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            CapturePolicy('everything')
+
+
+class TestCommandResult(unittest.TestCase):
+    def test_tuple_compatible(self):
+        result = CommandResult(1, b'out', memoryview(b'\xc3\xa9rr'), 'utf-8')
+        code, stdout, stderr = result
+
+        self.assertEqual((code, stdout, stderr), (1, 'out', '\xe9rr'))
+        self.assertEqual(result, (1, 'out', '\xe9rr'))
+        self.assertEqual(result[1], 'out')
+        self.assertEqual(len(result), 3)
+        self.assertFalse(result.limit_exceeded)
+
+    def test_lazy_decoding(self):
+        result = CommandResult(0, b'\xff', b'', 'utf-8')
+
+        self.assertEqual(result.code, 0)
+        self.assertEqual(result.stdout_bytes, b'\xff')
+        with self.assertRaises(UnicodeDecodeError):
+            result.stdout
+        self.assertEqual(result[0], 0)
+        self.assertEqual(result[-1], '')
+        self.assertEqual(result, CommandResult(0, memoryview(b'\xff'), b'',
+                                               'UTF8'))
+        self.assertNotEqual(result, CommandResult(1, b'\xff', b'', 'utf-8'))
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            CommandResult(0, b'', b'', 'ascii').extra = 1
+
+
+class TestExecutionResult(unittest.TestCase):
+    def test_tuple_compatible(self):
+        stdout = CapturePolicy.memory().new_sink()
+        stdout.write('héllo'.encode('utf-8'))
+        stderr = CapturePolicy.memory().new_sink()
+        result = ExecutionResult(0, stdout, stderr, 'utf-8', 'memory')
+
+        return_code, out, err = result
+        self.assertEqual((return_code, out, err), (0, 'héllo', ''))
+        self.assertEqual(result, (0, 'héllo', ''))
+        self.assertEqual(result[1], 'héllo')
+        self.assertEqual(result.policy, 'memory')
+
+
+class TestLocalExecutorCapture(unittest.TestCase):
+    def test_head_tail(self):
+        executor = LocalExecutor(capture=CapturePolicy.head_tail(4, 7))
+        result = executor.execute('seq', ('1', '100000'))
+
+        self.assertEqual(result.code, 0)
+        self.assertEqual(result.stdout, '1\n2\n100000\n')
+        self.assertEqual(result.stdout_dropped, 588895 - 11)
+        self.assertFalse(result.limit_exceeded)
+
+    def test_max_bytes_kills_command(self):
+        executor = LocalExecutor(capture=CapturePolicy.memory(max_bytes=1000))
+        result = executor.execute('yes')
+
+        self.assertNotEqual(result.code, 0)
+        self.assertTrue(result.limit_exceeded)
+        self.assertEqual(result.stdout, 'y\n' * 500)
@@ -0,0 +1,132 @@
+import threading
+import time
+import unittest
+
+from executors.deadline import (CircuitBreaker, CircuitOpenError, Deadline,
+                                DeadlineExceeded, ExecutionCancelled)
+from executors.local import LocalExecutor
+
+
+class TestDeadline(unittest.TestCase):
+    def test_remaining(self):
+        deadline = Deadline(10)
+
+        self.assertLessEqual(deadline.remaining(), 10)
+        self.assertEqual(deadline.remaining(1), 1)
+        self.assertEqual(Deadline().remaining(5), 5)
+        self.assertIsNone(Deadline().remaining())
+
+    def test_expired(self):
+        deadline = Deadline(0)
+
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.remaining()
+
+    def test_cancel(self):
+        deadline = Deadline(10)
+        calls = []
+        deadline.on_cancel(lambda: calls.append('registered'))
+        unregister = deadline.on_cancel(lambda: calls.append('unregistered'))
+        unregister()
+
+        deadline.cancel()
+        deadline.cancel()
+        deadline.on_cancel(lambda: calls.append('late'))
+
+        self.assertEqual(calls, ['registered', 'late'])
+        with self.assertRaises(ExecutionCancelled):
+            deadline.check()
+
+    def test_watch(self):
+        fired = threading.Event()
+
+        with Deadline(0.1).watch(fired.set):
+            self.assertTrue(fired.wait(1))
+
+        fired.clear()
+        with Deadline(0.1).watch(fired.set):
+            pass
+        self.assertFalse(fired.wait(0.2))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def fail(self, breaker, key):
+        with self.assertRaises(OSError):
+            breaker.call(key, self.raise_error)
+
+    @staticmethod
+    def raise_error():
+        raise OSError('Connection refused')
+
+    def test_opens(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=10)
+        self.fail(breaker, 'dead')
+        self.assertEqual(breaker.state('dead'), CircuitBreaker.CLOSED)
+        self.fail(breaker, 'dead')
+
+        self.assertEqual(breaker.state('dead'), CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.call('dead', lambda: 'never called')
+        self.assertEqual(breaker.call('alive', lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.stats(),
+                         {'open': 1, 'failing': 1, 'rejected': 1})
+
+    def test_success_resets(self):
+        breaker = CircuitBreaker(threshold=2)
+        self.fail(breaker, 'flaky')
+        breaker.call('flaky', lambda: None)
+        self.fail(breaker, 'flaky')
+
+        self.assertEqual(breaker.state('flaky'), CircuitBreaker.CLOSED)
+
+    def test_half_open(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0.1)
+        self.fail(breaker, 'host')
+        time.sleep(0.1)
+        self.assertEqual(breaker.state('host'), CircuitBreaker.HALF_OPEN)
+
+        # Failed trial opens the circuit again
+        self.fail(breaker, 'host')
+        with self.assertRaises(CircuitOpenError):
+            breaker.call('host', lambda: None)
+
+        time.sleep(0.1)
+        breaker.call('host', lambda: None)
+        self.assertEqual(breaker.state('host'), CircuitBreaker.CLOSED)
+
+    def test_cancellation_is_not_failure(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0.1)
+        self.fail(breaker, 'host')
+        time.sleep(0.1)
+
+        def cancelled():
+            raise ExecutionCancelled()
+
+        with self.assertRaises(ExecutionCancelled):
+            breaker.call('host', cancelled)
+        # Trial is released, next call is let through
+        self.assertEqual(breaker.call('host', lambda: 'ok'), 'ok')
+
+
+class TestLocalExecutorDeadline(unittest.TestCase):
+    def test_exceeded(self):
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            LocalExecutor().execute('sleep', ('5',), deadline=Deadline(0.2))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_cancelled(self):
+        deadline = Deadline()
+        threading.Timer(0.2, deadline.cancel).start()
+
+        started = time.monotonic()
+        with self.assertRaises(ExecutionCancelled):
+            LocalExecutor().execute('sleep', ('5',), deadline=deadline)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_in_time(self):
+        code, stdout, _ = LocalExecutor().execute('echo', ('ok',),
+                                                  deadline=Deadline(5))
+
+        self.assertEqual((code, stdout), (0, 'ok\n'))
\ No newline at end of file
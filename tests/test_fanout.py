@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+
+from executors.deadline import CircuitBreaker, CircuitOpenError
+from executors.fanout import fan_out, parse_inventory
+
+
+class TestParseInventory(unittest.TestCase):
+    def test_comments_and_blank_lines(self):
+        lines = ['# hosts\n', 'admin@first\n', '\n', '  second  \n']
+
+        self.assertEqual(parse_inventory(lines), ['admin@first', 'second'])
+
+
+class TestFanOut(unittest.TestCase):
+    def test_all_results(self):
+        results = list(fan_out(range(10), lambda target: target * 2, 3))
+
+        self.assertEqual(sorted(result for _, result, _ in results),
+                         [target * 2 for target in range(10)])
+        self.assertTrue(all(err is None for _, _, err in results))
+
+    def test_error(self):
+        def task(target):
+            raise ValueError(target)
+
+        [(target, result, err)] = fan_out(['host'], task, 1)
+
+        self.assertEqual(target, 'host')
+        self.assertIsNone(result)
+        self.assertIsInstance(err, ValueError)
+
+    def test_concurrency(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def task(target):
+            with lock:
+                running.append(target)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(target)
+
+        list(fan_out(range(12), task, 4))
+
+        self.assertEqual(max(peak), 4)
+
+    def test_timeout(self):
+        results = dict(
+            (target, err)
+            for target, _, err in fan_out([0, 10, 0], time.sleep, 2, 0.2)
+        )
+
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[10], TimeoutError)
+
+    def test_deadlines(self):
+        cancelled = []
+
+        def task(target, deadline):
+            # Tasks are bounded by fan-out timeout
+            assert deadline.remaining() <= 0.2
+            deadline.on_cancel(lambda: cancelled.append(target))
+            time.sleep(target)
+
+        results = dict(
+            (target, err)
+            for target, _, err in fan_out([0, 1], task, 2, 0.2,
+                                          deadlines=True)
+        )
+
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], TimeoutError)
+        self.assertEqual(cancelled, [1])
+
+    def test_breaker(self):
+        calls = []
+
+        def task(target):
+            calls.append(target)
+            raise OSError('Connection refused')
+
+        breaker = CircuitBreaker(threshold=2)
+        results = list(fan_out(['dead'] * 4, task, 1, breaker=breaker))
+
+        self.assertEqual(calls, ['dead', 'dead'])
+        self.assertEqual([type(err) for _, _, err in results],
+                         [OSError, OSError, CircuitOpenError,
+                          CircuitOpenError])
\ No newline at end of file
@@ -0,0 +1,145 @@
+import io
+import json
+import unittest
+
+from executors.base import CommandResult
+from executors.formats import (FORMATS, JsonWriter, NdjsonWriter, RawWriter,
+                               error_repr, json_repr, new_writer, read_frames)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class TestNewWriter(unittest.TestCase):
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            new_writer('xml', io.BytesIO())
+
+    def test_formats(self):
+        for name in FORMATS:
+            if name == 'msgpack' and msgpack is None:
+                continue
+            self.assertTrue(hasattr(new_writer(name, io.BytesIO()),
+                                    'write_result'))
+
+
+class TestJsonWriter(unittest.TestCase):
+    def test_write(self):
+        stream = io.BytesIO()
+        writer = JsonWriter(stream)
+        writer.write_result(CommandResult(0, 'Zürich\n'.encode(), b'',
+                                          'utf-8'), host='a')
+        writer.write_error(TimeoutError('too long'), host='b')
+
+        self.assertEqual(stream.getvalue(),
+                         b'{"code": 0, "stdout": "Z\\u00fcrich\\n", '
+                         b'"stderr": "", "host": "a"}\n'
+                         b'{"error": "TimeoutError: too long", "host": "b"}\n')
+
+    def test_json_repr(self):
+        self.assertEqual(json_repr(0, 'out', '', host='a'),
+                         '{"code": 0, "stdout": "out", "stderr": "", '
+                         '"host": "a"}')
+        self.assertEqual(error_repr(OSError('refused')),
+                         '{"error": "OSError: refused"}')
+
+    def test_invalid_utf8(self):
+        stream = io.BytesIO()
+        JsonWriter(stream).write_result(CommandResult(0, b'\xff\xfe ok\n',
+                                                      b'', 'utf-8'))
+
+        self.assertEqual(json.loads(stream.getvalue()),
+                         {'code': 0, 'stdout': '\ufffd\ufffd ok\n',
+                          'stderr': ''})
+
+
+class TestNdjsonWriter(unittest.TestCase):
+    def assertWritten(self, result, text, encoding='utf-8'):
+        stream = io.BytesIO()
+        NdjsonWriter(stream).write_result(result, host='a')
+
+        expected = json.dumps({'code': 1, 'stdout': text, 'stderr': 'err\n',
+                               'host': 'a'},
+                              ensure_ascii=False, separators=(',', ':'))
+        self.assertEqual(stream.getvalue(), expected.encode() + b'\n')
+
+    def test_escaped_as_bytes(self):
+        stdout = 'Zürich "1"\t\\ \r\n'
+        self.assertWritten(CommandResult(1, memoryview(stdout.encode()),
+                                         b'err\n', 'utf-8'), stdout)
+
+    def test_encoded(self):
+        # Control characters, other encodings and decoded outputs
+        self.assertWritten(CommandResult(1, b'\x1b[0m\x00', b'err\n',
+                                         'utf-8'), '\x1b[0m\x00')
+        self.assertWritten(CommandResult(1, b'Z\xfcrich', b'err\n',
+                                         'latin-1'), 'Zürich')
+        self.assertWritten((1, 'Zürich', 'err\n'), 'Zürich')
+
+    def test_invalid_utf8(self):
+        self.assertWritten(CommandResult(1, b'\xff\xfe ok\n', b'err\n',
+                                         'utf-8'), '\ufffd\ufffd ok\n')
+
+
+class TestRawWriter(unittest.TestCase):
+    def test_read_frames(self):
+        stream = io.BytesIO()
+        writer = RawWriter(stream)
+        writer.write_result(CommandResult(2, memoryview(b'x\xff\n'), b'err',
+                                          'latin-1'), host='a')
+        writer.write_error(OSError('refused'), host='b')
+        writer.write_result((0, 'Zürich', ''))
+        stream.seek(0)
+
+        self.assertEqual(list(read_frames(stream)), [
+            {'code': 2, 'stdout': b'x\xff\n', 'stderr': b'err',
+             'encoding': 'latin-1', 'host': 'a'},
+            {'error': 'OSError: refused', 'host': 'b'},
+            {'code': 0, 'stdout': 'Zürich'.encode(), 'stderr': b'',
+             'encoding': 'utf-8'},
+        ])
+
+    def test_invalid_utf8(self):
+        stream = io.BytesIO()
+        RawWriter(stream).write_result(CommandResult(0, b'\xff\xfe ok\n',
+                                                     b'', 'utf-8'))
+        stream.seek(0)
+
+        self.assertEqual(next(read_frames(stream))['stdout'],
+                         b'\xff\xfe ok\n')
+
+    def test_cut_frame(self):
+        stream = io.BytesIO()
+        RawWriter(stream).write_result(CommandResult(0, b'output', b'',
+                                                     'utf-8'))
+
+        with self.assertRaises(ValueError):
+            list(read_frames(io.BytesIO(stream.getvalue()[:-1])))
+
+
+@unittest.skipUnless(msgpack, 'msgpack is not installed')
+class TestMsgpackWriter(unittest.TestCase):
+    def test_write(self):
+        stream = io.BytesIO()
+        writer = new_writer('msgpack', stream)
+        writer.write_result(CommandResult(0, b'x\xff', b'', 'latin-1'),
+                            host='a')
+        writer.write_error('refused', host='b')
+        stream.seek(0)
+
+        self.assertEqual(list(msgpack.Unpacker(stream, raw=False)), [
+            {'code': 0, 'stdout': b'x\xff', 'stderr': b'',
+             'encoding': 'latin-1', 'host': 'a'},
+            {'error': 'refused', 'host': 'b'},
+        ])
+
+    def test_invalid_utf8(self):
+        stream = io.BytesIO()
+        new_writer('msgpack', stream).write_result(
+            CommandResult(0, b'\xff\xfe ok\n', b'', 'utf-8'))
+        stream.seek(0)
+
+        self.assertEqual(next(msgpack.Unpacker(stream, raw=False))['stdout'],
+                         b'\xff\xfe ok\n')
\ No newline at end of file
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+
+from benchmarks.servers import SSHStandInServer, TelnetStandInServer
+from executors.aio import AsyncTelnetExecutor
+from executors.local import LocalExecutor
+from executors.ssh import SSHExecutor
+from executors.telnet import TelnetExecutor
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+
+    def phases(self):
+        return [event.phase for event in self.events]
+
+    def test_local(self):
+        executor = LocalExecutor()
+        executor.add_listener(self.events.append)
+        executor.execute('echo', ('hello',))
+
+        self.assertEqual(self.phases(),
+                         ['execute.spawn', 'execute.run'])
+        self.assertEqual(self.events[1].nbytes, 6)
+        for event in self.events:
+            self.assertIs(event.executor, executor)
+            self.assertGreaterEqual(event.duration, 0)
+            self.assertFalse(event.failed)
+
+    def test_remove_listener(self):
+        executor = LocalExecutor()
+        executor.add_listener(self.events.append)
+        executor.remove_listener(self.events.append)
+        executor.execute('true')
+
+        self.assertEqual(self.events, [])
+
+    def test_failed_phase(self):
+        executor = LocalExecutor()
+        executor.add_listener(self.events.append)
+        with self.assertRaises(FileNotFoundError):
+            executor.execute('unknowncommand')
+
+        self.assertEqual(self.phases(), ['execute.spawn'])
+        self.assertTrue(self.events[0].failed)
+
+    def test_ssh(self):
+        with SSHStandInServer() as server:
+            executor = SSHExecutor('127.0.0.1', port=server.port,
+                                   user=server.user, password=server.password)
+            executor.add_listener(self.events.append)
+            with executor:
+                executor.execute('printf 12345')
+
+        self.assertEqual(self.phases(), [
+            'connect.dns', 'connect.tcp', 'connect.handshake',
+            'execute.channel_open', 'execute.wait', 'execute.transfer',
+        ])
+        self.assertEqual(self.events[5].nbytes, 5)
+
+    def test_telnet(self):
+        with TelnetStandInServer() as server:
+            executor = TelnetExecutor('127.0.0.1', server.user,
+                                      server.password, port=server.port,
+                                      listeners=[self.events.append])
+            executor.execute('printf 12345')
+            executor.close()
+
+        self.assertEqual(self.phases(), [
+            'connect.dns', 'connect.tcp', 'login.user', 'login.password',
+            'login.setup', 'execute.send', 'execute.wait', 'execute.transfer',
+            'execute.decode',
+        ])
+        self.assertEqual(self.events[7].nbytes, 5)
+
+    def test_async_telnet(self):
+        async def run(server):
+            executor = AsyncTelnetExecutor('127.0.0.1', server.user,
+                                           server.password, port=server.port)
+            executor.add_listener(self.events.append)
+            async with executor:
+                await executor.execute('printf 12345')
+
+        with TelnetStandInServer() as server:
+            asyncio.run(run(server))
+
+        self.assertEqual(self.phases(), [
+            'connect.tcp', 'login.user', 'login.password', 'login.setup',
+            'execute.send', 'execute.wait', 'execute.transfer',
+            'execute.decode',
+        ])
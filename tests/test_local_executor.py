@@ -1,6 +1,9 @@
+import io
 import unittest
 
-from executors.local import LocalExecutor
+from executors.capture import CapturePolicy
+from executors.deadline import Deadline, DeadlineExceeded
+from executors.local import LocalExecutor, LocalPool
 
 class TestLocalExecutor(unittest.TestCase):
     def setUp(self):
@@ -34,3 +37,145 @@ class TestLocalExecutor(unittest.TestCase):
         self.assertIn('..', stdout)
         self.assertIn('requirements.txt', stdout)
         self.assertEqual(stderr.strip(), '')
+
+    def test_raw_outputs(self):
+        result = self.executor.execute('printf', ('\\377',))
+
+        self.assertEqual(result.code, 0)
+        self.assertEqual(result.stdout_bytes, b'\xff')
+        # Not decoded until text is needed
+        with self.assertRaises(UnicodeDecodeError):
+            result.stdout
+
+class TestLocalExecutorStdin(unittest.TestCase):
+    def setUp(self):
+        self.executor = LocalExecutor()
+
+    def test_bytes(self):
+        data = bytes(range(256)) * 1000
+
+        result = self.executor.execute('cat', stdin=data)
+
+        self.assertEqual(result.stdout_bytes, data)
+
+    def test_file(self):
+        code, stdout, _ = self.executor.execute(
+            'wc', ('-l',), stdin=io.BytesIO(b'a\n' * 100000))
+
+        self.assertEqual((code, stdout.strip()), (0, '100000'))
+
+    def test_chunks(self):
+        chunks = (b'%d\n' % i for i in range(3))
+
+        self.assertEqual(tuple(self.executor.execute('cat', stdin=chunks)),
+                         (0, '0\n1\n2\n', ''))
+
+    def test_not_read(self):
+        # Command exits without reading stdin, the rest is dropped
+        code, stdout, _ = self.executor.execute(
+            'head', ('-c', '3'), stdin=b'abcdef' * 1000000)
+
+        self.assertEqual((code, stdout), (0, 'abc'))
+
+    def test_text(self):
+        with self.assertRaises(ValueError):
+            self.executor.execute('cat', stdin=['text'])
+
+    def test_capture(self):
+        executor = LocalExecutor(capture=CapturePolicy.head_tail(2, 2))
+
+        result = executor.execute('cat', stdin=b'abcdefgh')
+
+        self.assertEqual((result.stdout, result.stdout_dropped), ('abgh', 4))
+
+
+class TestLocalExecutorSession(unittest.TestCase):
+    def setUp(self):
+        self.executor = LocalExecutor(session=True)
+        self.addCleanup(self.executor.close)
+
+    def test_outputs(self):
+        result = self.executor.execute(
+            'sh', ('-c', 'printf out; echo err >&2; exit 3'))
+
+        self.assertEqual(tuple(result), (3, 'out', 'err\n'))
+
+    def test_parameters_not_interpreted(self):
+        _, stdout, _ = self.executor.execute('echo', ('$HOME', "it's", '*'))
+
+        self.assertEqual(stdout, "$HOME it's *\n")
+
+    def test_command_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            self.executor.execute('unknowncommand')
+        self.assertEqual(self.executor.execute('echo', ('ok',)).code, 0)
+
+    def test_state_kept(self):
+        self.executor.execute('cd', ('/',))
+
+        self.assertEqual(self.executor.execute('pwd').stdout, '/\n')
+
+    def test_shell_restarted(self):
+        self.assertEqual(self.executor.execute('exit', ('5',)).code, 5)
+        with self.assertRaises(DeadlineExceeded):
+            self.executor.execute('sleep', ('5',), deadline=Deadline(0.2))
+
+        self.assertEqual(tuple(self.executor.execute('echo', ('ok',))),
+                         (0, 'ok\n', ''))
+
+    def test_shell_died_while_idle(self):
+        self.executor.execute('true')
+        self.executor._shell.kill()
+        self.executor._shell.process.wait()
+
+        self.assertEqual(tuple(self.executor.execute('echo', ('ok',))),
+                         (0, 'ok\n', ''))
+
+    def test_large_output(self):
+        result = self.executor.execute('head', ('-c', '1000000',
+                                                '/dev/urandom'))
+
+        self.assertEqual(len(result.stdout_bytes), 1000000)
+
+    def test_capture_max_bytes(self):
+        executor = LocalExecutor(session=True,
+                                 capture=CapturePolicy.memory(max_bytes=10))
+        self.addCleanup(executor.close)
+
+        result = executor.execute('yes')
+
+        self.assertTrue(result.limit_exceeded)
+        self.assertEqual(result.stdout, 'y\n' * 5)
+
+    def test_stdin(self):
+        result = self.executor.execute('wc', ('-c',), stdin=b'abc')
+
+        self.assertEqual(result.stdout.strip(), '3')
+
+
+class TestLocalPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = LocalPool(size=4, session=True)
+        self.addCleanup(self.pool.close)
+
+    def test_as_completed(self):
+        results = list(self.pool.execute_as_completed(
+            [('sleep', ('0.5',)), ('echo', ('fast',))]))
+
+        self.assertEqual([index for index, _, _ in results], [1, 0])
+        self.assertEqual(tuple(results[0][1]), (0, 'fast\n', ''))
+
+    def test_execute_many(self):
+        results = self.pool.execute_many(
+            [('echo', (str(i),)) for i in range(20)])
+
+        self.assertEqual([stdout for _, stdout, _ in results],
+                         [f'{i}\n' for i in range(20)])
+
+    def test_timeout(self):
+        results = {index: error for index, _, error in
+                   self.pool.execute_as_completed([('sleep', ('5',)), 'true'],
+                                                  timeout=0.3)}
+
+        self.assertIsInstance(results[0], TimeoutError)
+        self.assertIsNone(results[1])
\ No newline at end of file
@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from benchmarks.servers import TelnetStandInServer
+from executors.playbook import Playbook, PlaybookRunner, read_done
+
+
+def local_host(*commands):
+    return {'transport': 'local', 'commands': [list(command)
+                                               for command in commands]}
+
+
+class TestPlaybook(unittest.TestCase):
+    def test_resolve(self):
+        document = {
+            'defaults': {'credentials': 'ops', 'timeout': 5},
+            'credentials': {'ops': {'user': 'admin',
+                                    'password_env': 'TEST_PLAYBOOK_PASSWORD'}},
+            'commands': ['uptime', ['ls', '-a']],
+            'hosts': [{'host': '10.0.0.1'},
+                      {'host': '10.0.0.2', 'transport': 'telnet',
+                       'user': 'root', 'commands': ['pwd']}],
+        }
+        with mock.patch.dict(os.environ, {'TEST_PLAYBOOK_PASSWORD': 'secret'}):
+            first, second = Playbook(document).jobs
+
+        self.assertEqual(first.options, {
+            'host': '10.0.0.1', 'transport': 'ssh', 'user': 'admin',
+            'password': 'secret', 'timeout': 5,
+        })
+        self.assertEqual(first.commands, [('uptime', None), ('ls', ('-a',))])
+        self.assertEqual(second.options['transport'], 'telnet')
+        self.assertEqual(second.options['user'], 'root')
+        self.assertEqual(second.commands, [('pwd', None)])
+
+    def test_missing_secret(self):
+        with mock.patch.dict(os.environ, clear=True):
+            with self.assertRaises(ValueError):
+                Playbook({'hosts': [{'host': '10.0.0.1',
+                                     'password_env': 'NOT_SET'}]})
+
+    def test_invalid(self):
+        for document in ({}, {'hosts': [{}]},
+                         {'hosts': [{'host': 'h', 'transport': 'ftp'}]},
+                         {'hosts': [{'host': 'h', 'credentials': 'none'}]},
+                         {'hosts': [{'host': 'h', 'commands': [[]]}]}):
+            with self.assertRaises(ValueError):
+                Playbook(document)
+
+
+class TestPlaybookRunner(unittest.TestCase):
+    def test_order(self):
+        playbook = Playbook({'hosts': [
+            local_host(*(['echo', str(index)] for index in range(5))),
+            local_host(['echo', 'other'], ['false']),
+        ]})
+
+        results = list(PlaybookRunner(playbook).run())
+
+        first = [result for result in results if result['job'] == 0]
+        self.assertEqual([result['stdout'] for result in first],
+                         [f'{index}\n' for index in range(5)])
+        second = [result for result in results if result['job'] == 1]
+        self.assertEqual([result['code'] for result in second], [0, 1])
+
+    def test_per_host_concurrency(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lock = os.path.join(directory, 'lock')
+            # mkdir fails if the other job holds the lock
+            command = ['sh', '-c', f'mkdir {lock} && sleep 0.05 && rmdir {lock}']
+            playbook = Playbook({'concurrency': 4, 'hosts': [
+                local_host(command) for _ in range(4)
+            ]})
+
+            results = list(PlaybookRunner(playbook).run())
+
+        self.assertEqual([result['code'] for result in results], [0] * 4)
+
+    def test_connection_error(self):
+        playbook = Playbook({'hosts': [{
+            'host': '127.0.0.1', 'port': 1, 'transport': 'telnet',
+            'timeout': 1, 'commands': ['pwd', 'ls'],
+        }]})
+
+        results = list(PlaybookRunner(playbook).run())
+
+        self.assertEqual([result['index'] for result in results], [0, 1])
+        for result in results:
+            self.assertIn('error', result)
+            self.assertNotIn('code', result)
+
+    def test_remote(self):
+        with TelnetStandInServer() as server, \
+                mock.patch.dict(os.environ, {'TEST_PLAYBOOK_PASSWORD':
+                                             server.password}):
+            playbook = Playbook({
+                'credentials': {'bench': {
+                    'user': server.user,
+                    'password_env': 'TEST_PLAYBOOK_PASSWORD',
+                }},
+                'hosts': [{'host': '127.0.0.1', 'port': server.port,
+                           'transport': 'telnet', 'credentials': 'bench',
+                           'commands': ['echo one', ['echo', 'two']]}],
+            })
+
+            results = list(PlaybookRunner(playbook).run())
+
+        self.assertEqual([(result['code'], result['stdout'])
+                          for result in results],
+                         [(0, 'one\n'), (0, 'two\n')])
+
+    def test_resume(self):
+        playbook = Playbook({'hosts': [
+            local_host(['echo', 'a'], ['echo', 'b']),
+            local_host(['echo', 'c']),
+        ]})
+        previous = [
+            json.dumps({'job': 0, 'index': 0, 'code': 0}),
+            json.dumps({'job': 1, 'index': 0, 'error': 'refused'}),
+            '{"job": 0, "index": 1, "co',
+        ]
+
+        results = list(PlaybookRunner(playbook,
+                                      done=read_done(previous)).run())
+
+        self.assertEqual(sorted((result['job'], result['index'])
+                                for result in results),
+                         [(0, 1), (1, 0)])
\ No newline at end of file
@@ -0,0 +1,189 @@
+import unittest
+
+from executors.pool import SSHConnectionPool, TelnetSessionPool
+from executors.ssh import SSHExecutor
+from executors.telnet import TelnetExecutor
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+
+class FakeClient:
+    def __init__(self):
+        self.transport = FakeTransport()
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.transport.active = False
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def is_open(session):
+    return not session.closed
+
+
+class TestSSHConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = SSHConnectionPool(max_size=2)
+
+    def test_reuse(self):
+        client = self.pool.acquire('host', FakeClient)
+        self.pool.release('host')
+
+        self.assertIs(self.pool.acquire('host', FakeClient), client)
+        self.assertEqual(self.pool.hits, 1)
+        self.assertEqual(self.pool.misses, 1)
+
+    def test_reconnect_dead(self):
+        client = self.pool.acquire('host', FakeClient)
+        self.pool.release('host')
+        client.close()
+
+        self.assertIsNot(self.pool.acquire('host', FakeClient), client)
+        self.assertEqual(self.pool.reconnects, 1)
+
+    def test_lru_eviction(self):
+        clients = {}
+        for host in ('first', 'second', 'third'):
+            clients[host] = self.pool.acquire(host, FakeClient)
+            self.pool.release(host)
+
+        self.assertEqual(self.pool.evictions, 1)
+        self.assertFalse(clients['first'].get_transport().is_active())
+        self.assertTrue(clients['third'].get_transport().is_active())
+
+    def test_idle_eviction(self):
+        self.pool.idle_ttl = 0
+        client = self.pool.acquire('host', FakeClient)
+        self.pool.release('host')
+
+        self.assertEqual(self.pool.stats()['size'], 0)
+        self.assertFalse(client.get_transport().is_active())
+
+    def test_borrowed_not_evicted(self):
+        self.pool.idle_ttl = 0
+        client = self.pool.acquire('host', FakeClient)
+        self.pool.evict_idle()
+
+        self.assertTrue(client.get_transport().is_active())
+
+
+class TestSSHExecutorPooled(unittest.TestCase):
+    def setUp(self):
+        self.pool = SSHConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_connection_shared(self):
+        for _ in range(3):
+            executor = SSHExecutor('127.0.0.1', user='admin',
+                                   password='sIcretandsecYre', pool=self.pool)
+            with executor:
+                return_code, stdout, _ = executor.execute('pwd')
+            self.assertEqual(return_code, 0)
+            self.assertEqual(stdout.strip(), '/home/admin')
+
+        self.assertEqual(self.pool.misses, 1)
+        self.assertEqual(self.pool.hits, 2)
+
+    def test_wrong_password(self):
+        executor = SSHExecutor('127.0.0.1', user='admin',
+                               password='wrongpassword', pool=self.pool)
+        with self.assertRaises(ValueError):
+            executor.connect()
+
+
+class TestTelnetSessionPool(unittest.TestCase):
+    KEY = ('host', 23, 'admin')
+
+    def setUp(self):
+        self.pool = TelnetSessionPool(max_per_host=1, max_commands=2,
+                                      wait_timeout=0)
+
+    def test_reuse(self):
+        session = self.pool.acquire(self.KEY, FakeSession, is_open)
+        self.pool.release(self.KEY, session, 1)
+
+        self.assertIs(self.pool.acquire(self.KEY, FakeSession, is_open),
+                      session)
+        self.assertEqual(self.pool.hits, 1)
+
+    def test_dead_session_replaced(self):
+        session = self.pool.acquire(self.KEY, FakeSession, is_open)
+        self.pool.release(self.KEY, session)
+        session.close()
+
+        self.assertIsNot(self.pool.acquire(self.KEY, FakeSession, is_open),
+                         session)
+        self.assertEqual(self.pool.dead, 1)
+
+    def test_recycled_after_max_commands(self):
+        session = self.pool.acquire(self.KEY, FakeSession, is_open)
+        self.pool.release(self.KEY, session, 2)
+
+        self.assertTrue(session.closed)
+        self.assertEqual(self.pool.recycled, 1)
+
+    def test_max_per_host(self):
+        self.pool.acquire(self.KEY, FakeSession, is_open)
+        with self.assertRaises(ValueError):
+            self.pool.acquire(self.KEY, FakeSession, is_open)
+
+    def test_idle_session_of_other_key_closed(self):
+        session = self.pool.acquire(self.KEY, FakeSession, is_open)
+        self.pool.release(self.KEY, session)
+
+        other = self.pool.acquire(('host', 23, 'root'), FakeSession, is_open)
+
+        self.assertIsNot(other, session)
+        self.assertTrue(session.closed)
+        self.assertEqual(self.pool.stats()['opened'], 1)
+        self.assertEqual(self.pool.evictions, 1)
+
+    def test_idle_eviction(self):
+        self.pool.idle_ttl = 0
+        session = self.pool.acquire(self.KEY, FakeSession, is_open)
+        self.pool.release(self.KEY, session)
+        self.pool.evict_idle()
+
+        self.assertTrue(session.closed)
+        self.assertEqual(self.pool.stats()['opened'], 0)
+
+
+class TestTelnetExecutorPooled(unittest.TestCase):
+    def setUp(self):
+        self.pool = TelnetSessionPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_session_reused(self):
+        for _ in range(3):
+            with TelnetExecutor('127.0.0.1', 'admin', 'sIcretandsecYre',
+                                pool=self.pool) as executor:
+                return_code, stdout, _ = executor.execute('pwd')
+            self.assertEqual(return_code, 0)
+            self.assertEqual(stdout.strip(), '/home/admin')
+
+        self.assertEqual(self.pool.misses, 1)
+        self.assertEqual(self.pool.hits, 2)
+
+    def test_wrong_password(self):
+        with self.assertRaises(ValueError):
+            TelnetExecutor('127.0.0.1', 'admin', 'IncorrectPassword',
+                           pool=self.pool)
@@ -0,0 +1,32 @@
+import unittest
+
+from benchmarks.startup import SCENARIOS, check, measure
+from executors.local import LocalExecutor
+from executors.registry import ExecutorRegistry
+
+
+class TestExecutorRegistry(unittest.TestCase):
+    def test_builtin(self):
+        self.assertIs(ExecutorRegistry().get('local'), LocalExecutor)
+
+    def test_register_path(self):
+        registry = ExecutorRegistry({})
+        registry.register('mine', 'executors.local:LocalExecutor')
+
+        self.assertIs(registry.get('mine'), LocalExecutor)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            ExecutorRegistry().get('unknown')
+
+    def test_names(self):
+        self.assertIn('telnet', ExecutorRegistry().names())
+
+
+class TestStartup(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        for arguments, forbidden in SCENARIOS.items():
+            result = measure(arguments, repeat=1)
+
+            self.assertIn('click', result['imports'])
+            self.assertEqual(check(arguments, result, forbidden), [])
@@ -0,0 +1,119 @@
+import os
+import time
+import unittest
+
+from executors.base import CommandResult
+from executors.local import LocalExecutor
+from executors.shard import decode_result, encode_error, encode_result
+from executors.shard import sharded_fan_out
+
+
+def echo(target):
+    return LocalExecutor().execute('echo', (str(target),))
+
+
+def fail_odd(target):
+    if target % 2:
+        raise ValueError(target)
+    return {'target': target}
+
+
+def sleep_first(target):
+    # First two targets of both workers are slow
+    time.sleep(1 if target in (0, 1, 4, 5) else 0.05)
+    return os.getpid()
+
+
+def exit_on_three(target):
+    if target == 3:
+        os._exit(1)
+    time.sleep(0.2)
+    return target
+
+
+class UnpicklableError(Exception):
+    def __init__(self, message, *, host):
+        super().__init__(message)
+        self.host = host
+
+
+class TestFrames(unittest.TestCase):
+    def test_command_result(self):
+        frame = encode_result(7, CommandResult(1, b'out\xd1\x96', b'err',
+                                               'utf-8'))
+
+        index, result, error = decode_result(frame)
+
+        self.assertEqual((index, error), (7, None))
+        self.assertEqual(tuple(result), (1, 'outі', 'err'))
+        self.assertIsInstance(result.stdout_bytes, memoryview)
+
+    def test_text_result(self):
+        _, result, _ = decode_result(encode_result(0, (0, 'out', '')))
+
+        self.assertEqual(result, (0, 'out', ''))
+
+    def test_other_result(self):
+        _, result, _ = decode_result(encode_result(0, {'uptime': 10}))
+
+        self.assertEqual(result, {'uptime': 10})
+
+    def test_error(self):
+        _, result, error = decode_result(encode_error(3, ValueError('bad')))
+
+        self.assertIsNone(result)
+        self.assertIsInstance(error, ValueError)
+        self.assertEqual(str(error), 'bad')
+
+    def test_unpicklable_error(self):
+        frame = encode_error(0, UnpicklableError('refused', host='first'))
+
+        _, _, error = decode_result(frame)
+
+        self.assertIsInstance(error, RuntimeError)
+        self.assertEqual(str(error), 'UnpicklableError: refused')
+
+
+class TestShardedFanOut(unittest.TestCase):
+    def test_all_results(self):
+        results = list(sharded_fan_out(range(50), echo, 3, 4))
+
+        self.assertEqual(sorted(target for target, _, _ in results),
+                         list(range(50)))
+        for target, result, error in results:
+            self.assertIsNone(error)
+            self.assertEqual(tuple(result), (0, f'{target}\n', ''))
+
+    def test_errors(self):
+        results = {target: (result, error) for target, result, error
+                   in sharded_fan_out(range(4), fail_odd, 2, 2)}
+
+        self.assertEqual(results[0], ({'target': 0}, None))
+        self.assertIsInstance(results[1][1], ValueError)
+
+    def test_timeout(self):
+        results = {target: error for target, _, error
+                   in sharded_fan_out([0.05, 5], time.sleep, 2, 1, 0.5)}
+
+        self.assertIsNone(results[0.05])
+        self.assertIsInstance(results[5], TimeoutError)
+
+    def test_straggler(self):
+        started = time.monotonic()
+        results = list(sharded_fan_out(range(8), sleep_first, 2, 2))
+
+        self.assertEqual(len(results), 8)
+        # Slow targets queued in one worker are taken by the other one,
+        # otherwise it would take 2 seconds
+        self.assertLess(time.monotonic() - started, 1.8)
+
+    def test_worker_died(self):
+        results = {target: (result, error) for target, result, error
+                   in sharded_fan_out(range(6), exit_on_three, 2, 2)}
+
+        self.assertEqual(sorted(results), list(range(6)))
+        self.assertIsInstance(results[3][1], ChildProcessError)
+        self.assertEqual(results[0], (0, None))
+
+    def test_empty(self):
+        self.assertEqual(list(sharded_fan_out([], echo, 2, 2)), [])
\ No newline at end of file
@@ -1,6 +1,7 @@
 import unittest
 
-from executors.ssh import SSHExecutor
+from executors.capture import CapturePolicy
+from executors.ssh import SSHExecutor, StdinSender
 
 
 class TestSSHExecutorConnection(unittest.TestCase):
@@ -88,3 +89,101 @@ class TestSSHExecutor(unittest.TestCase):
     def test_command_without_connection(self):
         with self.assertRaises(ValueError):
             self.executor.execute('ls')
+
+    def test_large_output(self):
+        with self.executor:
+            return_code, stdout, stderr = self.executor.execute(
+                'head -c 10000000 /dev/zero; head -c 3000000 /dev/zero >&2'
+            )
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(len(stdout), 10000000)
+        self.assertEqual(len(stderr), 3000000)
+
+    def test_execute_stream(self):
+        with self.executor:
+            stream = self.executor.execute_stream('echo out; echo err >&2')
+            chunks = {'stdout': b'', 'stderr': b''}
+            for name, chunk in stream:
+                chunks[name] += chunk
+
+        self.assertEqual(stream.code, 0)
+        self.assertEqual(chunks['stdout'], b'out\n')
+        self.assertEqual(chunks['stderr'], b'err\n')
+
+    def test_execute_many(self):
+        commands = ['pwd', ('ls', ('-a', '/etc/testing')), 'unknowncommand']
+        with self.executor:
+            results = self.executor.execute_many(commands)
+
+        self.assertEqual(results[0], (0, '/home/admin\n', ''))
+        self.assertIn('requirements.txt', results[1][1])
+        self.assertEqual(results[2][0], 127)
+
+    def test_submit(self):
+        with self.executor:
+            future = self.executor.submit('pwd')
+            return_code, stdout, stderr = future.result()
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(stdout.strip(), '/home/admin')
+
+    def test_capture_max_bytes(self):
+        executor = SSHExecutor('127.0.0.1', user='admin',
+                               password='sIcretandsecYre',
+                               capture=CapturePolicy.memory(max_bytes=1000))
+        with executor:
+            result = executor.execute('yes')
+
+        self.assertEqual(result.code, -1)
+        self.assertTrue(result.limit_exceeded)
+        self.assertEqual(result.stdout, 'y\n' * 500)
+
+    def test_stdin(self):
+        data = bytes(range(256)) * 4096
+        with self.executor:
+            result = self.executor.execute('cat', stdin=iter([data, data]))
+            return_code, stdout, _ = self.executor.execute(
+                'head', ('-c', '3'), stdin=b'abcdef' * 1000000)
+
+        self.assertEqual(result.stdout_bytes, data * 2)
+        self.assertEqual((return_code, stdout), (0, 'abc'))
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+        self.eof_sent = False
+        self.closed = False
+
+    def sendall(self, data):
+        self.sent.append(bytes(data))
+
+    def shutdown_write(self):
+        self.eof_sent = True
+
+    def close(self):
+        self.closed = True
+
+
+class TestStdinSender(unittest.TestCase):
+    def test_sent(self):
+        channel = FakeChannel()
+        sender = StdinSender(channel, iter([b'ab', b'c']))
+        sender.thread.join()
+
+        self.assertEqual(channel.sent, [b'ab', b'c'])
+        self.assertTrue(channel.eof_sent)
+        self.assertIsNone(sender.error)
+
+    def test_read_error(self):
+        def chunks():
+            yield b'ab'
+            raise OSError('Input/output error')
+
+        channel = FakeChannel()
+        sender = StdinSender(channel, chunks())
+        sender.thread.join()
+
+        self.assertIsInstance(sender.error, OSError)
+        self.assertTrue(channel.closed)
\ No newline at end of file
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+
+from executors.ssh import SSHExecutor
+from executors.staging import ScriptStager, StagingIndex
+
+SCRIPT = '#!/bin/sh\n# ' + 'x' * 100000 + '\necho "staged $1"\n'
+
+
+class TestStagingIndex(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'mcduck', 'staged.json')
+
+    def test_persisted(self):
+        index = StagingIndex(self.path)
+        index.add('admin@host:22', 'a' * 64)
+        index.add('admin@host:22', 'b' * 64)
+        index.discard('admin@host:22', ['b' * 64])
+
+        index = StagingIndex(self.path)
+        self.assertTrue(index.has('admin@host:22', 'a' * 64))
+        self.assertFalse(index.has('admin@host:22', 'b' * 64))
+        self.assertFalse(index.has('admin@other:22', 'a' * 64))
+
+    def test_discard_host(self):
+        index = StagingIndex()
+        index.add('admin@host:22', 'a' * 64)
+        index.discard('admin@host:22')
+
+        self.assertFalse(index.has('admin@host:22', 'a' * 64))
+
+    def test_broken_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as index_file:
+            index_file.write('{"admin@host:22": ["a')
+
+        self.assertFalse(StagingIndex(self.path).has('admin@host:22', 'a'))
+
+
+class TestScriptStager(unittest.TestCase):
+    def setUp(self):
+        self.executor = SSHExecutor('127.0.0.1', user='admin',
+                                    password='sIcretandsecYre')
+        directory = f'.cache/mcduck-test-{os.getpid()}'
+        self.stager = ScriptStager(self.executor, StagingIndex(),
+                                   directory=directory, max_scripts=2)
+        self.executor.connect()
+        self.addCleanup(self.executor.disconnect)
+        self.addCleanup(self.executor.execute, 'rm', ('-rf', directory))
+
+    def test_staged_once(self):
+        first = self.stager.execute(SCRIPT, ('first',))
+        second = self.stager.execute(SCRIPT, ('second',))
+
+        self.assertEqual(tuple(first), (0, 'staged first\n', ''))
+        self.assertEqual(tuple(second), (0, 'staged second\n', ''))
+        self.assertEqual(self.stager.stats(), {
+            'hits': 1, 'uploads': 1, 'restaged': 0, 'collected': 0,
+        })
+
+    def test_binary_output(self):
+        result = self.stager.execute('printf "\\377\\376"')
+
+        self.assertEqual((result.code, result.stdout_bytes),
+                         (0, b'\xff\xfe'))
+
+    def test_removed_from_host(self):
+        for script in (SCRIPT, 'wc -c'):
+            path = self.stager.stage(script)
+            self.executor.execute('rm', (path,))
+
+        result = self.stager.execute(SCRIPT)
+        # Streamed stdin is sent once, so the script is checked before
+        streamed = self.stager.execute('wc -c', stdin=iter([b'abc']))
+
+        self.assertEqual(tuple(result), (0, 'staged \n', ''))
+        self.assertEqual(streamed.stdout.strip(), '3')
+        self.assertEqual(self.stager.stats()['restaged'], 2)
+
+    def test_least_recently_used_collected(self):
+        for script in ('echo 1', 'echo 2', 'echo 1', 'echo 3'):
+            self.stager.execute(script)
+            # SFTP tells modification time in seconds
+            time.sleep(1.1)
+
+        _, stdout, _ = self.executor.execute('ls', (self.stager.directory,))
+
+        self.assertEqual(sorted(stdout.split()), sorted(
+            hashlib.sha256(script).hexdigest()
+            for script in (b'echo 1', b'echo 3')
+        ))
+        self.assertEqual(self.stager.stats()['collected'], 1)
\ No newline at end of file
@@ -1,6 +1,14 @@
+import socket
+import threading
+import time
 import unittest
 
-from executors.telnet import TelnetExecutor
+from unittest import mock
+
+from executors.capture import CapturePolicy
+from executors.deadline import Deadline, DeadlineExceeded
+from executors.telnet import TelnetExecutor, execute_all
+from executors.telnet_engine import TelnetConnection
 
 class TestTelnetExecutorConnection(unittest.TestCase):
     def test_ok(self):
@@ -37,20 +45,35 @@ class TestTelnetExecutorConnection(unittest.TestCase):
         with self.assertRaises(ValueError):
             TelnetExecutor('127.0.0.1', '', 'IncorrectPassword')
     
-    # TODO: Add timeout proxying to TelnetExecutor
-    # def test_connection_to_non_listening_server(self):
-    #     executor = None
-    #     try:
-    #         executor = TelnetExecutor(
-    #             'example.com',
-    #             'admin',
-    #             'sIcretandsecYre'
-    #         )
-    #     except ValueError as err:
-    #         self.fail(f"Conection failed:\n{err}")
-
-    #     self.assertIsInstance(executor, TelnetExecutor)
-    #     self.assertTrue(executor.tn.get_socket())
+    def test_connection_to_non_listening_server(self):
+        # Accepts connections, but never answers, like black-holed host
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        self.addCleanup(server.close)
+
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            TelnetExecutor('127.0.0.1', 'admin', 'sIcretandsecYre',
+                           port=server.getsockname()[1], timeout=10,
+                           deadline=Deadline(0.3))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_connection_closed_on_failed_login(self):
+        # Drops connections right away
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        self.addCleanup(server.close)
+        threading.Thread(target=lambda: server.accept()[0].close(),
+                         daemon=True).start()
+
+        with mock.patch.object(TelnetConnection, 'close', autospec=True,
+                               side_effect=TelnetConnection.close) as close:
+            with self.assertRaises((EOFError, OSError)):
+                TelnetExecutor('127.0.0.1', 'admin', 'sIcretandsecYre',
+                               port=server.getsockname()[1], timeout=5)
+        close.assert_called_once()
 
 
 class TestTelnetExecutorExecute(unittest.TestCase):
@@ -88,3 +111,94 @@ class TestTelnetExecutorExecute(unittest.TestCase):
         self.assertIn('..', stdout)
         self.assertIn('requirements.txt', stdout)
         self.assertEqual(stderr.strip(), '')
+
+    def test_exact_output(self):
+        return_code, stdout, stderr = self.executor.execute(
+            'printf "a\\n\\nb"; printf "c\\n" >&2'
+        )
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(stdout, 'a\n\nb')
+        self.assertEqual(stderr, 'c\n')
+
+    def test_shell_vars_framing(self):
+        executor = TelnetExecutor('127.0.0.1', 'admin', 'sIcretandsecYre',
+                                  framing=TelnetExecutor.FRAMING_SHELL_VARS)
+        return_code, stdout, stderr = executor.execute('pwd')
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(stdout.strip(), '/home/admin')
+        self.assertEqual(stderr.strip(), '')
+
+    def test_execute_many(self):
+        commands = [f'echo {i}' for i in range(50)]
+        commands.append(('ls', ('-a', '/etc/testing')))
+        commands.append('unknowncommand')
+
+        results = self.executor.execute_many(commands)
+
+        self.assertEqual(len(results), 52)
+        for i, (return_code, stdout, stderr) in enumerate(results[:50]):
+            self.assertEqual(return_code, 0)
+            self.assertEqual(stdout, f'{i}\n')
+        self.assertIn('requirements.txt', results[50][1])
+        self.assertEqual(results[51][0], 127)
+
+    def test_execute_all(self):
+        executors = [self.executor] + [
+            TelnetExecutor('127.0.0.1', 'admin', 'sIcretandsecYre')
+            for _ in range(4)
+        ]
+
+        results = execute_all(executors, 'ls', ('-a', '/etc/testing'))
+
+        self.assertEqual(len(results), 5)
+        for return_code, stdout, stderr in results:
+            self.assertEqual(return_code, 0)
+            self.assertIn('requirements.txt', stdout)
+
+    def test_capture_head_tail(self):
+        executor = TelnetExecutor(
+            '127.0.0.1', 'admin', 'sIcretandsecYre',
+            capture=CapturePolicy.head_tail(head=4, tail=7, max_bytes=1000),
+        )
+        result = executor.execute('seq 1 100000')
+
+        # Only first 1000 bytes are transferred, the command is not killed
+        self.assertEqual(result.code, 0)
+        self.assertTrue(result.limit_exceeded)
+        self.assertEqual(result.stdout, '1\n2\n76\n277\n')
+        self.assertEqual(result.stdout_dropped, 588895 - 11)
+
+    def test_compressed_transfer(self):
+        executor = TelnetExecutor('127.0.0.1', 'admin', 'sIcretandsecYre',
+                                  encoding='latin-1',
+                                  transfer=TelnetExecutor.TRANSFER_COMPRESSED)
+        return_code, stdout, stderr = executor.execute(
+            "printf '\\377\\000\\r\\n'; seq 1 1000 >&2"
+        )
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(stdout, '\xff\x00\r\n')
+        self.assertEqual(stderr, ''.join(f'{i}\n' for i in range(1, 1001)))
+
+    def test_compressed_capture(self):
+        executor = TelnetExecutor('127.0.0.1', 'admin', 'sIcretandsecYre',
+                                  capture=CapturePolicy.memory(max_bytes=10),
+                                  transfer=TelnetExecutor.TRANSFER_COMPRESSED)
+        result = executor.execute('seq 1 100000')
+
+        self.assertTrue(result.limit_exceeded)
+        self.assertEqual(result.stdout, '1\n2\n3\n4\n5\n')
+        self.assertEqual(result.stdout_dropped, 588895 - 10)
+
+    def test_stdin(self):
+        return_code, stdout, stderr = self.executor.execute(
+            'wc', ('-l',), stdin=b'line\n' * 100000)
+        self.assertEqual((return_code, stdout.strip()), (0, '100000'))
+
+        # Upload, not read by the command, does not reach the shell
+        return_code, stdout, _ = self.executor.execute(
+            'head', ('-c', '3'), stdin=b'abcdef' * 100000)
+        self.assertEqual((return_code, stdout), (0, 'abc'))
+        self.assertEqual(self.executor.execute('echo ok').stdout, 'ok\n')
\ No newline at end of file
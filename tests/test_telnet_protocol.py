@@ -0,0 +1,267 @@
+import base64
+import gzip
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from executors.capture import CapturePolicy
+from executors.telnet_protocol import (
+    DO,
+    DONT,
+    IAC,
+    WILL,
+    WONT,
+    STDIN_LINE_SIZE,
+    FrameCapture,
+    ReceiveBuffer,
+    StdinEncoder,
+    TelnetCodec,
+    check_frame_end,
+    decompress_payload,
+    encode_stdin,
+    frame_command,
+    frame_header,
+    new_marker,
+    parse_header,
+    split_frame,
+    split_outputs,
+)
+
+
+class TestTelnetCodec(unittest.TestCase):
+    def setUp(self):
+        self.codec = TelnetCodec()
+
+    def test_plain_data(self):
+        self.assertEqual(self.codec.feed(b'login: '), (b'login: ', b''))
+
+    def test_options_refused(self):
+        data, reply = self.codec.feed(bytes((IAC, DO, 24, IAC, WILL, 1))
+                                      + b'login: ')
+
+        self.assertEqual(data, b'login: ')
+        self.assertEqual(reply, bytes((IAC, WONT, 24, IAC, DONT, 1)))
+
+    def test_command_split_between_chunks(self):
+        self.assertEqual(self.codec.feed(b'ab' + bytes((IAC,))), (b'ab', b''))
+        self.assertEqual(self.codec.feed(bytes((DO,))), (b'', b''))
+        self.assertEqual(self.codec.feed(bytes((3,)) + b'cd'),
+                         (b'cd', bytes((IAC, WONT, 3))))
+
+    def test_escaped_iac(self):
+        self.assertEqual(self.codec.feed(bytes((IAC, IAC))),
+                         (bytes((IAC,)), b''))
+
+    def test_carriage_return_nul(self):
+        self.assertEqual(self.codec.feed(b'a\r'), (b'a\r', b''))
+        self.assertEqual(self.codec.feed(b'\0b\r\0\n'), (b'b\r\n', b''))
+
+    def test_encode(self):
+        self.assertEqual(TelnetCodec.encode(bytes((1, IAC))),
+                         bytes((1, IAC, IAC)))
+
+
+class TestSplitFrame(unittest.TestCase):
+    def test_ok(self):
+        self.assertEqual(split_frame((b'2', b'3', b'1'), b'out\n', 'ascii'),
+                         (2, 'out', '\n'))
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            split_frame((b'0', b'3', b'0'), b'ou', 'ascii')
+
+
+    def test_compressed(self):
+        payload = base64.encodebytes(gzip.compress(b'\xff\x00out\n'))
+
+        self.assertEqual(
+            split_frame((b'0', b'6', b'0', b'gzip'), payload, 'latin-1'),
+            (0, '\xff\x00out\n', ''),
+        )
+
+    def test_compressed_malformed(self):
+        payload = base64.encodebytes(gzip.compress(b'out\n'))
+        for broken in (payload[:-10], b'not gzip'):
+            with self.assertRaises(ValueError):
+                split_frame((b'0', b'4', b'0', b'gzip'), broken, 'ascii')
+
+
+class TestSplitOutputs(unittest.TestCase):
+    def test_chunks(self):
+        pieces = list(split_outputs([b'ab', b'cde', b'', b'f'], [4, 2]))
+
+        self.assertEqual(pieces, [(0, b'ab'), (0, b'cd'), (1, b'e'),
+                                  (1, b'f')])
+
+    def test_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            list(split_outputs([b'abc'], [1, 1]))
+
+    def test_decompressed_chunks(self):
+        data = os.urandom(1000) * 100
+        payload = base64.encodebytes(gzip.compress(data))
+
+        chunks = list(decompress_payload(payload, chunk_size=4096))
+
+        self.assertEqual(b''.join(chunks), data)
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in chunks))
+
+
+class TestFrameCapture(unittest.TestCase):
+    def test_cut_outputs(self):
+        frame = FrameCapture(CapturePolicy.memory(max_bytes=3),
+                             (b'1', b'5', b'2', None))
+        self.assertEqual(frame.size, 5)
+        for chunk in (b'ab', b'cde'):
+            frame.write(chunk)
+
+        result = frame.result('ascii')
+        self.assertEqual(result.code, 1)
+        self.assertEqual(bytes(result.stdout_bytes), b'abc')
+        self.assertTrue(result.stdout_dropped)
+        self.assertEqual(bytes(result.stderr_bytes), b'de')
+
+    def test_compressed(self):
+        frame = FrameCapture(CapturePolicy.memory(),
+                             (b'0', b'3', b'3', b'gzip'))
+        frame.write_compressed(base64.encodebytes(gzip.compress(b'outerr')))
+
+        self.assertEqual(tuple(frame.result('ascii')), (0, 'out', 'err'))
+
+    def test_malformed(self):
+        frame = FrameCapture(CapturePolicy.memory(), (b'0', b'3', b'0', None))
+        frame.write(b'ab')
+        with self.assertRaises(ValueError):
+            frame.result('ascii')
+        with self.assertRaises(ValueError):
+            check_frame_end(b'c__marker__', b'__marker__')
+
+
+class TestFrameCommand(unittest.TestCase):
+    """Runs framed commands in the local shell"""
+
+    def run_frame(self, command, path=None, stdin=None, **options):
+        marker = new_marker()
+        env = None if path is None else {'PATH': path}
+        if stdin is not None:
+            # Uploaded lines follow the command, as they would in the session
+            options['stdin'] = True
+            stdin = b''.join(encode_stdin(stdin, marker))
+        output = subprocess.run([shutil.which('sh'), '-c',
+                                 frame_command(command, marker, **options)],
+                                input=stdin, stdout=subprocess.PIPE, env=env,
+                                check=True).stdout
+        marker = marker.encode()
+        header = frame_header(marker).match(output)
+        self.assertIsNotNone(header)
+        self.assertTrue(output.endswith(marker + b'\n'))
+        return header.groups(), output[header.end():-len(marker) - 1]
+
+    def test_plain(self):
+        header, payload = self.run_frame("printf 'out'; printf 'e' >&2")
+
+        self.assertEqual(parse_header(header), (0, 3, 1, False))
+        self.assertEqual(split_frame(header, payload, 'ascii'),
+                         (0, 'out', 'e'))
+
+    def test_compressed(self):
+        header, payload = self.run_frame(
+            "printf '\\377\\000'; seq 1 1000; exit 3", compress=True)
+
+        self.assertTrue(parse_header(header)[3])
+        self.assertEqual(split_frame(header, payload, 'latin-1'), (
+            3, '\xff\x00' + ''.join(f'{i}\n' for i in range(1, 1001)), '',
+        ))
+
+    def test_compressed_limit(self):
+        header, payload = self.run_frame('seq 1 1000', limit=4, compress=True)
+
+        self.assertEqual(parse_header(header), (0, 3893, 0, True))
+        self.assertEqual(b''.join(decompress_payload(payload)), b'1\n2\n')
+
+    def test_compression_fallback(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Everything the frame needs, except gzip
+            for tool in ('mktemp', 'wc', 'cat', 'rm', 'seq'):
+                os.symlink(shutil.which(tool), os.path.join(directory, tool))
+
+            header, payload = self.run_frame('seq 1 3', path=directory,
+                                             compress=True)
+
+        self.assertEqual(parse_header(header), (0, 6, 0, False))
+        self.assertEqual(split_frame(header, payload, 'ascii'),
+                         (0, '1\n2\n3\n', ''))
+
+    def test_stdin(self):
+        data = bytes(range(256)) * 100
+        header, payload = self.run_frame('cat; echo done >&2',
+                                         stdin=[data[:1000], data[1000:]])
+
+        self.assertEqual(split_frame(header, payload, 'latin-1'),
+                         (0, data.decode('latin-1'), 'done\n'))
+
+    def test_stdin_not_read(self):
+        header, payload = self.run_frame('head -c 3; exit 2',
+                                         stdin=[b'abcdef' * 10000])
+
+        # The rest of the upload is drained, not run by the shell
+        self.assertEqual(split_frame(header, payload, 'ascii'),
+                         (2, 'abc', ''))
+
+    def test_empty_stdin(self):
+        header, payload = self.run_frame('wc -c', stdin=[])
+
+        self.assertEqual(split_frame(header, payload, 'ascii')[1].strip(),
+                         '0')
+
+
+class TestStdinEncoder(unittest.TestCase):
+    def test_lines(self):
+        encoder = StdinEncoder()
+        data = os.urandom(STDIN_LINE_SIZE * 2 + 10)
+
+        lines = encoder.encode(data[:STDIN_LINE_SIZE - 1])
+        lines += encoder.encode(data[STDIN_LINE_SIZE - 1:])
+        lines += encoder.finish('marker')
+
+        lines = lines.splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[-1], b'marker')
+        self.assertEqual(b''.join(base64.b64decode(line)
+                                  for line in lines[:-1]), data)
+
+
+class TestReceiveBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = ReceiveBuffer()
+
+    def test_regex(self):
+        self.buffer.feed(b'output\nadmin@host:~$ rest')
+
+        index, matched, text = self.buffer.search([re.compile(rb'admin.*?\$')])
+
+        self.assertEqual(index, 0)
+        self.assertEqual(text, b'output\nadmin@host:~$')
+        self.assertEqual(matched.start(), 7)
+        self.assertEqual(self.buffer.consume(), b' rest')
+
+    def test_literal_split_between_chunks(self):
+        self.buffer.feed(b'payload __mar')
+        self.assertEqual(self.buffer.search([b'__marker__']), (-1, None, None))
+
+        scanned = len(self.buffer)
+        self.buffer.feed(b'ker__\n')
+
+        self.assertEqual(self.buffer.search([b'__marker__'], scanned),
+                         (0, None, b'payload __marker__'))
+
+    def test_first_pattern_wins(self):
+        self.buffer.feed(b'Login incorrect\nadmin$')
+
+        index, _, _ = self.buffer.search([re.compile(rb'admin\$'),
+                                          b'Login incorrect'])
+
+        self.assertEqual(index, 0)